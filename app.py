@@ -1,8 +1,12 @@
 from collections import defaultdict
+from concurrent.futures import TimeoutError, as_completed
+from contextlib import nullcontext
 from html import unescape
+from io import BytesIO
+from json import dumps as json_dumps, loads as json_loads
 from logging import getLogger, Formatter, WARNING, INFO
-from logging.handlers import RotatingFileHandler
 from os.path import dirname, abspath
+from time import monotonic
 from urllib.parse import parse_qs, urlparse, unquote
 from wsgiref.headers import Headers
 
@@ -10,15 +14,33 @@ from requests import ConnectionError as RequestsConnectionError
 
 from config import LANG
 from lib.ketabir import ketabir_scr
-from lib.commons import uninum2en, scr_to_json, ISBN_10OR13_SEARCH
-from lib.doi import doi_scr, DOI_SEARCH
+from lib.admission import Overloaded, admit, header_queue_time
+from lib.commons import (
+    uninum2en, scr_to_dict, scr_to_json, ISBN_10OR13_SEARCH)
+from lib.deadline import deadline, remaining, DeadlineExceeded
+from lib.doi import (
+    doi_scr, doi_scr_async, prefetch_crossref_dicts, DOI_SEARCH)
+from lib.executor import submit, run_async
 from lib.googlebooks import googlebooks_scr
-from lib.isbn_oclc import IsbnError, isbn_scr, oclc_scr
-from lib.jstor import jstor_scr
+from lib.isbn_oclc import IsbnError, isbn_scr, isbn_scr_async, oclc_scr
+from lib.jstor import jstor_scr, jstor_scr_async
+from lib.logqueue import queue_handler
+from lib.metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, add_cache, add_flights,
+    observe_resolve, render as render_metrics)
 from lib.noorlib import noorlib_scr
-from lib.noormags import noormags_scr
-from lib.pubmed import pmcid_scr, pmid_scr
-from lib.urls import urls_scr
+from lib.noormags import noormags_scr, noormags_scr_async
+from lib.profiling import authorized, profile
+from lib.pubmed import pmcid_scr, pmcid_scr_async, pmid_scr, pmid_scr_async
+from lib.resultcache import (
+    RESULT_CACHE, cache_key, get_result, normalize_input, set_result,
+    strip_tracking_params)
+from lib.settings import (
+    BATCH_DEADLINE, BATCH_MAX_INPUTS, FASTCGI, LOG_DIR, MAX_BATCH_BODY,
+    REQUEST_DEADLINE, SERVER_HOST, SERVER_PORT, WORKERS)
+from lib.singleflight import AsyncSingleFlight, SingleFlight
+from lib.spans import collect as collect_spans, span
+from lib.urls import urls_scr, urls_scr_async
 from lib.waybackmachine import waybackmachine_scr
 if LANG == 'en':
     from lib.html.en import (
@@ -26,6 +48,7 @@ if LANG == 'en':
         UNDEFINED_INPUT_SCR,
         HTTPERROR_SCR,
         OTHER_EXCEPTION_SCR,
+        OVERLOADED_SCR,
         scr_to_html,
         CSS,
         CSS_HEADERS,
@@ -37,6 +60,7 @@ else:
         UNDEFINED_INPUT_SCR,
         HTTPERROR_SCR,
         OTHER_EXCEPTION_SCR,
+        OVERLOADED_SCR,
         scr_to_html,
         CSS,
         CSS_HEADERS)
@@ -52,6 +76,13 @@ def google_encrypted_scr(url, parsed_url, date_format):
     return urls_scr(url, date_format)
 
 
+async def google_encrypted_scr_async(url, parsed_url, date_format):
+    if parsed_url[2][:7] in {'/books', '/books/'}:
+        return await run_async(
+            'googlebooks', googlebooks_scr, parsed_url, date_format)
+    return await urls_scr_async(url, date_format)
+
+
 TLDLESS_NETLOC_RESOLVER = {
     'ketab': ketabir_scr,
 
@@ -71,7 +102,22 @@ TLDLESS_NETLOC_RESOLVER = {
     'jstor': jstor_scr,
 }.get
 
+# Concurrent requests for the same citation wait for one resolver call
+RESOLVER_FLIGHTS = SingleFlight()
+ASYNC_RESOLVER_FLIGHTS = AsyncSingleFlight()
+add_flights('resolver', RESOLVER_FLIGHTS)
+add_flights('async_resolver', ASYNC_RESOLVER_FLIGHTS)
+add_cache('result', RESULT_CACHE)
+
 RESPONSE_HEADERS = Headers([('Content-Type', 'text/html; charset=UTF-8')])
+JSON_CONTENT_TYPE = ('Content-Type', 'application/json; charset=UTF-8')
+NDJSON_CONTENT_TYPE = ('Content-Type', 'application/x-ndjson; charset=UTF-8')
+
+# Input kind -> function that starts bulk upstream queries for the
+# normalized inputs of that kind in a batch
+BATCH_PREFETCHERS = {
+    'doi': prefetch_crossref_dicts,
+}
 
 
 getLogger('requests').setLevel(WARNING)
@@ -81,17 +127,12 @@ getLogger('langid').setLevel(WARNING)
 def get_root_logger():
     custom_logger = getLogger()
     custom_logger.setLevel(INFO)
-    srcdir = dirname(abspath(__file__))
-    handler = RotatingFileHandler(
-        filename=f'{srcdir}/citer.log',
-        mode='a',
-        maxBytes=20000,
-        backupCount=0,
-        encoding='utf-8',
-        delay=0)
-    handler.setLevel(INFO)
-    handler.setFormatter(
+    log_dir = LOG_DIR or dirname(abspath(__file__))
+    # records are written by a background thread, see lib.logqueue
+    handler = queue_handler(
+        f'{log_dir}/citer.log',
         Formatter('\n%(asctime)s\n%(levelname)s\n%(message)s\n'))
+    handler.setLevel(INFO)
     custom_logger.addHandler(handler)
     return custom_logger
 
@@ -100,6 +141,30 @@ LOGGER = get_root_logger()
 
 
 def url_doi_isbn_scr(user_input, date_format) -> tuple:
+    resolver, args = find_resolver(user_input, date_format)
+    if resolver is None:
+        return UNDEFINED_INPUT_SCR
+    try:
+        return resolver(*args)
+    except IsbnError:
+        return UNDEFINED_INPUT_SCR
+
+
+async def url_doi_isbn_scr_async(user_input, date_format) -> tuple:
+    resolver, args = find_resolver(user_input, date_format)
+    if resolver is None:
+        return UNDEFINED_INPUT_SCR
+    try:
+        return await call_async(resolver, *args)
+    except IsbnError:
+        return UNDEFINED_INPUT_SCR
+
+
+def find_resolver(user_input, date_format) -> tuple:
+    """Return the (resolver, args) that should be called for user_input.
+
+    The resolver is None if the input is not recognized.
+    """
     en_user_input = unquote(uninum2en(user_input))
     # Checking the user input for dot is important because
     # the use of dotless domains is prohibited.
@@ -120,30 +185,261 @@ def url_doi_isbn_scr(user_input, date_format) -> tuple:
             else tldless_netloc)
         if resolver is not None:
             if resolver is googlebooks_scr:
-                return resolver(parsed_url, date_format)
+                return googlebooks_scr, (parsed_url, date_format)
             elif resolver is google_encrypted_scr:
-                return resolver(url, parsed_url, date_format)
-            return resolver(url, date_format)
+                return resolver, (url, parsed_url, date_format)
+            return resolver, (url, date_format)
         # DOIs contain dots
         m = DOI_SEARCH(unescape(en_user_input))
         if m is not None:
-            return doi_scr(m[0], True, date_format)
-        return urls_scr(url, date_format)
+            return doi_scr, (m[0], True, date_format)
+        return urls_scr, (url, date_format)
     else:
         # We can check user inputs containing dots for ISBNs, but probably is
         # error prone.
         m = ISBN_10OR13_SEARCH(en_user_input)
         if m is not None:
-            try:
-                return isbn_scr(m[0], True, date_format)
-            except IsbnError:
-                pass
-        return UNDEFINED_INPUT_SCR
+            return isbn_scr, (m[0], True, date_format)
+        return None, None
 
 
-def app(environ, start_response):
+async def call_async(resolver, *args) -> tuple:
+    """Await the async version of resolver, if there is one.
+
+    Resolvers without an async version run on the lib.executor threads.
+    """
+    async_resolver = ASYNC_RESOLVERS.get(resolver)
+    if async_resolver is None:
+        return await run_async(resolver.__name__, resolver, *args)
+    return await async_resolver(*args)
+
+
+def resolve(
+    input_type, user_input, date_format, queue_time=None
+) -> tuple:
+    """Return the (sfn, cite, ref) tuple of the user input.
+
+    Results are cached and concurrent identical calls are coalesced.
+    If queue_time is given, uncached lookups are subject to admission
+    control (see lib.admission) and may raise Overloaded.
+    """
+    resolver = input_type_to_resolver[input_type]
+    kind, key = cache_key(
+        resolver.__name__, input_type, user_input, date_format)
+    response = get_result(key)
+    if response is None:
+        admission = nullcontext() if queue_time is None \
+            else admit(kind, queue_time)
+        with admission, observe_resolve(kind, resolver.__name__):
+            response = RESOLVER_FLIGHTS.do(
+                key, resolver, strip_tracking_params(user_input),
+                date_format)
+        # results of requests that ran out of time may be partial
+        left = remaining()
+        if response is not UNDEFINED_INPUT_SCR and (left is None or left > 0):
+            set_result(kind, key, response)
+    return response
+
+
+async def resolve_async(
+    input_type, user_input, date_format, queue_time=None
+) -> tuple:
+    """Return the (sfn, cite, ref) tuple of the user input; see resolve."""
+    resolver = input_type_to_resolver[input_type]
+    kind, key = cache_key(
+        resolver.__name__, input_type, user_input, date_format)
+    response = get_result(key)
+    if response is None:
+        admission = nullcontext() if queue_time is None \
+            else admit(kind, queue_time)
+        with admission, observe_resolve(kind, resolver.__name__):
+            response = await ASYNC_RESOLVER_FLIGHTS.do(
+                key, call_async, resolver,
+                strip_tracking_params(user_input), date_format)
+        left = remaining()
+        if response is not UNDEFINED_INPUT_SCR and (left is None or left > 0):
+            set_result(kind, key, response)
+    return response
+
+
+def resolve_profiled(
+    input_type, user_input, date_format, queue_time=None
+) -> tuple:
+    """Return the (sfn, cite, ref) tuple and the id of its profile.
+
+    The resolver is called directly, bypassing the result cache, so that
+    the profile shows the actual work. See lib.profiling. Admission control
+    applies as in resolve.
+    """
+    resolver = input_type_to_resolver[input_type]
+    kind, _ = cache_key(
+        resolver.__name__, input_type, user_input, date_format)
+    admission = nullcontext() if queue_time is None \
+        else admit(kind, queue_time)
+    with admission, profile() as profile_id:
+        response = resolver(strip_tracking_params(user_input), date_format)
+    return response, profile_id
+
+
+def resolve_batch_item(input_type, user_input, date_format) -> dict:
+    """Return the api dict of the user input with its input and status."""
+    # noinspection PyBroadException
+    try:
+        response = resolve(input_type, user_input, date_format)
+    except DeadlineExceeded:
+        status, response = 504, HTTPERROR_SCR
+    except RequestsConnectionError:
+        LOGGER.exception(user_input)
+        status, response = 500, HTTPERROR_SCR
+    except Exception:
+        LOGGER.exception(user_input)
+        status, response = 500, OTHER_EXCEPTION_SCR
+    else:
+        status = 404 if response is UNDEFINED_INPUT_SCR else 200
+    return {'input': user_input, 'status': status, **scr_to_dict(response)}
+
+
+def parse_batch_inputs(body: bytes) -> list:
+    """Return the inputs of a JSON array or of newline-separated lines.
+
+    Raise ValueError if the body is not valid.
+    """
+    text = body.decode()
+    if text.lstrip().startswith('['):
+        inputs = json_loads(text)
+        if not all(isinstance(i, str) for i in inputs):
+            raise ValueError('batch inputs must be strings')
+    else:
+        inputs = text.splitlines()
+    inputs = [i.strip() for i in inputs if i.strip()]
+    if not inputs:
+        raise ValueError('no inputs')
+    if len(inputs) > BATCH_MAX_INPUTS:
+        raise ValueError(f'more than {BATCH_MAX_INPUTS} inputs')
+    return inputs
+
+
+def submit_batch(inputs, input_type, date_format) -> list:
+    """Submit the inputs to lib.executor and return their (index, Task)s.
+
+    Inputs are grouped by their kind (doi, isbn, pmid, url, ...) and each
+    group runs in its own lib.executor group, so that one slow backend does
+    not occupy all the workers. Kinds having a BATCH_PREFETCHERS entry
+    are queried in bulk before the individual inputs are resolved.
+    """
+    groups = defaultdict(list)
+    normalized_inputs = defaultdict(list)
+    for i, user_input in enumerate(inputs):
+        try:
+            kind, normalized_input = normalize_input(input_type, user_input)
+        except ValueError:
+            kind = 'url'
+        else:
+            normalized_inputs[kind].append(normalized_input)
+        groups[kind].append(i)
+    for kind, prefetch in BATCH_PREFETCHERS.items():
+        if kind in normalized_inputs:
+            prefetch(normalized_inputs[kind])
+    return [
+        (i, submit(
+            'batch-' + kind, resolve_batch_item,
+            input_type, inputs[i], date_format))
+        for kind, indices in groups.items() for i in indices]
+
+
+def timed_out_item(user_input) -> dict:
+    return {
+        'input': user_input, 'status': 504, **scr_to_dict(HTTPERROR_SCR)}
+
+
+def batch_results(inputs, tasks) -> list:
+    """Wait for the tasks and return their api dicts in input order."""
+    results = [None] * len(inputs)
+    for i, task in tasks:
+        try:
+            results[i] = task.result(max(remaining(), 0))
+        except TimeoutError:
+            task.cancel()
+            results[i] = timed_out_item(inputs[i])
+    return results
+
+
+def iter_ndjson_results(inputs, tasks, stop_at: float):
+    """Yield an encoded JSON line for each task as soon as it is done.
+
+    The lines are yielded in completion order and have an "index" key that
+    refers to the position of their input. Tasks not done by stop_at (a
+    time.monotonic value) are cancelled and reported as timed out.
+    """
+    pending = {task.future: (i, task) for i, task in tasks}
+    try:
+        for future in as_completed(pending, max(stop_at - monotonic(), 0)):
+            i, _ = pending.pop(future)
+            yield json_dumps({'index': i, **future.result()}).encode() + b'\n'
+    except TimeoutError:
+        for future, (i, task) in [*pending.items()]:
+            del pending[future]
+            task.cancel()
+            yield json_dumps(
+                {'index': i, **timed_out_item(inputs[i])}).encode() + b'\n'
+    finally:  # the client may have disconnected
+        for _, task in pending.values():
+            task.cancel()
+
+
+def batch_app(environ, start_response):
+    """Resolve the inputs POSTed as a JSON array or newline-separated text.
+
+    Respond with a JSON array containing a {'input', 'status',
+    'reference_tag', 'citation_template', 'shortened_footnote'} object for
+    each input, in the same order. With output_format=ndjson the objects are
+    streamed one per line as soon as each input is resolved (see
+    iter_ndjson_results).
+    """
+    headers = [JSON_CONTENT_TYPE]
+    if environ['REQUEST_METHOD'] != 'POST':
+        start_response('405 Method Not Allowed', headers + [('Allow', 'POST')])
+        return [b'{"error": "use POST"}']
+    content_length = environ.get('CONTENT_LENGTH')
+    if not content_length:
+        start_response('411 Length Required', headers)
+        return [b'{"error": "Content-Length is required"}']
+    try:
+        length = int(content_length)
+        if length < 0:
+            raise ValueError
+    except ValueError:
+        start_response('400 Bad Request', headers)
+        return [b'{"error": "invalid Content-Length"}']
+    if length > MAX_BATCH_BODY:
+        start_response('413 Payload Too Large', headers)
+        return [b'{"error": "request body is too large"}']
+    try:
+        inputs = parse_batch_inputs(environ['wsgi.input'].read(length))
+    except ValueError as e:  # includes JSON and unicode decode errors
+        start_response('400 Bad Request', headers)
+        return [json_dumps({'error': str(e)}).encode()]
+
     query_dict_get = parse_qs(environ['QUERY_STRING']).get
+    date_format = query_dict_get('dateformat', [''])[0].strip()
+    input_type = query_dict_get('input_type', [''])[0]
+    output_format = query_dict_get('output_format', [''])[0]
+    with deadline(BATCH_DEADLINE):
+        tasks = submit_batch(inputs, input_type, date_format)
+        if output_format == 'ndjson':
+            # the body is generated after returning, outside of this block
+            start_response('200 OK', [NDJSON_CONTENT_TYPE])
+            return iter_ndjson_results(
+                inputs, tasks, monotonic() + remaining())
+        results = batch_results(inputs, tasks)
+
+    response_body = json_dumps(results).encode()
+    headers.append(('Content-Length', str(len(response_body))))
+    start_response('200 OK', headers)
+    return [response_body]
 
+
+def app(environ, start_response):
     path_info = environ['PATH_INFO']
     if '/static/' in path_info:
         if path_info.endswith('.css'):
@@ -153,6 +449,16 @@ def app(environ, start_response):
             # path_info.endswith('.js') and config.lang == 'en'
             start_response('200 OK', JS_HEADERS)
             return [JS]
+    if path_info.endswith('/batch'):
+        return batch_app(environ, start_response)
+    if path_info.endswith('/metrics'):
+        response_body = render_metrics()
+        start_response('200 OK', [
+            ('Content-Type', METRICS_CONTENT_TYPE),
+            ('Content-Length', str(len(response_body)))])
+        return [response_body]
+
+    query_dict_get = parse_qs(environ['QUERY_STRING']).get
 
     date_format = query_dict_get('dateformat', [''])[0].strip()
 
@@ -164,45 +470,200 @@ def app(environ, start_response):
         response_body = scr_to_html(
             DEFAULT_SCR, date_format, input_type
         ).encode()
-        RESPONSE_HEADERS['Content-Length'] = str(len(response_body))
-        start_response('200 OK', RESPONSE_HEADERS.items())
+        headers = Headers([*RESPONSE_HEADERS.items()])
+        headers['Content-Length'] = str(len(response_body))
+        start_response('200 OK', headers.items())
         return [response_body]
 
     output_format = query_dict_get('output_format', [''])[0]  # apiquery
-
-    resolver = input_type_to_resolver[input_type]
-    # noinspection PyBroadException
-    try:
-        response = resolver(user_input, date_format)
-    except RequestsConnectionError:
-        status = '500 ConnectionError'
-        LOGGER.exception(user_input)
-        if output_format == 'json':
-            response_body = scr_to_json(HTTPERROR_SCR)
-        else:
-            response_body = scr_to_html(
-                HTTPERROR_SCR, date_format, input_type)
-    except Exception:
-        status = '500 Internal Server Error'
-        LOGGER.exception(user_input)
-        if output_format == 'json':
-            response_body = scr_to_json(OTHER_EXCEPTION_SCR)
+    profile_token = query_dict_get('profile', [''])[0]
+
+    headers = Headers([*RESPONSE_HEADERS.items()])
+    with collect_spans() as timings:
+        # noinspection PyBroadException
+        try:
+            with deadline(REQUEST_DEADLINE):
+                if profile_token and authorized(profile_token):
+                    response, profile_id = resolve_profiled(
+                        input_type, user_input, date_format,
+                        header_queue_time(
+                            environ.get('HTTP_X_REQUEST_START')))
+                    if profile_id is not None:
+                        headers['X-Profile-Id'] = profile_id
+                else:
+                    response = resolve(
+                        input_type, user_input, date_format,
+                        header_queue_time(
+                            environ.get('HTTP_X_REQUEST_START')))
+        except Overloaded as e:
+            status, response = '503 Service Unavailable', OVERLOADED_SCR
+            LOGGER.warning('overloaded (%s): %s', e, user_input)
+            headers['Retry-After'] = str(e.retry_after)
+        except DeadlineExceeded:
+            status, response = '504 Gateway Timeout', HTTPERROR_SCR
+            LOGGER.warning('deadline exceeded: %s', user_input)
+        except RequestsConnectionError:
+            status, response = '500 ConnectionError', HTTPERROR_SCR
+            LOGGER.exception(user_input)
+        except Exception:
+            status = '500 Internal Server Error'
+            response = OTHER_EXCEPTION_SCR
+            LOGGER.exception(user_input)
         else:
-            response_body = scr_to_html(
-                OTHER_EXCEPTION_SCR, date_format, input_type)
-    else:
-        status = '200 OK'
-        if output_format == 'json':
-            response_body = scr_to_json(response)
-        else:
-            response_body = scr_to_html(
-                response, date_format, input_type)
-    response_body = response_body.encode()
-    RESPONSE_HEADERS['Content-Length'] = str(len(response_body))
-    start_response(status, RESPONSE_HEADERS.items())
+            status = '200 OK'
+        with span('render'):
+            if output_format == 'json':
+                response_body = scr_to_json(response)
+            else:
+                response_body = scr_to_html(
+                    response, date_format, input_type)
+            response_body = response_body.encode()
+    headers['Server-Timing'] = timings.header()
+    headers['Content-Length'] = str(len(response_body))
+    start_response(status, headers.items())
     return [response_body]
 
 
+async def asgi_app(scope, receive, send):
+    """The ASGI counterpart of app().
+
+    Citations are resolved by the async resolvers on the event loop;
+    batch requests are passed to batch_app on a lib.executor thread.
+    """
+    if scope['type'] == 'lifespan':
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    path = scope['path']
+    if '/static/' in path:
+        if path.endswith('.css'):
+            return await send_asgi_response(send, 200, CSS_HEADERS, CSS)
+        return await send_asgi_response(send, 200, JS_HEADERS, JS)
+    if path.endswith('/batch'):
+        return await asgi_batch_app(scope, receive, send)
+    if path.endswith('/metrics'):
+        return await send_asgi_response(
+            send, 200, [('Content-Type', METRICS_CONTENT_TYPE)],
+            render_metrics())
+
+    query_dict_get = parse_qs(scope['query_string'].decode()).get
+    date_format = query_dict_get('dateformat', [''])[0].strip()
+    input_type = query_dict_get('input_type', [''])[0]
+    user_input = query_dict_get('user_input', [''])[0].strip()
+    if not user_input:
+        response_body = scr_to_html(DEFAULT_SCR, date_format, input_type)
+        return await send_asgi_response(
+            send, 200, RESPONSE_HEADERS.items(), response_body.encode())
+
+    output_format = query_dict_get('output_format', [''])[0]
+    profile_token = query_dict_get('profile', [''])[0]
+    headers = [*RESPONSE_HEADERS.items()]
+    with collect_spans() as timings:
+        # noinspection PyBroadException
+        try:
+            with deadline(REQUEST_DEADLINE):
+                if profile_token and authorized(profile_token):
+                    # profile the sync resolver on its own thread, the
+                    # event loop runs other requests too
+                    response, profile_id = await run_async(
+                        'profile', resolve_profiled, input_type, user_input,
+                        date_format, scope.get('queue_time', 0.))
+                    if profile_id is not None:
+                        headers.append(('X-Profile-Id', profile_id))
+                else:
+                    response = await resolve_async(
+                        input_type, user_input, date_format,
+                        scope.get('queue_time', 0.))
+        except Overloaded as e:
+            status, response = 503, OVERLOADED_SCR
+            LOGGER.warning('overloaded (%s): %s', e, user_input)
+            headers.append(('Retry-After', str(e.retry_after)))
+        except DeadlineExceeded:
+            status, response = 504, HTTPERROR_SCR
+            LOGGER.warning('deadline exceeded: %s', user_input)
+        except RequestsConnectionError:
+            status, response = 500, HTTPERROR_SCR
+            LOGGER.exception(user_input)
+        except Exception:
+            status, response = 500, OTHER_EXCEPTION_SCR
+            LOGGER.exception(user_input)
+        else:
+            status = 200
+        with span('render'):
+            if output_format == 'json':
+                response_body = scr_to_json(response)
+            else:
+                response_body = scr_to_html(response, date_format, input_type)
+    headers.append(('Server-Timing', timings.header()))
+    await send_asgi_response(send, status, headers, response_body.encode())
+
+
+async def asgi_batch_app(scope, receive, send):
+    """Run batch_app on lib.executor threads and send its response.
+
+    NDJSON responses are streamed line by line.
+    """
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size <= MAX_BATCH_BODY:
+            chunks.append(chunk)
+        if not message.get('more_body'):
+            break
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'QUERY_STRING': scope['query_string'].decode(),
+        'CONTENT_LENGTH': str(size),
+        'wsgi.input': BytesIO(b''.join(chunks)),
+    }
+    started = []
+
+    def start_batch_app():
+        return batch_app(environ, lambda *a: started.extend(a))
+
+    body = await run_async('batch', start_batch_app)
+    status, headers = started
+    status = int(status.partition(' ')[0])
+    if isinstance(body, list):
+        return await send_asgi_response(send, status, headers, b''.join(body))
+    # a lazy (ndjson) body; each line is sent as soon as it is generated
+    await send({
+        'type': 'http.response.start', 'status': status,
+        'headers': [(k.lower().encode(), v.encode()) for k, v in headers]})
+    try:
+        while True:
+            # next() blocks until an input is resolved
+            line = await run_async('batch', next, body, None)
+            if line is None:
+                break
+            await send({
+                'type': 'http.response.body', 'body': line,
+                'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        try:
+            body.close()  # cancels the unfinished tasks
+        except ValueError:  # still running on an executor thread
+            pass
+
+
+async def send_asgi_response(send, status: int, headers, body: bytes):
+    headers = [
+        (k.lower().encode(), v.encode()) for k, v in headers
+        if k.lower() != 'content-length']
+    headers.append((b'content-length', str(len(body)).encode()))
+    await send({
+        'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
 input_type_to_resolver = defaultdict(
     lambda: url_doi_isbn_scr, {
         'url-doi-isbn': url_doi_isbn_scr,  # todo: can be removed?
@@ -210,13 +671,28 @@ input_type_to_resolver = defaultdict(
         'pmcid': pmcid_scr,
         'oclc': oclc_scr})
 
+# Resolver -> its coroutine version, see call_async
+ASYNC_RESOLVERS = {
+    url_doi_isbn_scr: url_doi_isbn_scr_async,
+    doi_scr: doi_scr_async,
+    isbn_scr: isbn_scr_async,
+    jstor_scr: jstor_scr_async,
+    noormags_scr: noormags_scr_async,
+    pmid_scr: pmid_scr_async,
+    pmcid_scr: pmcid_scr_async,
+    urls_scr: urls_scr_async,
+    google_encrypted_scr: google_encrypted_scr_async,
+}
+
 
 if __name__ == '__main__':
     # note that app.py is not run as '__main__' in kubernetes
-    try:
+    if FASTCGI:
         from flup.server.fcgi import WSGIServer
         WSGIServer(app).run()
-    except ImportError:  # on local computer
-        from wsgiref.simple_server import make_server
-        httpd = make_server('localhost', 5000, app)
-        httpd.serve_forever()
+    elif WORKERS == 1:
+        from lib.asgiserver import serve
+        serve(asgi_app, SERVER_HOST, SERVER_PORT)
+    else:
+        from lib.prefork import serve
+        serve(asgi_app, SERVER_HOST, SERVER_PORT, WORKERS)
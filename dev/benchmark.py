@@ -0,0 +1,212 @@
+"""Time the resolvers end to end on the recorded responses of test/testdata.
+
+No request leaves the machine: the replay layer of the test package serves
+the responses. For each case the median CPU and wall time, the throughput,
+the peak of traced allocations, and the median time of each lib.spans
+phase (fetch.<host>, url2dict, find_authors, langid, sfn_cit_ref) are
+reported. Phase times are wall-clock, which is CPU time here except for
+waits on lib.executor tasks.
+
+Usage:
+    python dev/benchmark.py [-n 10] [-k doi] [--save baseline.json]
+    python dev/benchmark.py --compare baseline.json [--threshold .2]
+
+--compare exits with status 1 if the CPU time or the allocation peak of
+a case grew by more than the threshold (a fraction) over the baseline.
+"""
+
+from argparse import ArgumentParser
+from json import dump, load
+from logging import CRITICAL, NOTSET, disable
+from os.path import abspath, dirname
+from platform import python_version
+from statistics import median
+from sys import modules, path
+from time import perf_counter, process_time
+from tracemalloc import get_traced_memory, start, stop
+from urllib.parse import urlparse
+
+path.insert(0, dirname(dirname(abspath(__file__))))
+
+from test import install_replay  # noqa: E402
+
+from lib import circuitbreaker, ratelimit  # noqa: E402
+from lib.cache import TTLCache  # noqa: E402
+from lib.doi import doi_scr  # noqa: E402
+from lib.googlebooks import googlebooks_scr  # noqa: E402
+from lib.isbn_oclc import isbn_scr  # noqa: E402
+from lib.jstor import jstor_scr  # noqa: E402
+from lib.ketabir import ketabir_scr  # noqa: E402
+from lib.noorlib import noorlib_scr  # noqa: E402
+from lib.noormags import noormags_scr  # noqa: E402
+from lib.pubmed import pmid_scr  # noqa: E402
+from lib.spans import collect  # noqa: E402
+from lib.urls import urls_scr  # noqa: E402
+from lib.waybackmachine import waybackmachine_scr  # noqa: E402
+
+
+# name -> (resolver, args); the inputs are those of the tests
+CASES = {
+    'urls-boston': (urls_scr, (
+        'http://www.boston.com/cars/news-and-reviews/2014/06/28/'
+        'hot-rod-stamps-google-road-prospectus/hylbVi9qonAwBIH10CwiDP/'
+        'story.html', '%B %d, %Y')),
+    'urls-bostonglobe': (urls_scr, (
+        'http://www.bostonglobe.com/metro/2014/06/03/'
+        'walsh-meets-with-college-leaders-off-campus-housing/'
+        'lsxtLSGJMD86Gbkjay3D6J/story.html',)),
+    'doi': (doi_scr, ('https://doi.org/10.1038%2Fnrd842',)),
+    'isbn': (isbn_scr, ('9780349119168', True)),
+    'pmid': (pmid_scr, ('123455',)),
+    'googlebooks': (googlebooks_scr, (urlparse(
+        'http://books.google.com/books?'
+        'id=pzmt3pcBuGYC&pg=PR11&lpg=PP1&dq=digital+library'),)),
+    'jstor': (jstor_scr, ('https://www.jstor.org/stable/30078788',)),
+    'noormags': (noormags_scr, (
+        'http://www.noormags.ir/view/fa/articlepage/105489/'
+        '%d8%aa%d8%ad%d9%84%db%8c%d9%84-%d9%85%d9%86%d8%a7%d9%81%d8%b9-'
+        '%d8%a8%d9%87%d8%b1%d9%87-%d9%88%d8%b1%db%8c-'
+        '%d9%86%d8%a7%d8%b4%db%8c-%d8%a7%d8%b2-'
+        '%d8%a7%d8%b5%d9%84%d8%a7%d8%ad%d8%a7%d8%aa-'
+        '%d8%b5%d9%86%d8%b9%d8%aa-%d8%a8%d8%b1%d9%82-'
+        '%d8%a7%d8%b3%d8%aa%d8%b1%d8%a7%d9%84%db%8c%d8%a7--'
+        '%da%86%d8%a7%d8%b1%da%86%d9%88%d8%a8-%d9%87%d8%a7%db%8c-'
+        '%d8%b1%d9%88%d8%b4-%d8%b4%d9%86%d8%a7%d8%ae%d8%aa%db%8c?q='
+        '%D8%A8%D8%B1%D9%82&score=21.639421&rownumber=1',)),
+    'noorlib': (noorlib_scr, (
+        'http://www.noorlib.ir/View/fa/Book/BookView/Image/6120',)),
+    'ketabir': (ketabir_scr, (
+        'http://www.ketab.ir/bookview.aspx?bookid=1323394',)),
+    'waybackmachine': (waybackmachine_scr, (
+        'http://web.archive.org/web/20131021230444/'
+        'http://www.huffingtonpost.com/2013/10/19/'
+        'plastic-surgery-justin-bieber-100k_n_4128563.html?'
+        'utm_hp_ref=mostpopular',)),
+}
+
+
+def reset_state() -> None:
+    """Make each call start cold: no cached results, no open circuits."""
+    for name, module in [*modules.items()]:
+        if name.startswith('lib.'):
+            for value in [*vars(module).values()]:
+                if isinstance(value, TTLCache):
+                    value.clear()
+    circuitbreaker._breakers.clear()
+
+
+def run_case(resolver, args, iterations: int) -> dict:
+    resolver(*args)  # warm up, e.g. langid and lazily compiled patterns
+    # failures that the resolver logs were already logged by the warm-up
+    disable(CRITICAL)
+    try:
+        return measure(resolver, args, iterations)
+    finally:
+        disable(NOTSET)
+
+
+def measure(resolver, args, iterations: int) -> dict:
+    cpu_times, wall_times = [], []
+    phases = {}
+    for _ in range(iterations):
+        reset_state()
+        with collect() as timings:
+            wall_start, cpu_start = perf_counter(), process_time()
+            resolver(*args)
+            cpu_times.append(process_time() - cpu_start)
+            wall_times.append(perf_counter() - wall_start)
+        for phase, (seconds, _) in timings.durations.items():
+            if phase != 'total':
+                phases.setdefault(phase, []).append(seconds)
+    reset_state()
+    start()
+    try:
+        resolver(*args)
+        peak = get_traced_memory()[1]
+    finally:
+        stop()
+    wall = median(wall_times)
+    return {
+        'cpu_ms': median(cpu_times) * 1000,
+        'wall_ms': wall * 1000,
+        'calls_per_second': 1 / wall if wall else None,
+        'peak_alloc_kib': peak / 1024,
+        # phases missing from some iterations count as 0 in those
+        'phases_ms': {
+            phase: median(s + [0] * (iterations - len(s))) * 1000
+            for phase, s in phases.items()},
+    }
+
+
+def print_results(results: dict) -> None:
+    print(f'{"case":<18}{"cpu ms":>9}{"wall ms":>9}{"calls/s":>9}'
+          f'{"peak KiB":>10}  slowest phases (ms)')
+    for name, r in results.items():
+        if 'error' in r:
+            print(f'{name:<18}error: {r["error"]}')
+            continue
+        phases = sorted(r['phases_ms'].items(), key=lambda i: -i[1])[:3]
+        print(
+            f'{name:<18}{r["cpu_ms"]:>9.2f}{r["wall_ms"]:>9.2f}'
+            f'{r["calls_per_second"] or 0:>9.1f}{r["peak_alloc_kib"]:>10.1f}'
+            '  ' + ', '.join(f'{p} {ms:.2f}' for p, ms in phases))
+
+
+def regressions(results: dict, baseline: dict, threshold: float) -> list:
+    """Return the descriptions of the metrics that grew over threshold."""
+    found = []
+    for name, r in results.items():
+        b = baseline['cases'].get(name)
+        if b is None or 'error' in r or 'error' in b:
+            continue
+        for metric in ('cpu_ms', 'peak_alloc_kib'):
+            if b[metric] and r[metric] > b[metric] * (1 + threshold):
+                found.append(
+                    f'{name} {metric}: {b[metric]:.2f} -> {r[metric]:.2f}')
+    return found
+
+
+def main() -> int:
+    parser = ArgumentParser(description=__doc__.partition('\n')[0])
+    parser.add_argument('-n', '--iterations', type=int, default=10)
+    parser.add_argument(
+        '-k', '--filter', default='', help='run cases containing this')
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file')
+    parser.add_argument('--threshold', type=float, default=.2)
+    args = parser.parse_args()
+
+    # responses are served from test/testdata
+    install_replay()
+    # the replayed upstreams need no rate limiting
+    ratelimit.RATE_LIMITS = {}
+    ratelimit._host_keys.clear()
+
+    results = {}
+    for name, (resolver, resolver_args) in CASES.items():
+        if args.filter not in name:
+            continue
+        # noinspection PyBroadException
+        try:
+            results[name] = run_case(resolver, resolver_args, args.iterations)
+        except Exception as e:  # e.g. a missing recorded response
+            results[name] = {'error': f'{type(e).__name__}: {e}'}
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w', encoding='utf8') as f:
+            dump({
+                'python': python_version(), 'iterations': args.iterations,
+                'cases': results}, f, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare, encoding='utf8') as f:
+            baseline = load(f)
+        found = regressions(results, baseline, args.threshold)
+        for line in found:
+            print('regression:', line)
+        return 1 if found else 0
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
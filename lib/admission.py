@@ -0,0 +1,140 @@
+"""Admission control: shed requests instead of queueing them.
+
+Each input kind (see lib.resultcache.normalize_input) has a bounded number
+of lookups in flight (config.ADMISSION_LIMITS), so that expensive kinds,
+e.g. web page scraping, are shed first while cheap ones keep flowing.
+Requests that have already waited too long before reaching the application
+are shed too; the client has probably given up on them.
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+from time import time
+from typing import Dict, Optional
+
+from lib.settings import (
+    ADMISSION_LIMITS, ADMISSION_MAX_QUEUE_TIME, ADMISSION_RETRY_AFTER)
+
+
+DEFAULT_LIMIT = 16
+
+
+class Overloaded(Exception):
+
+    """Raise when a request is shed; respond with 503 and Retry-After."""
+
+    retry_after = ADMISSION_RETRY_AFTER
+
+
+class Gate:
+
+    """The in-flight counter and queue time statistics of an input kind."""
+
+    __slots__ = (
+        'limit', 'in_flight', 'admitted', 'rejected', 'queue_time',
+        'max_queue_time', '_lock')
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = self.admitted = self.rejected = 0
+        self.queue_time = self.max_queue_time = 0.
+        self._lock = Lock()
+
+    def enter(self, queue_time: float) -> bool:
+        """Return True and take a slot, unless the request must be shed."""
+        with self._lock:
+            if self.in_flight >= self.limit or (
+                queue_time > ADMISSION_MAX_QUEUE_TIME
+            ):
+                self.rejected += 1
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            self.queue_time += queue_time
+            if queue_time > self.max_queue_time:
+                self.max_queue_time = queue_time
+            return True
+
+    def leave(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+_lock = Lock()
+_gates: Dict[str, Gate] = {}
+# the number of processes that share ADMISSION_LIMITS, see share_limits
+_processes = 1
+
+
+def kind_limit(kind: str) -> int:
+    """Return the in-flight limit of kind in this process."""
+    return max(ADMISSION_LIMITS.get(kind, DEFAULT_LIMIT) // _processes, 1)
+
+
+def gate(kind: str) -> Gate:
+    try:
+        return _gates[kind]
+    except KeyError:
+        with _lock:
+            return _gates.setdefault(kind, Gate(kind_limit(kind)))
+
+
+def share_limits(processes: int) -> None:
+    """Divide ADMISSION_LIMITS between processes, e.g. lib.prefork workers.
+
+    Each process has its own gates, so without this every kind would have
+    `processes` times the configured lookups in flight.
+    """
+    global _processes
+    with _lock:
+        _processes = processes
+        for kind, kind_gate in _gates.items():
+            kind_gate.limit = kind_limit(kind)
+
+
+@contextmanager
+def admit(kind: str, queue_time: float = 0.):
+    """Run the block in a slot of kind or raise Overloaded immediately.
+
+    queue_time is the seconds that the request waited before reaching the
+    application.
+    """
+    kind_gate = gate(kind)
+    if not kind_gate.enter(queue_time):
+        raise Overloaded(kind)
+    try:
+        yield
+    finally:
+        kind_gate.leave()
+
+
+def header_queue_time(x_request_start: Optional[str]) -> float:
+    """Return the seconds passed since the time in an X-Request-Start header.
+
+    The header value is a Unix time in seconds, milliseconds, or
+    microseconds, optionally prefixed with "t=". Return 0 for missing or
+    invalid values.
+    """
+    if not x_request_start:
+        return 0.
+    try:
+        start = float(x_request_start.partition('t=')[2] or x_request_start)
+    except ValueError:
+        return 0.
+    if start > 1e14:
+        start /= 1e6
+    elif start > 1e11:
+        start /= 1e3
+    return max(time() - start, 0.)
+
+
+def stats() -> Dict[str, dict]:
+    """Return the in-flight, admitted, and rejected counts of each kind."""
+    with _lock:
+        gates = {**_gates}
+    return {
+        kind: {
+            'limit': g.limit, 'in_flight': g.in_flight,
+            'admitted': g.admitted, 'rejected': g.rejected,
+            'queue_time': g.queue_time, 'max_queue_time': g.max_queue_time}
+        for kind, g in gates.items()}
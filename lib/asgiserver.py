@@ -0,0 +1,407 @@
+"""A small asyncio HTTP/1.1 server for ASGI applications.
+
+Connections are kept alive for KEEP_ALIVE_TIMEOUT seconds. At most
+MAX_CONCURRENT_REQUESTS requests are passed to the application at the same
+time; the others wait for a free slot. Request bodies must have a
+Content-Length of at most MAX_REQUEST_BODY bytes. On SIGTERM or SIGINT the
+server stops accepting connections, waits up to SHUTDOWN_TIMEOUT seconds for
+the in-flight requests, cancels the rest, and runs the lifespan shutdown.
+"""
+
+from asyncio import (
+    FIRST_COMPLETED, CancelledError, Event, IncompleteReadError,
+    LimitOverrunError, Queue, Semaphore, TimeoutError as AsyncTimeoutError,
+    create_task, current_task, get_running_loop, run, start_server, wait,
+    wait_for)
+from http import HTTPStatus
+from logging import getLogger
+from signal import SIGINT, SIGTERM
+from time import monotonic
+from typing import Callable, Optional, Set
+from urllib.parse import unquote
+
+from lib.settings import (
+    KEEP_ALIVE_TIMEOUT, MAX_CONCURRENT_REQUESTS, MAX_REQUEST_BODY,
+    SHUTDOWN_TIMEOUT)
+
+
+# The maximum size of the request line and of each header line
+MAX_LINE_LENGTH = 16384
+MAX_HEADERS = 100
+
+
+class BadRequest(Exception):
+
+    """Raise when a request can not be parsed."""
+
+    pass
+
+
+class Server:
+
+    """Serve an ASGI application on host:port or on a listening sock."""
+
+    def __init__(
+        self, app: Callable, host: str, port: int,
+        max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+        shutdown_timeout: float = SHUTDOWN_TIMEOUT, sock=None,
+        max_body_size: int = MAX_REQUEST_BODY,
+    ):
+        self.app = app
+        self.sock = sock
+        self.host = host
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.shutdown_timeout = shutdown_timeout
+        self.max_body_size = max_body_size
+        # the number of requests being handled or waiting for a slot
+        self.active = self.waiting = 0
+        self.served = 0
+        self.started: Optional[Event] = None
+        self._should_exit: Optional[Event] = None
+        self._slots: Optional[Semaphore] = None
+        self._connections: Set = set()
+        self._lifespan: Optional[Lifespan] = None
+        self._loop = None
+
+    async def serve(self) -> None:
+        """Serve until stop() is called or a SIGTERM/SIGINT is received."""
+        loop = self._loop = get_running_loop()
+        self.started, self._should_exit = Event(), Event()
+        self._slots = Semaphore(self.max_concurrency)
+        for signal in (SIGTERM, SIGINT):
+            try:
+                loop.add_signal_handler(signal, self._should_exit.set)
+            except (NotImplementedError, RuntimeError):  # not main thread
+                pass
+        self._lifespan = Lifespan(self.app)
+        await self._lifespan.startup()
+        if self.sock is None:
+            server = await start_server(
+                self.handle_connection, self.host, self.port,
+                limit=MAX_LINE_LENGTH)
+        else:
+            server = await start_server(
+                self.handle_connection, sock=self.sock,
+                limit=MAX_LINE_LENGTH)
+        self.port = server.sockets[0].getsockname()[1]
+        logger.info('serving on http://%s:%d', self.host, self.port)
+        self.started.set()
+        try:
+            await self._should_exit.wait()
+        finally:
+            await self.shutdown(server)
+
+    def stop(self) -> None:
+        """Start a graceful shutdown; may be called from other threads."""
+        self._loop.call_soon_threadsafe(self._should_exit.set)
+
+    async def shutdown(self, server) -> None:
+        server.close()
+        await server.wait_closed()
+        # idle keep-alive connections are closed right away
+        for connection in [*self._connections]:
+            if not connection.busy:
+                connection.task.cancel()
+        tasks = [c.task for c in self._connections]
+        if tasks:
+            logger.info('waiting for %d connections', len(tasks))
+            _, pending = await wait(tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await wait(pending)
+        await self._lifespan.shutdown()
+
+    async def handle_connection(self, reader, writer) -> None:
+        connection = Connection(self, reader, writer)
+        self._connections.add(connection)
+        try:
+            await connection.run()
+        except (CancelledError, ConnectionError):
+            pass
+        except Exception:
+            logger.exception('unhandled connection error')
+        finally:
+            self._connections.discard(connection)
+            writer.close()
+
+    @property
+    def shutting_down(self) -> bool:
+        return self._should_exit.is_set()
+
+
+class Connection:
+
+    """Read requests from a client connection and run the app for each."""
+
+    __slots__ = ('server', 'reader', 'writer', 'task', 'busy', 'client')
+
+    def __init__(self, server: Server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.task = current_task()
+        self.busy = False
+        self.client = writer.get_extra_info('peername')
+
+    async def run(self) -> None:
+        server = self.server
+        while not server.shutting_down:
+            try:
+                request_line = await wait_for(
+                    self.reader.readline(), KEEP_ALIVE_TIMEOUT)
+            except AsyncTimeoutError:
+                return
+            if not request_line:
+                return
+            self.busy = True
+            try:
+                keep_alive = await self.handle_request(request_line)
+            finally:
+                self.busy = False
+            if not keep_alive:
+                return
+
+    async def handle_request(self, request_line: bytes) -> bool:
+        """Handle one request and return whether to keep the connection."""
+        try:
+            scope, body = await self.read_request(request_line)
+        except (BadRequest, IncompleteReadError, LimitOverrunError,
+                ValueError):
+            await self.send_error(HTTPStatus.BAD_REQUEST)
+            return False
+        except LengthRequired:
+            await self.send_error(HTTPStatus.LENGTH_REQUIRED)
+            return False
+        except PayloadTooLarge:
+            await self.send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return False
+        headers = dict(scope['headers'])
+        keep_alive = headers.get(b'connection', b'').lower() != b'close' \
+            and scope['http_version'] == '1.1'
+        response = Response(self.writer, keep_alive, scope['method'])
+        server = self.server
+        server.waiting += 1
+        received_at = monotonic()
+        try:
+            await server._slots.acquire()
+        finally:
+            server.waiting -= 1
+        # the seconds waited for a slot, see lib.admission
+        scope['queue_time'] = monotonic() - received_at
+        server.active += 1
+        try:
+            await self.run_app(scope, body, response)
+        finally:
+            server.active -= 1
+            server._slots.release()
+        server.served += 1
+        return response.keep_alive and not server.shutting_down
+
+    async def read_request(self, request_line: bytes) -> tuple:
+        try:
+            method, target, version = request_line.decode(
+                'latin-1').split()
+        except ValueError:
+            raise BadRequest(request_line) from None
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise BadRequest(version)
+        headers = []
+        content_length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                raise BadRequest('incomplete headers')
+            if len(headers) == MAX_HEADERS:
+                raise BadRequest('too many headers')
+            name, sep, value = line.partition(b':')
+            if not sep:
+                raise BadRequest(line)
+            name = name.strip().lower()
+            value = value.strip()
+            if name == b'content-length':
+                if not value.isdigit():  # e.g. negative
+                    raise BadRequest(line)
+                content_length = int(value)
+                if content_length > self.server.max_body_size:
+                    raise PayloadTooLarge(content_length)
+            elif name == b'transfer-encoding':
+                raise LengthRequired
+            headers.append((name, value))
+        body = await self.reader.readexactly(content_length) \
+            if content_length else b''
+        path, _, query = target.partition('?')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.1'},
+            'http_version': version[5:],
+            'method': method.upper(),
+            'scheme': 'http',
+            'path': unquote(path),
+            'raw_path': path.encode('latin-1'),
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': headers,
+            'client': self.client,
+            'server': (self.server.host, self.server.port),
+        }
+        return scope, body
+
+    async def run_app(self, scope: dict, body: bytes, response) -> None:
+        request_message = {
+            'type': 'http.request', 'body': body, 'more_body': False}
+        response_done = Event()
+
+        async def receive() -> dict:
+            nonlocal request_message
+            if request_message is not None:
+                message, request_message = request_message, None
+                return message
+            await response_done.wait()
+            return {'type': 'http.disconnect'}
+
+        try:
+            await self.server.app(scope, receive, response.send)
+        except CancelledError:  # an Exception subclass before Python 3.8
+            raise
+        except Exception:
+            logger.exception('exception in the ASGI application')
+        finally:
+            response_done.set()
+        if not response.finished:
+            # the client can not tell where an unfinished response ends
+            if not response.started:
+                await self.send_error(HTTPStatus.INTERNAL_SERVER_ERROR)
+            response.keep_alive = False
+
+    async def send_error(self, status: HTTPStatus) -> None:
+        body = f'{status.value} {status.phrase}'.encode()
+        self.writer.write(
+            f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            f'Content-Type: text/plain; charset=UTF-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Connection: close\r\n\r\n'.encode() + body)
+        await self.writer.drain()
+
+
+class LengthRequired(Exception):
+
+    """Raise for request bodies that do not have a Content-Length."""
+
+    pass
+
+
+class PayloadTooLarge(Exception):
+
+    """Raise for request bodies larger than Server.max_body_size."""
+
+    pass
+
+
+class Response:
+
+    """The ASGI send callable of a single request."""
+
+    __slots__ = (
+        'writer', 'keep_alive', 'head', 'started', 'finished', 'chunked')
+
+    def __init__(self, writer, keep_alive: bool, method: str):
+        self.writer = writer
+        self.keep_alive = keep_alive
+        self.head = method == 'HEAD'
+        self.started = self.finished = self.chunked = False
+
+    async def send(self, message: dict) -> None:
+        message_type = message['type']
+        if message_type == 'http.response.start':
+            if self.started:
+                raise RuntimeError('response already started')
+            self.started = True
+            status = message['status']
+            try:
+                phrase = HTTPStatus(status).phrase
+            except ValueError:
+                phrase = ''
+            lines = [f'HTTP/1.1 {status} {phrase}'.encode()]
+            has_length = False
+            for name, value in message.get('headers', ()):
+                if name.lower() == b'content-length':
+                    has_length = True
+                lines.append(name + b': ' + value)
+            if not has_length and not self.head:
+                self.chunked = True
+                lines.append(b'transfer-encoding: chunked')
+            if not self.keep_alive:
+                lines.append(b'connection: close')
+            self.writer.write(b'\r\n'.join(lines) + b'\r\n\r\n')
+        elif message_type == 'http.response.body':
+            if not self.started or self.finished:
+                raise RuntimeError('unexpected http.response.body')
+            body = message.get('body', b'')
+            more_body = message.get('more_body', False)
+            if not self.head:
+                if self.chunked:
+                    if body:
+                        self.writer.write(
+                            b'%x\r\n%s\r\n' % (len(body), body))
+                    if not more_body:
+                        self.writer.write(b'0\r\n\r\n')
+                elif body:
+                    self.writer.write(body)
+            await self.writer.drain()
+            if not more_body:
+                self.finished = True
+
+
+class Lifespan:
+
+    """Run the lifespan protocol of the application, if it supports it."""
+
+    def __init__(self, app: Callable):
+        self.app = app
+        self.supported = True
+        self._receive_queue: Queue = Queue()
+        self._events = {}
+        self._task = None
+
+    async def startup(self) -> None:
+        self._task = create_task(self.run())
+        await self._send_and_wait('startup')
+
+    async def shutdown(self) -> None:
+        if self.supported:
+            await self._send_and_wait('shutdown')
+        await wait([self._task])
+
+    async def _send_and_wait(self, event: str) -> None:
+        done = self._events[event] = Event()
+        await self._receive_queue.put({'type': 'lifespan.' + event})
+        waiter = create_task(done.wait())
+        await wait([waiter, self._task], return_when=FIRST_COMPLETED)
+        waiter.cancel()
+
+    async def run(self) -> None:
+        async def send(message: dict) -> None:
+            event = message['type'].split('.')[1]
+            if message['type'].endswith('.failed'):
+                logger.error(
+                    'lifespan %s failed: %s', event, message.get('message'))
+            self._events[event].set()
+
+        try:
+            await self.app(
+                {'type': 'lifespan', 'asgi': {'version': '3.0'}},
+                self._receive_queue.get, send)
+        except Exception:  # the application does not support lifespan
+            self.supported = False
+
+
+def serve(app: Callable, host: str, port: int) -> None:
+    """Run app until the process receives SIGTERM or SIGINT."""
+    run(Server(app, host, port).serve())
+
+
+logger = getLogger(__name__)
@@ -0,0 +1,469 @@
+"""A small asyncio HTTP/1.1 client, the async counterpart of commons.request.
+
+It uses only the standard library so that many upstream waits can be held
+by one thread. Requests go through the same layers as lib.commons.request:
+the rate limits, circuit breakers, and deadline handling, the HTTP cache of
+lib.commons, and the coalescing of identical GET requests. Connections are
+kept alive and reused per host like those of lib.connpool, with the same
+pool sizes, idle timeout, and counters.
+"""
+
+from asyncio import TimeoutError as AsyncTimeoutError, get_running_loop, \
+    open_connection, sleep, wait_for
+from contextlib import asynccontextmanager
+from json import loads
+from ssl import create_default_context
+from time import monotonic
+from typing import AsyncIterator, Dict, List, Optional
+from urllib.parse import urlencode, urljoin, urlsplit
+from weakref import WeakKeyDictionary
+from zlib import decompressobj, MAX_WBITS
+
+from requests import ConnectionError as RequestsConnectionError, Timeout, \
+    TooManyRedirects
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from lib.settings import (
+    CONNECTION_IDLE_TIMEOUT, CONNECTION_POOL_SIZE, CONNECTION_POOL_SIZES)
+from lib.circuitbreaker import breaker
+from lib.commons import AGENT_HEADER, HTTP_CACHE, SPOOFED_AGENT_HEADER, \
+    TIMEOUT
+from lib.connpool import _count
+from lib.deadline import DeadlineExceeded, call_timeout
+from lib.executor import run_async
+from lib.httpcache import is_cacheable_host
+from lib.metrics import add_flights, observe_upstream
+from lib.ratelimit import reserve
+from lib.singleflight import AsyncSingleFlight
+from lib.spans import span
+
+
+MAX_REDIRECTS = 10
+# Limit of the decoded body of responses unless max_length is given
+MAX_CONTENT_LENGTH = 10_000_000
+
+SSL_CONTEXT = create_default_context()
+# Identical GET requests that are in flight at the same time share a response
+REQUEST_FLIGHTS = AsyncSingleFlight()
+add_flights('outbound_async', REQUEST_FLIGHTS)
+
+# Connections can only be used by the event loop that opened them.
+# loop -> (scheme, hostname, port) -> idle connections
+_pools: 'WeakKeyDictionary[object, Dict[tuple, List[Connection]]]' = \
+    WeakKeyDictionary()
+
+
+class StaleConnection(Exception):
+
+    """Raise when a reused connection was closed by the server."""
+
+    pass
+
+
+class Connection:
+
+    """A connection to a host that can be returned to the pool."""
+
+    __slots__ = ('key', 'reader', 'writer', 'reused', 'released_at')
+
+    def __init__(self, key: tuple, reader, writer):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.reused = False
+        self.released_at = None
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+def acquire(key: tuple) -> Optional[Connection]:
+    """Return an idle connection to the host of key or None."""
+    idle = _pools.get(get_running_loop(), {}).get(key)
+    host = key[1]
+    while idle:
+        connection = idle.pop()
+        if (
+            monotonic() - connection.released_at > CONNECTION_IDLE_TIMEOUT
+            or connection.reader.at_eof()
+        ):
+            # the server has probably closed it
+            _count(host, 'reaped')
+            connection.close()
+            continue
+        _count(host, 'hits')
+        connection.reused = True
+        return connection
+    return None
+
+
+def release(connection: Connection) -> None:
+    """Keep the connection for reuse unless the pool of its host is full."""
+    pools = _pools.setdefault(get_running_loop(), {})
+    idle = pools.setdefault(connection.key, [])
+    host = connection.key[1]
+    if len(idle) >= CONNECTION_POOL_SIZES.get(host, CONNECTION_POOL_SIZE):
+        _count(host, 'discarded')
+        connection.close()
+        return
+    connection.released_at = monotonic()
+    idle.append(connection)
+
+
+async def connect(key: tuple) -> Connection:
+    scheme, host, port = key
+    _count(host, 'misses')
+    if scheme == 'https':
+        _count(host, 'tls_handshakes')
+    reader, writer = await open_connection(
+        host, port, ssl=SSL_CONTEXT if scheme == 'https' else None)
+    return Connection(key, reader, writer)
+
+
+class Response:
+
+    """The parts of requests.Response that the resolvers use.
+
+    The body of a streamed response is read with iter_content; the
+    connection is released when the body has been read completely.
+    """
+
+    __slots__ = (
+        'url', 'status_code', 'headers', 'content', 'encoding',
+        '_connection', '_keep_alive')
+
+    def __init__(
+        self, url: str, status_code: int, headers: CaseInsensitiveDict,
+        content: bytes,
+    ):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.encoding = get_encoding_from_headers(headers)
+        self._connection = None
+        self._keep_alive = False
+
+    @property
+    def text(self) -> str:
+        return self.content.decode(self.encoding or 'utf-8', 'replace')
+
+    def json(self):
+        return loads(self.content)
+
+    async def iter_content(self, chunk_size: int) -> AsyncIterator[bytes]:
+        """Yield the decoded body in chunks of about chunk_size bytes.
+
+        Each read gets the timeout of an outbound call. Failures are raised
+        as the requests exception types, like those of limited_request.
+        """
+        chunks = self._chunks(chunk_size)
+        try:
+            while True:
+                timeout = call_timeout(TIMEOUT)
+                try:
+                    chunk = await wait_for(chunks.__anext__(), timeout)
+                except StopAsyncIteration:
+                    return
+                except AsyncTimeoutError:
+                    if timeout == TIMEOUT:
+                        raise Timeout(f'{self.url} timed out') from None
+                    raise DeadlineExceeded(
+                        'request deadline exceeded') from None
+                except (OSError, EOFError, ValueError) as e:
+                    raise RequestsConnectionError(e) from e
+                yield chunk
+        finally:
+            await chunks.aclose()
+            self.close()
+
+    async def _chunks(self, chunk_size: int) -> AsyncIterator[bytes]:
+        connection = self._connection
+        if connection is None:
+            return
+        reader = connection.reader
+        headers = self.headers
+        decode = decoder(headers.get('content-encoding', '').lower())
+        complete = False
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                line = await reader.readline()
+                if not line:  # the connection was closed
+                    break
+                size = int(line.split(b';')[0], 16)
+                if size == 0:
+                    # skip the trailer section, like http.client does
+                    while line not in (b'\r\n', b'\n', b''):
+                        line = await reader.readline()
+                    complete = bool(line)
+                    break
+                chunk = decode(await reader.readexactly(size))
+                await reader.readline()  # the CRLF after the chunk
+                if chunk:
+                    yield chunk
+        else:
+            length = headers.get('content-length')
+            remaining_length = int(length) if length else None
+            while remaining_length != 0:
+                chunk = await reader.read(
+                    chunk_size if remaining_length is None
+                    else min(remaining_length, chunk_size))
+                if not chunk:
+                    break
+                if remaining_length is not None:
+                    remaining_length -= len(chunk)
+                chunk = decode(chunk)
+                if chunk:
+                    yield chunk
+            complete = remaining_length == 0
+        self._connection = None
+        if complete and self._keep_alive:
+            release(connection)
+        else:
+            connection.close()
+
+    def close(self) -> None:
+        """Close the connection if the body has not been read completely."""
+        connection = self._connection
+        if connection is not None:
+            self._connection = None
+            connection.close()
+
+
+def decoder(content_encoding: str):
+    """Return the function that decodes chunks of the body."""
+    if content_encoding in ('gzip', 'deflate'):
+        # 16 + MAX_WBITS: gzip header, 32 + MAX_WBITS: detect zlib or gzip
+        return decompressobj(
+            16 + MAX_WBITS if content_encoding == 'gzip'
+            else 32 + MAX_WBITS).decompress
+
+    def identity(chunk: bytes) -> bytes:
+        return chunk
+    return identity
+
+
+async def request(
+    url: str, spoof: bool = False, method: str = 'get',
+    data: Optional[dict] = None, max_length: Optional[int] = None,
+) -> Response:
+    """Send an outbound request within the time left for the current request.
+
+    Redirects are followed. If max_length is given, only that many bytes of
+    the body are read. Raise lib.deadline.DeadlineExceeded if no time is
+    left and the requests exception types for other failures.
+    Like lib.commons.request, responses of cacheable hosts are served from
+    HTTP_CACHE if enabled, and concurrent plain GET requests for the same
+    URL are coalesced and get the same response object; do not modify it.
+    """
+    if method == 'get' and data is None and max_length is None:
+        return await REQUEST_FLIGHTS.do(
+            (url, spoof), send_request, url, spoof)
+    return await send_request(url, spoof, method, data, max_length)
+
+
+async def send_request(
+    url: str, spoof: bool = False, method: str = 'get',
+    data: Optional[dict] = None, max_length: Optional[int] = None,
+) -> Response:
+    headers = SPOOFED_AGENT_HEADER if spoof else AGENT_HEADER
+    body = urlencode(data).encode() if data else b''
+    if HTTP_CACHE is not None and max_length is None \
+            and is_cacheable_host(url):
+        # SQLite I/O, which may wait for the lock of the database, is kept
+        # off the event loop
+        key, cached, fresh, headers = await run_async(
+            'httpcache', HTTP_CACHE.lookup, method, url, headers, data)
+        if fresh:
+            return cached
+        response = await follow_redirects(
+            method, url, headers, body, max_length)
+        return await run_async(
+            'httpcache', HTTP_CACHE.update, key, cached, response)
+    return await follow_redirects(method, url, headers, body, max_length)
+
+
+@asynccontextmanager
+async def stream(url: str, spoof: bool = False) -> AsyncIterator[Response]:
+    """Send a GET request and provide the response before reading its body.
+
+    Use `async for chunk in response.iter_content(size)` to read the body.
+    Like requests with stream=True in lib.commons.request, streamed
+    requests are neither cached nor coalesced.
+    """
+    response = await follow_redirects(
+        'get', url, SPOOFED_AGENT_HEADER if spoof else AGENT_HEADER, b'',
+        None, True)
+    try:
+        yield response
+    finally:
+        response.close()
+
+
+async def follow_redirects(
+    method: str, url: str, headers: Dict[str, str], body: bytes,
+    max_length: Optional[int], streamed: bool = False,
+) -> Response:
+    for _ in range(MAX_REDIRECTS + 1):
+        response = await limited_request(
+            method, url, headers, body, max_length, streamed)
+        location = response.headers.get('location')
+        if location is None or response.status_code not in (
+            301, 302, 303, 307, 308
+        ):
+            return response
+        response.close()
+        url = urljoin(url, location)
+        # the same method changes as requests.Session.rebuild_method
+        status_code = response.status_code
+        if (status_code == 303 and method != 'head') or (
+            status_code in (301, 302) and method == 'post'
+        ):
+            method, body = 'get', b''
+    raise TooManyRedirects(f'more than {MAX_REDIRECTS} redirects: {url}')
+
+
+async def limited_request(
+    method: str, url: str, headers: Dict[str, str], body: bytes,
+    max_length: Optional[int], streamed: bool = False,
+) -> Response:
+    """Send a single request; see lib.commons.limited_request."""
+    host_breaker = breaker(url)
+    host_breaker.check()
+    wait = reserve(url)
+    if wait:
+        await sleep(wait)
+    timeout = call_timeout(TIMEOUT)
+    started_at = monotonic()
+    try:
+        with span('fetch.' + (urlsplit(url).hostname or '')):
+            response = await wait_for(
+                send(method, url, headers, body, max_length, streamed),
+                timeout)
+    except AsyncTimeoutError:
+        observe_upstream(url, monotonic() - started_at, 'Timeout')
+        # a timeout shortened by the request deadline is not the host's fault
+        if timeout == TIMEOUT:
+            host_breaker.failed()
+            raise Timeout(f'{url} timed out') from None
+        raise DeadlineExceeded('request deadline exceeded') from None
+    except (OSError, EOFError, ValueError) as e:  # e.g. IncompleteReadError
+        observe_upstream(url, monotonic() - started_at, 'ConnectionError')
+        host_breaker.failed()
+        raise RequestsConnectionError(e) from e
+    observe_upstream(
+        url, monotonic() - started_at, f'{response.status_code // 100}xx')
+    if response.status_code >= 500:
+        host_breaker.failed()
+    else:
+        host_breaker.succeeded()
+    return response
+
+
+async def send(
+    method: str, url: str, headers: Dict[str, str], body: bytes,
+    max_length: Optional[int], streamed: bool = False,
+) -> Response:
+    """Send the request over a pooled or new connection.
+
+    Unless streamed is True, the body of the response is read before
+    returning it.
+    """
+    parsed = urlsplit(url)
+    https = parsed.scheme == 'https'
+    key = (parsed.scheme, parsed.hostname, parsed.port or (
+        443 if https else 80))
+    target = parsed.path or '/'
+    if parsed.query:
+        target += '?' + parsed.query
+    lines = [
+        f'{method.upper()} {target} HTTP/1.1',
+        f'Host: {parsed.netloc.rpartition("@")[2]}',
+        'Accept-Encoding: gzip, deflate',
+        *(f'{k}: {v}' for k, v in headers.items()),
+    ]
+    if body:
+        lines.append('Content-Type: application/x-www-form-urlencoded')
+        lines.append(f'Content-Length: {len(body)}')
+    message = ('\r\n'.join(lines) + '\r\n\r\n').encode() + body
+    connection = acquire(key)
+    if connection is not None:
+        try:
+            return await exchange(
+                connection, method, url, message, max_length, streamed)
+        except StaleConnection:
+            pass
+    return await exchange(
+        await connect(key), method, url, message, max_length, streamed)
+
+
+async def exchange(
+    connection: Connection, method: str, url: str, message: bytes,
+    max_length: Optional[int], streamed: bool,
+) -> Response:
+    """Send message over the connection and read the response.
+
+    Raise StaleConnection if a reused connection turns out to be closed
+    before anything was received.
+    """
+    try:
+        reader = connection.reader
+        try:
+            connection.writer.write(message)
+            status_line = await reader.readline()
+        except OSError:
+            if connection.reused:
+                raise StaleConnection from None
+            raise
+        if not status_line and connection.reused:
+            raise StaleConnection
+        try:
+            version, status_code = status_line.split(None, 2)[:2]
+            status_code = int(status_code)
+        except ValueError:
+            raise RequestsConnectionError(
+                f'invalid status line: {status_line!r}') from None
+        headers = CaseInsensitiveDict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip()] = value.strip()
+        response = Response(url, status_code, headers, b'')
+        connection_header = headers.get('connection', '').lower()
+        keep_alive = 'close' not in connection_header and (
+            version != b'HTTP/1.0' or 'keep-alive' in connection_header)
+        if method == 'head' or status_code in (204, 304):
+            if keep_alive:
+                release(connection)
+            else:
+                connection.close()
+            return response
+        response._connection = connection
+        response._keep_alive = keep_alive
+    except BaseException:
+        connection.close()
+        raise
+    if not streamed:
+        response.content = await read_body(
+            response, MAX_CONTENT_LENGTH if max_length is None
+            else max_length)
+    return response
+
+
+async def read_body(response: Response, limit: int) -> bytes:
+    """Read and decode the body, stop after limit decoded bytes."""
+    content = bytearray()
+    # limited_request handles the timeout and the errors of this read
+    chunks = response._chunks(65536)
+    try:
+        async for chunk in chunks:
+            content += chunk
+            if len(content) >= limit:
+                break
+    finally:
+        await chunks.aclose()
+        response.close()
+    return bytes(content[:limit])
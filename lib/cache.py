@@ -0,0 +1,63 @@
+"""A bounded, thread-safe, in-memory cache with expiring entries."""
+
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+from typing import Any, Hashable, Optional
+
+
+MISSING = object()
+
+
+class TTLCache:
+
+    """Least-recently-used cache whose entries expire after their ttl.
+
+    The time to live can be set per entry to allow, for example, shorter
+    lifetimes for negative results.
+    """
+
+    __slots__ = ('maxsize', 'ttl', 'hits', 'misses', '_data', '_lock')
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        """Return the cached value or default if it is missing or expired."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                if item[0] > monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return item[1]
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Store the value and evict the least recently used entries."""
+        expires_at = monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            data = self._data
+            data[key] = expires_at, value
+            data.move_to_end(key)
+            while len(data) > self.maxsize:
+                data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
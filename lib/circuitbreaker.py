@@ -0,0 +1,102 @@
+"""Per-host circuit breakers that fail fast while an upstream is down.
+
+After FAILURE_THRESHOLD consecutive failures the circuit of a host opens and
+calls raise CircuitOpenError without touching the network. After COOL_DOWN
+seconds a single probe call is let through (half-open); its success closes
+the circuit and its failure opens it again.
+"""
+
+from logging import getLogger
+from threading import Lock
+from time import monotonic
+from typing import Dict
+from urllib.parse import urlparse
+
+from requests import ConnectionError as RequestsConnectionError
+
+
+FAILURE_THRESHOLD = 5
+COOL_DOWN = 30
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+
+class CircuitOpenError(RequestsConnectionError):
+
+    """Raise when calls to a host are skipped because its circuit is open."""
+
+    pass
+
+
+class CircuitBreaker:
+
+    """Track the consecutive failures of one host."""
+
+    __slots__ = (
+        'hostname', 'state', 'failures', 'opened_at', 'short_circuited',
+        '_lock')
+
+    def __init__(self, hostname: str):
+        self.hostname = hostname
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.
+        self.short_circuited = 0
+        self._lock = Lock()
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a call to the host is allowed."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            now = monotonic()
+            # a half-open circuit allows another probe if the previous one
+            # did not report back within COOL_DOWN
+            if now - self.opened_at >= COOL_DOWN:
+                self.state = HALF_OPEN  # let this call probe the host
+                self.opened_at = now
+                return
+            self.short_circuited += 1
+        raise CircuitOpenError(f'circuit of {self.hostname} is open')
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.state = CLOSED
+
+    def failed(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= FAILURE_THRESHOLD:
+                if self.state != OPEN:
+                    logger.warning('opening the circuit of %s', self.hostname)
+                self.state = OPEN
+                self.opened_at = monotonic()
+
+
+_lock = Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def breaker(url: str) -> CircuitBreaker:
+    """Return the circuit breaker of the host of url."""
+    hostname = (urlparse(url).hostname or '').lower()
+    try:
+        return _breakers[hostname]
+    except KeyError:
+        with _lock:
+            return _breakers.setdefault(hostname, CircuitBreaker(hostname))
+
+
+def stats() -> Dict[str, dict]:
+    """Return the state and counters of the circuit of each host."""
+    with _lock:
+        breakers = [*_breakers.values()]
+    return {
+        b.hostname: {
+            'state': b.state, 'failures': b.failures,
+            'short_circuited': b.short_circuited}
+        for b in breakers}
+
+
+logger = getLogger(__name__)
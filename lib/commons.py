@@ -2,13 +2,28 @@ from calendar import month_abbr, month_name
 from datetime import datetime, date as datetime_date
 from functools import partial
 from json import dumps as json_dumps
+from time import monotonic
+from urllib.parse import urlparse
 
 from isbnlib import mask as isbn_mask, NotValidISBNError
 from jdatetime import date as jdate
+from langid import classify as langid_classify
 from regex import compile as regex_compile, VERBOSE, IGNORECASE
-from requests import Session
-
-from config import LANG, SPOOFED_USER_AGENT, NCBI_TOOL, NCBI_EMAIL, USER_AGENT
+from requests import ConnectionError as RequestsConnectionError, \
+    Session, Timeout
+
+from config import (
+    LANG, SPOOFED_USER_AGENT, NCBI_TOOL, NCBI_EMAIL, USER_AGENT)
+from lib.deadline import call_timeout
+from lib.circuitbreaker import breaker
+from lib.connpool import PoolingAdapter
+from lib.httpcache import HTTPCache, is_cacheable_host
+from lib.metrics import add_cache, add_flights, observe_upstream
+from lib.ratelimit import throttle
+from lib.settings import (
+    HTTP_CACHE_MAX_ENTRIES, HTTP_CACHE_PATH, HTTP_CACHE_TTL)
+from lib.singleflight import SingleFlight
+from lib.spans import span, timed
 
 if LANG == 'en':
     from lib.generator_en import sfn_cit_ref
@@ -87,7 +102,22 @@ SPOOFED_AGENT_HEADER = {
     'User-Agent': SPOOFED_USER_AGENT,
     'accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.9'
 }
-REQUEST = partial(Session().request, timeout=10)
+# The maximum timeout of each outbound call, see lib.deadline.call_timeout
+TIMEOUT = 10
+SESSION = Session()
+SESSION.mount('http://', PoolingAdapter())
+SESSION.mount('https://', PoolingAdapter())
+REQUEST = SESSION.request
+HTTP_CACHE = HTTPCache(
+    HTTP_CACHE_PATH, HTTP_CACHE_TTL, HTTP_CACHE_MAX_ENTRIES,
+) if HTTP_CACHE_PATH else None
+# Identical GET requests that are in flight at the same time share a response
+REQUEST_FLIGHTS = SingleFlight()
+# langid.classify, timed as a span of the current request
+classify = timed('langid')(langid_classify)
+if HTTP_CACHE is not None:
+    add_cache('http', HTTP_CACHE)
+add_flights('outbound', REQUEST_FLIGHTS)
 
 # original regex from:
 # https://www.debuggex.com/r/0Npla56ipD5aeTr9
@@ -124,12 +154,65 @@ class NumberInNameError(InvalidNameError):
 
 
 def request(url, spoof=False, method='get', **kwargs):
-    return REQUEST(
-        method, url,
-        headers=SPOOFED_AGENT_HEADER if spoof else AGENT_HEADER,
-        **kwargs)
+    """Send an outbound request within the time left for the current request.
+
+    Raise lib.deadline.DeadlineExceeded if no time is left.
+    Non-streamed responses of the hosts accepted by
+    lib.httpcache.is_cacheable_host are served from HTTP_CACHE if enabled.
+    Concurrent plain GET requests (no extra kwargs) for the same URL are
+    coalesced and get the same response object; do not modify it.
+    """
+    if method == 'get' and not kwargs:
+        return REQUEST_FLIGHTS.do((url, spoof), send_request, url, spoof)
+    return send_request(url, spoof, method, **kwargs)
+
+
+def send_request(url, spoof=False, method='get', **kwargs):
+    headers = SPOOFED_AGENT_HEADER if spoof else AGENT_HEADER
+    if (
+        HTTP_CACHE is not None
+        and not kwargs.get('stream')
+        and is_cacheable_host(url)
+    ):
+        return HTTP_CACHE.request(
+            limited_request, method, url, headers, **kwargs)
+    return limited_request(method, url, headers=headers, **kwargs)
 
 
+def limited_request(method, url, **kwargs):
+    """Call REQUEST once the rate limit of the host allows it.
+
+    Raise lib.circuitbreaker.CircuitOpenError without calling REQUEST if
+    the host has failed repeatedly. See also lib.ratelimit.throttle.
+    """
+    host_breaker = breaker(url)
+    host_breaker.check()
+    throttle(url)
+    timeout = call_timeout(TIMEOUT)
+    started_at = monotonic()
+    try:
+        with span('fetch.' + (urlparse(url).hostname or '')):
+            response = REQUEST(method, url, timeout=timeout, **kwargs)
+    except RequestsConnectionError as e:
+        observe_upstream(url, monotonic() - started_at, type(e).__name__)
+        host_breaker.failed()
+        raise
+    except Timeout as e:
+        observe_upstream(url, monotonic() - started_at, type(e).__name__)
+        # a timeout shortened by the request deadline is not the host's fault
+        if timeout == TIMEOUT:
+            host_breaker.failed()
+        raise
+    observe_upstream(
+        url, monotonic() - started_at, f'{response.status_code // 100}xx')
+    if response.status_code >= 500:
+        host_breaker.failed()
+    else:
+        host_breaker.succeeded()
+    return response
+
+
+@timed('sfn_cit_ref')
 def dict_to_sfn_cit_ref(dictionary) -> tuple:
     """Return (sfn, cite, ref) strings.
 
@@ -149,13 +232,19 @@ def dict_to_sfn_cit_ref(dictionary) -> tuple:
     return sfn_cit_ref(dictionary)
 
 
+def scr_to_dict(response) -> dict:
+    """Return the api dict of the given (sfn, cite, ref) tuple."""
+    sfn, cite, ref = response
+    return {
+        'reference_tag': ref,
+        'citation_template': cite,
+        'shortened_footnote': sfn,
+    }
+
+
 def scr_to_json(response) -> str:
     """Generate api JSON response containing sfn, cite and ref."""
-    return json_dumps({
-        'reference_tag': response.ref,
-        'citation_template': response.cite,
-        'shortened_footnote': response.sfn,
-    })
+    return json_dumps(scr_to_dict(response))
 
 
 def first_last(fullname, separator=None) -> tuple:
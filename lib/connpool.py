@@ -0,0 +1,134 @@
+"""Connection pooling of the shared requests Session.
+
+PoolingAdapter gives each host a pool of CONNECTION_POOL_SIZES[host] (or
+CONNECTION_POOL_SIZE) keep-alive connections, closes connections that were
+idle for more than CONNECTION_IDLE_TIMEOUT seconds instead of reusing
+them, and counts pool hits, misses, discarded connections, and TLS
+handshakes.
+"""
+
+from threading import Lock
+from time import monotonic
+from typing import Dict
+
+from requests.adapters import HTTPAdapter
+from urllib3 import PoolManager
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from lib.settings import (
+    CONNECTION_POOL_SIZE, CONNECTION_POOL_SIZES, CONNECTION_POOL_BLOCK,
+    CONNECTION_IDLE_TIMEOUT)
+
+
+# The maximum number of hosts whose pools are kept
+MAX_POOLS = 100
+
+_lock = Lock()
+# host -> {'hits': int, 'misses': int, 'discarded': int, 'reaped': int,
+#   'tls_handshakes': int}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _count(host: str, name: str) -> None:
+    with _lock:
+        try:
+            _stats[host][name] += 1
+        except KeyError:
+            _stats[host] = dict.fromkeys(
+                ('hits', 'misses', 'discarded', 'reaped', 'tls_handshakes'),
+                0)
+            _stats[host][name] += 1
+
+
+class CountingHTTPSConnection(HTTPSConnection):
+
+    def connect(self):
+        _count(self.host, 'tls_handshakes')
+        return super().connect()
+
+
+class PoolMixin:
+
+    """Reap idle connections and count the pool usage of a host."""
+
+    def _new_conn(self):
+        _count(self.host, 'misses')
+        return super()._new_conn()
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        released_at = getattr(conn, 'released_at', None)
+        if released_at is not None:
+            conn.released_at = None
+            if monotonic() - released_at > CONNECTION_IDLE_TIMEOUT:
+                # the server has probably closed it, reconnect on next use
+                _count(self.host, 'reaped')
+                conn.close()
+            else:
+                _count(self.host, 'hits')
+        return conn
+
+    def _put_conn(self, conn):
+        if conn is not None:
+            conn.released_at = monotonic()
+            pool = self.pool
+            if pool is not None and pool.full():
+                _count(self.host, 'discarded')
+        super()._put_conn(conn)
+
+
+class CountingHTTPConnectionPool(PoolMixin, HTTPConnectionPool):
+
+    ConnectionCls = HTTPConnection
+
+
+class CountingHTTPSConnectionPool(PoolMixin, HTTPSConnectionPool):
+
+    ConnectionCls = CountingHTTPSConnection
+
+
+class HostPoolManager(PoolManager):
+
+    """A PoolManager whose pool size is configured per host."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool,
+        }
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        if request_context is None:
+            request_context = self.connection_pool_kw
+        request_context = {
+            **request_context,
+            'maxsize': CONNECTION_POOL_SIZES.get(host, CONNECTION_POOL_SIZE),
+        }
+        return super()._new_pool(scheme, host, port, request_context)
+
+
+class PoolingAdapter(HTTPAdapter):
+
+    def __init__(self):
+        super().__init__(
+            pool_connections=MAX_POOLS,
+            pool_maxsize=CONNECTION_POOL_SIZE,
+            pool_block=CONNECTION_POOL_BLOCK)
+
+    def init_poolmanager(
+        self, connections, maxsize, block=False, **pool_kwargs
+    ):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = HostPoolManager(
+            num_pools=connections, maxsize=maxsize, block=block,
+            **pool_kwargs)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Return the connection pool counters of each host."""
+    with _lock:
+        return {host: {**s} for host, s in _stats.items()}
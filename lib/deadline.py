@@ -0,0 +1,54 @@
+"""Time budget of the request that is currently being processed.
+
+app() sets a deadline for each request. Outbound calls use call_timeout() to
+get only the time that is left and are skipped once the budget runs out.
+The deadline is kept in a context variable; lib.executor tasks inherit it.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import monotonic
+from typing import Optional
+
+from requests import Timeout
+
+
+class DeadlineExceeded(Timeout):
+
+    """Raise when the time budget of the current request is used up."""
+
+    pass
+
+
+_deadline: ContextVar[Optional[float]] = ContextVar('deadline', default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Limit the outbound calls made within the block to `seconds`."""
+    token = _deadline.set(monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Return the seconds left until the deadline, None if there is none."""
+    expires_at = _deadline.get()
+    if expires_at is None:
+        return None
+    return expires_at - monotonic()
+
+
+def call_timeout(default: float) -> float:
+    """Return the timeout for an outbound call.
+
+    Raise DeadlineExceeded if there is no time left for the call.
+    """
+    left = remaining()
+    if left is None:
+        return default
+    if left <= 0:
+        raise DeadlineExceeded('request deadline exceeded')
+    return min(default, left)
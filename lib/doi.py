@@ -3,13 +3,17 @@
 
 from collections import defaultdict
 from datetime import date as datetime_date
-from urllib.parse import unquote
+from typing import Dict, Iterable
+from urllib.parse import quote, unquote
 from html import unescape
 
-from langid import classify
 from regex import compile as regex_compile, VERBOSE
 
-from lib.commons import dict_to_sfn_cit_ref, request
+from lib.asynchttp import request as async_request
+from lib.cache import TTLCache
+from lib.commons import classify, dict_to_sfn_cit_ref, request
+from lib.deadline import remaining
+from lib.executor import submit, result_or_none, result_or_none_async
 from config import LANG
 
 
@@ -29,30 +33,115 @@ DOI_SEARCH = regex_compile(
 
 def doi_scr(doi_or_url, pure=False, date_format='%Y-%m-%d') -> tuple:
     """Return the response namedtuple."""
+    dictionary = get_crossref_dict(extract_doi(doi_or_url, pure))
+    return crossref_dict_to_scr(dictionary, date_format)
+
+
+async def doi_scr_async(
+    doi_or_url, pure=False, date_format='%Y-%m-%d'
+) -> tuple:
+    """Return the response namedtuple; async version of doi_scr."""
+    dictionary = await get_crossref_dict_async(extract_doi(doi_or_url, pure))
+    return crossref_dict_to_scr(dictionary, date_format)
+
+
+def extract_doi(doi_or_url, pure: bool) -> str:
     if pure:
-        doi = doi_or_url
-    else:
-        # unescape '&amp;', '&lt;', and '&gt;' in doi_or_url
-        # decode percent encodings
-        decoded_url = unquote(unescape(doi_or_url))
-        doi = DOI_SEARCH(decoded_url)[0]
-    dictionary = get_crossref_dict(doi)
+        return doi_or_url
+    # unescape '&amp;', '&lt;', and '&gt;' in doi_or_url
+    # decode percent encodings
+    decoded_url = unquote(unescape(doi_or_url))
+    return DOI_SEARCH(decoded_url)[0]
+
+
+def crossref_dict_to_scr(dictionary: defaultdict, date_format) -> tuple:
     dictionary['date_format'] = date_format
     if LANG == 'fa':
         dictionary['language'] = classify(dictionary['title'])[0]
     return dict_to_sfn_cit_ref(dictionary)
 
 
+# Force using the version 1 of the API to prevent breakage. See:
+# https://github.com/CrossRef/rest-api-doc/blob/master/rest_api.md#how-to-manage-api-versions
+CROSSREF_WORKS_URL = 'http://api.crossref.org/v1/works'
+# The maximum number of DOIs in a single filter=doi:... query
+CROSSREF_BATCH_SIZE = 20
+# Lowercase DOI -> Task of the bulk query that includes the DOI.
+# See prefetch_crossref_dicts.
+CROSSREF_PREFETCHES = TTLCache(maxsize=4096, ttl=60)
+
+
 def get_crossref_dict(doi) -> defaultdict:
-    """Return the parsed data of crossref.org for the given DOI."""
+    """Return the parsed data of crossref.org for the given DOI.
+
+    Use the result of a bulk query if prefetch_crossref_dicts was called for
+    the DOI, otherwise query the DOI on its own.
+    """
+    task = CROSSREF_PREFETCHES.get(doi.lower(), None)
+    if task is not None:
+        messages = result_or_none(task, remaining())
+        if messages:
+            message = messages.get(doi.lower())
+            if message is not None:
+                return crossref_message_to_dict(message)
     # See https://github.com/CrossRef/rest-api-doc/blob/master/api_format.md
     # for documentation.
-    # Force using the version 1 of the API to prevent breakage. See:
-    # https://github.com/CrossRef/rest-api-doc/blob/master/rest_api.md#how-to-manage-api-versions
-    j = request('http://api.crossref.org/v1/works/' + doi).json()
+    j = request(CROSSREF_WORKS_URL + '/' + doi).json()
+    assert j['status'] == 'ok'
+    return crossref_message_to_dict(j['message'])
+
+
+async def get_crossref_dict_async(doi) -> defaultdict:
+    """Return the parsed data of crossref.org for the given DOI.
+
+    Async version of get_crossref_dict, using its prefetched bulk results.
+    """
+    task = CROSSREF_PREFETCHES.get(doi.lower(), None)
+    if task is not None:
+        messages = await result_or_none_async(task, remaining())
+        if messages:
+            message = messages.get(doi.lower())
+            if message is not None:
+                return crossref_message_to_dict(message)
+    j = (await async_request(CROSSREF_WORKS_URL + '/' + doi)).json()
+    assert j['status'] == 'ok'
+    return crossref_message_to_dict(j['message'])
+
+
+def get_crossref_messages(dois: Iterable[str]) -> Dict[str, dict]:
+    """Query the DOIs at once and return the works keyed by lowercase DOI.
+
+    DOIs that are not registered at crossref are missing from the result.
+    """
+    dois = [*dois]
+    j = request(
+        CROSSREF_WORKS_URL + '?rows=' + str(len(dois)) + '&filter='
+        + ','.join('doi:' + quote(doi, safe='/') for doi in dois)).json()
     assert j['status'] == 'ok'
-    d = defaultdict(
-        lambda: None, {k.lower(): v for k, v in j['message'].items()})
+    return {item['DOI'].lower(): item for item in j['message']['items']}
+
+
+def prefetch_crossref_dicts(dois: Iterable[str]) -> None:
+    """Start bulk queries for the DOIs without waiting for them.
+
+    Later get_crossref_dict calls for these DOIs use the bulk results.
+    """
+    # commas separate the filters and cannot be part of a batched DOI
+    pending = sorted({
+        doi for doi in map(str.lower, dois)
+        if ',' not in doi and CROSSREF_PREFETCHES.get(doi, None) is None})
+    for i in range(0, len(pending), CROSSREF_BATCH_SIZE):
+        chunk = pending[i:i + CROSSREF_BATCH_SIZE]
+        if len(chunk) == 1:  # a bulk query has no benefit
+            continue
+        task = submit('crossref', get_crossref_messages, chunk)
+        for doi in chunk:
+            CROSSREF_PREFETCHES.set(doi, task)
+
+
+def crossref_message_to_dict(message: dict) -> defaultdict:
+    """Convert a crossref work to the dictionary used by sfn_cit_ref."""
+    d = defaultdict(lambda: None, {k.lower(): v for k, v in message.items()})
 
     d['cite_type'] = d.pop('type')
 
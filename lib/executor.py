@@ -0,0 +1,349 @@
+"""A process-wide thread pool shared by all resolvers.
+
+Use submit() instead of creating threads. Each task belongs to a group
+(usually the name of the resolver module) and the number of tasks of a group
+that run at the same time is limited by GROUP_LIMITS. Tasks over the limit
+wait in a queue of their group and are passed to the pool when a slot of the
+group frees, so they do not occupy pool workers that other groups need.
+"""
+
+from asyncio import CancelledError, TimeoutError as AsyncTimeoutError, \
+    shield, wait_for, wrap_future
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from contextvars import copy_context
+from logging import getLogger
+from threading import Condition, Lock
+from typing import Any, Callable, Deque, Dict, Optional, Set
+
+from lib.deadline import deadline, remaining
+from lib.profiling import call as profiling_call
+
+
+MAX_WORKERS = 64
+GROUP_LIMITS = {
+    'crossref': 4,
+    'isbn': 16,
+    'jstor': 8,
+    'noormags': 8,
+    'pubmed': 16,
+    'urls': 32,
+    'waybackmachine': 16,
+}
+DEFAULT_GROUP_LIMIT = 16
+
+EXECUTOR = ThreadPoolExecutor(MAX_WORKERS, thread_name_prefix='citer')
+
+# the states of a Task
+_PENDING, _DISPATCHED, _STARTED, _CANCELLED = range(4)
+
+_lock = Lock()
+# notified when a slot is freed for a thread waiting to run a task inline
+_slot_freed = Condition(_lock)
+_groups: Dict[str, '_Group'] = {}
+
+
+class _Group:
+
+    """The slots and queued tasks of a group. Use only while holding _lock."""
+
+    __slots__ = ('limit', 'slots', 'pending', 'dispatched', 'waiting', 'stats')
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        # the number of tasks that are dispatched to the pool or running
+        self.slots = 0
+        # tasks waiting for a slot; tasks that were started inline or
+        # cancelled meanwhile are skipped when they are reached
+        self.pending: Deque[Task] = deque()
+        # tasks passed to the pool that no worker has started yet
+        self.dispatched: Set[Task] = set()
+        # the number of threads waiting for a slot to run a task inline
+        self.waiting = 0
+        self.stats = dict.fromkeys(
+            ('queued', 'running', 'completed', 'cancelled'), 0)
+
+    def dispatch(self, task: 'Task') -> None:
+        """Pass the task to the pool; it must already have a slot."""
+        task._state = _DISPATCHED
+        self.dispatched.add(task)
+        task._job = EXECUTOR.submit(task._run_dispatched)
+
+    def acquire(self) -> None:
+        """Take a slot for running a task in the calling thread."""
+        while self.slots >= self.limit:
+            # the slot of a task that no worker has started yet can be
+            # taken over; otherwise a pool full of waiting callers could
+            # never start the task that would free a slot
+            for task in self.dispatched:
+                if task._job.cancel():
+                    self.dispatched.remove(task)
+                    task._state = _PENDING
+                    self.pending.appendleft(task)
+                    return
+            self.waiting += 1
+            try:
+                _slot_freed.wait()
+            finally:
+                self.waiting -= 1
+        self.slots += 1
+
+    def release(self) -> None:
+        """Pass the slot of a finished task to the next one."""
+        if self.waiting:
+            self.slots -= 1
+            _slot_freed.notify_all()
+            return
+        pending = self.pending
+        while pending:
+            task = pending.popleft()
+            if task._state is _PENDING and not task._drop_if_cancelled():
+                self.dispatch(task)
+                return
+        self.slots -= 1
+
+
+def _group_state(group: str) -> _Group:
+    """Return the state of the group. Call only while holding _lock."""
+    state = _groups.get(group)
+    if state is None:
+        state = _groups[group] = _Group(
+            GROUP_LIMITS.get(group, DEFAULT_GROUP_LIMIT))
+    return state
+
+
+class Task:
+
+    """A submitted call. Use result() to wait for its return value.
+
+    If the task has not been started by a pool worker when result() is
+    called, it is run in the calling thread. This prevents deadlocks when
+    tasks wait for other tasks while all workers are busy.
+    """
+
+    __slots__ = (
+        'group', 'future', '_context', '_fn', '_args', '_state', '_job')
+
+    def __init__(self, group: str, fn: Callable, args: tuple):
+        self.group = group
+        self._context = copy_context()
+        self._fn = fn
+        self._args = args
+        self.future = Future()
+        self._state = _PENDING
+        # the pool future of _run_dispatched while the task is dispatched
+        self._job: Optional[Future] = None
+
+    def _cancelled(self) -> None:
+        """Mark the task as cancelled. Call only while holding _lock."""
+        self._state = _CANCELLED
+        stats = _groups[self.group].stats
+        stats['queued'] -= 1
+        stats['cancelled'] += 1
+
+    def _drop_if_cancelled(self) -> bool:
+        """Return True and mark the task if its future was cancelled.
+
+        The future is cancelled e.g. by asyncio.wrap_future. Call only while
+        holding _lock.
+        """
+        if not self.future.cancelled():
+            return False
+        self.future.set_running_or_notify_cancel()
+        self._cancelled()
+        return True
+
+    def _start(self) -> bool:
+        """Mark the task as running. Call only while holding _lock."""
+        if self._drop_if_cancelled():
+            return False
+        # the future may be cancelled since the check above
+        if not self.future.set_running_or_notify_cancel():
+            self._cancelled()
+            return False
+        self._state = _STARTED
+        stats = _groups[self.group].stats
+        stats['queued'] -= 1
+        stats['running'] += 1
+        return True
+
+    def _run_dispatched(self) -> None:
+        with _lock:
+            group = _groups[self.group]
+            group.dispatched.discard(self)
+            started = self._start()
+            if not started:
+                group.release()
+        if started:
+            self._run()
+
+    def _run(self, timeout: Optional[float] = None) -> None:
+        """Call fn in the context of submit() and set the future."""
+        error = None
+        try:
+            if timeout is None:
+                result = self._context.run(
+                    profiling_call, self._fn, *self._args)
+            else:
+                result = self._context.run(self._call_within, timeout)
+        except BaseException as e:
+            error = e
+        with _lock:
+            group = _groups[self.group]
+            group.stats['running'] -= 1
+            group.stats['completed'] += 1
+            group.release()
+        if error is None:
+            # noinspection PyUnboundLocalVariable
+            self.future.set_result(result)
+        else:
+            self.future.set_exception(error)
+
+    def _call_within(self, timeout: float) -> Any:
+        """Call fn with its outbound calls limited to timeout seconds."""
+        left = remaining()
+        if left is not None and left < timeout:
+            timeout = left
+        with deadline(timeout):
+            return profiling_call(self._fn, *self._args)
+
+    def _claim(self) -> bool:
+        """Take the task and a slot to run it in the calling thread.
+
+        Return False if the task is running, done, or cancelled. Call only
+        while holding _lock.
+        """
+        group = _groups[self.group]
+        state = self._state
+        if state is _DISPATCHED:
+            if not self._job.cancel():  # a worker is starting it
+                return False
+            # and keep its slot
+            group.dispatched.discard(self)
+        elif state is _PENDING:
+            if self._drop_if_cancelled():
+                return False
+            # so that it is not dispatched while waiting for a slot
+            self._state = _STARTED
+            group.acquire()
+        else:
+            return False
+        if self._start():
+            return True
+        group.release()
+        return False
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """Return the result of the call or raise its exception.
+
+        Raise concurrent.futures.TimeoutError if the task does not finish
+        within timeout seconds. A task that is run in the calling thread
+        cannot be interrupted; instead its outbound calls get a deadline of
+        timeout seconds (see lib.deadline).
+        """
+        with _lock:
+            inline = self._claim()
+        if inline:
+            self._run(timeout)
+        return self.future.result(timeout)
+
+    def cancel(self) -> bool:
+        """Cancel the task if it has not started yet."""
+        with _lock:
+            state = self._state
+            if state is _CANCELLED:
+                return True
+            if state is _DISPATCHED:
+                if not self._job.cancel():
+                    return False
+                group = _groups[self.group]
+                group.dispatched.discard(self)
+                group.release()
+            elif state is not _PENDING:
+                return False
+            # also True if the future was already cancelled, e.g. by
+            # asyncio.wrap_future
+            self.future.cancel()
+            self.future.set_running_or_notify_cancel()
+            self._cancelled()
+            return True
+
+    def done(self) -> bool:
+        return self.future.done()
+
+
+def submit(group: str, fn: Callable, *args) -> Task:
+    """Schedule fn(*args) to run in the shared pool and return its Task.
+
+    The task runs in a copy of the current context, so context variables of
+    the caller are visible to fn.
+    """
+    task = Task(group, fn, args)
+    with _lock:
+        state = _group_state(group)
+        state.stats['queued'] += 1
+        if state.slots < state.limit:
+            state.slots += 1
+            state.dispatch(task)
+        else:
+            state.pending.append(task)
+    return task
+
+
+async def run_async(group: str, fn: Callable, *args) -> Any:
+    """Run fn(*args) as a task of the shared pool and await its result.
+
+    Use it in coroutines for blocking calls that have no async version.
+    """
+    task = submit(group, fn, *args)
+    try:
+        return await wrap_future(task.future)
+    except CancelledError:
+        task.cancel()
+        raise
+
+
+def result_or_none(task: Task, timeout: Optional[float] = None) -> Any:
+    """Return the result of the task, or None if it failed or timed out.
+
+    A task that has not started when the timeout expires is cancelled; a
+    running task cannot be stopped and its result is discarded. Exceptions
+    are logged.
+    """
+    # noinspection PyBroadException
+    try:
+        return task.result(timeout)
+    except TimeoutError:
+        task.cancel()
+        logger.warning('%s task timed out', task.group)
+    except Exception:
+        logger.exception('%s task failed', task.group)
+
+
+async def result_or_none_async(
+    task: Task, timeout: Optional[float] = None,
+) -> Any:
+    """Await the result of the task; async version of result_or_none.
+
+    A task that has not started is not run inline, which would block the
+    event loop.
+    """
+    # noinspection PyBroadException
+    try:
+        return await wait_for(shield(wrap_future(task.future)), timeout)
+    except AsyncTimeoutError:
+        task.cancel()
+        logger.warning('%s task timed out', task.group)
+    except CancelledError:  # an Exception before Python 3.8
+        raise
+    except Exception:
+        logger.exception('%s task failed', task.group)
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Return a snapshot of the queue depth and counters of each group."""
+    with _lock:
+        return {group: {**s.stats} for group, s in _groups.items()}
+
+
+logger = getLogger(__name__)
@@ -3,11 +3,10 @@
 
 from urllib.parse import parse_qs, urlparse
 
-from langid import classify
 
 from lib.commons import request
 from lib.ris import ris_parse
-from lib.commons import dict_to_sfn_cit_ref
+from lib.commons import classify, dict_to_sfn_cit_ref
 
 
 def googlebooks_scr(parsed_url, date_format='%Y-%m-%d') -> tuple:
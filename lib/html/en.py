@@ -30,6 +30,12 @@ OTHER_EXCEPTION_SCR = (
     '',
     '')
 
+OVERLOADED_SCR = (
+    'Service overloaded.',
+    'Too many citations are being created at this moment. '
+    'Please try again in a few seconds.',
+    '')
+
 CSS = open(f'{htmldir}/en.css', 'rb').read()
 CSS_HEADERS = [
     ('Content-Type', 'text/css; charset=UTF-8'),
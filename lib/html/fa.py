@@ -39,6 +39,11 @@ UNDEFINED_INPUT_SCR = (
     'ورودی تجزیه‌ناپذیر',
     'پوزش، ورودی قابل پردازش نبود. خطا در سیاهه ثبت شد.',
     '')
+OVERLOADED_SCR = (
+    'سرور شلوغ است',
+    'در این لحظه یادکردهای زیادی در حال ساخت است. '
+    'لطفاً چند ثانیه دیگر دوباره تلاش کنید.',
+    '')
 
 
 def scr_to_html(sfn_cit_ref: tuple, date_format: str, input_type: str):
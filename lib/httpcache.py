@@ -0,0 +1,218 @@
+"""Persistent cache of outbound HTTP responses stored in an SQLite file.
+
+Freshness is determined from the Cache-Control (max-age, no-cache, no-store)
+and Expires headers of the responses, falling back to a default lifetime.
+Stale entries having an ETag or Last-Modified header are revalidated using a
+conditional request.
+"""
+
+from email.utils import parsedate_to_datetime
+from hashlib import sha1
+from json import dumps, loads
+from logging import getLogger
+from sqlite3 import connect, Error as SQLiteError
+from threading import local
+from time import time
+from typing import Callable, Optional, Tuple
+from urllib.parse import urlparse
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+
+# Hosts whose responses are cached. Suffixes are matched against hostnames.
+CACHEABLE_HOST_SUFFIXES = (
+    'api.crossref.org',
+    'eutils.ncbi.nlm.nih.gov',
+    'ottobib.com',
+    'worldcat.org',
+    'jstor.org',
+    'noormags.ir',
+    'noormags.net',
+)
+# Google Books has many country-specific domains, e.g. books.google.co.uk
+CACHEABLE_HOST_PREFIXES = ('books.google.',)
+
+# Headers of a 304 response that replace the stored ones
+REVALIDATION_HEADERS = (
+    'cache-control', 'date', 'etag', 'expires', 'last-modified')
+
+# Entries are pruned (oldest first) every PRUNE_INTERVAL writes.
+PRUNE_INTERVAL = 100
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status_code INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    encoding TEXT,
+    content BLOB NOT NULL,
+    stored_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+)'''
+
+
+def is_cacheable_host(url: str) -> bool:
+    hostname = urlparse(url).hostname or ''
+    return hostname.endswith(CACHEABLE_HOST_SUFFIXES) \
+        or hostname.startswith(CACHEABLE_HOST_PREFIXES)
+
+
+def cache_key(method: str, url: str, body) -> str:
+    return sha1(f'{method.upper()} {url} {body!r}'.encode()).hexdigest()
+
+
+def freshness_lifetime(headers, default_ttl: float) -> Optional[float]:
+    """Return the number of seconds the response is fresh.
+
+    Return None if the response must not be stored at all.
+    """
+    directives = {}
+    for directive in headers.get('cache-control', '').lower().split(','):
+        name, _, value = directive.strip().partition('=')
+        directives[name] = value.strip('"')
+    if 'no-store' in directives:
+        return None
+    if 'no-cache' in directives:
+        return 0
+    max_age = directives.get('max-age')
+    if max_age is not None:
+        try:
+            return max(int(max_age), 0)
+        except ValueError:
+            return 0
+    expires = headers.get('expires')
+    if expires:
+        try:
+            return max(parsedate_to_datetime(expires).timestamp() - time(), 0)
+        except (TypeError, ValueError):
+            return 0
+    return default_ttl
+
+
+class HTTPCache:
+
+    """Cache of responses keyed by method, URL, and request body."""
+
+    def __init__(self, path: str, default_ttl: float, max_entries: int):
+        self.path = path
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.hits = self.misses = self.revalidations = 0
+        self._writes = 0
+        self._local = local()  # sqlite3 connections are per thread
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = connect(self.path, timeout=5)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(SCHEMA)
+        return db
+
+    def request(
+        self, send: Callable[..., Response], method: str, url: str,
+        headers: dict, **kwargs
+    ) -> Response:
+        """Return the cached response or use send to get and store it."""
+        key, cached, fresh, headers = self.lookup(
+            method, url, headers, kwargs.get('data') or kwargs.get('json'))
+        if fresh:
+            return cached
+        return self.update(
+            key, cached, send(method, url, headers=headers, **kwargs))
+
+    def lookup(
+        self, method: str, url: str, headers: dict, body=None,
+    ) -> Tuple[Optional[str], Optional[Response], bool, dict]:
+        """Return (key, cached response, is fresh, headers to send).
+
+        If the cached response is stale, the returned headers make the
+        request conditional. key is None if the cache could not be read.
+        Pass the response of a request that is sent to update().
+        """
+        key = cache_key(method, url, body)
+        try:
+            row = self._db.execute(
+                'SELECT url, status_code, headers, encoding, content, '
+                'expires_at FROM responses WHERE key = ?', (key,)).fetchone()
+        except SQLiteError:
+            logger.exception('could not read %s', self.path)
+            return None, None, False, headers
+        if row is None:
+            return key, None, False, headers
+        cached = cached_response(*row[:5])
+        if row[5] > time():
+            self.hits += 1
+            return key, cached, True, headers
+        etag = cached.headers.get('etag')
+        last_modified = cached.headers.get('last-modified')
+        if etag or last_modified:
+            headers = {**headers}
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return key, cached, False, headers
+
+    def update(self, key: Optional[str], cached: Optional[Response], response):
+        """Store the response of a lookup and return the one to use."""
+        if key is None:
+            return response
+        if response.status_code == 304 and cached is not None:
+            self.revalidations += 1
+            cached_headers = cached.headers
+            for name in REVALIDATION_HEADERS:
+                value = response.headers.get(name)
+                if value is not None:
+                    cached_headers[name] = value
+            self._store(key, cached)
+            return cached
+        self.misses += 1
+        if response.status_code == 200:
+            self._store(key, response)
+        return response
+
+    def _store(self, key: str, response) -> None:
+        headers = response.headers
+        lifetime = freshness_lifetime(headers, self.default_ttl)
+        if lifetime is None or not (
+            lifetime or 'etag' in headers or 'last-modified' in headers
+        ):
+            return
+        now = time()
+        db = self._db
+        try:
+            with db:
+                db.execute(
+                    'INSERT OR REPLACE INTO responses VALUES '
+                    '(?, ?, ?, ?, ?, ?, ?, ?)', (
+                        key, response.url, response.status_code,
+                        dumps({**headers}), response.encoding,
+                        response.content, now, now + lifetime))
+                self._writes += 1
+                if self._writes % PRUNE_INTERVAL == 0:
+                    db.execute(
+                        'DELETE FROM responses WHERE key IN (SELECT key '
+                        'FROM responses ORDER BY stored_at DESC '
+                        'LIMIT -1 OFFSET ?)', (self.max_entries,))
+        except SQLiteError:
+            logger.exception('could not write %s', self.path)
+
+
+def cached_response(
+    url: str, status_code: int, headers: str, encoding: Optional[str],
+    content: bytes,
+) -> Response:
+    response = Response()
+    response.url = url
+    response.status_code = status_code
+    response.headers = CaseInsensitiveDict(loads(headers))
+    response.encoding = encoding
+    response._content = content
+    return response
+
+
+logger = getLogger(__name__)
@@ -1,19 +1,23 @@
 """Define functions to process ISBNs and OCLC numbers."""
 
 # from collections import defaultdict
+from asyncio import create_task
 from logging import getLogger
-from threading import Thread
 from typing import Optional
 
-from langid import classify
 from regex import compile as regex_compile, DOTALL
+from requests import RequestException
 
 from config import LANG
 from lib.ketabir import url2dictionary as ketabir_url2dictionary
 from lib.ketabir import isbn2url as ketabir_isbn2url
+from lib.asynchttp import request as async_request
 from lib.bibtex import parse as bibtex_parse
-from lib.commons import dict_to_sfn_cit_ref, request, ISBN13_SEARCH, \
-    ISBN10_SEARCH
+from lib.commons import classify, dict_to_sfn_cit_ref, request, \
+    ISBN13_SEARCH, ISBN10_SEARCH
+from lib.circuitbreaker import CircuitOpenError
+from lib.deadline import DeadlineExceeded, remaining
+from lib.executor import submit, result_or_none, run_async
 from lib.ris import ris_parse
 
 
@@ -36,46 +40,77 @@ def isbn_scr(
     isbn_container_str: str, pure: bool = False, date_format: str = '%Y-%m-%d'
 ) -> tuple:
     """Create the response namedtuple."""
+    isbn = find_isbn(isbn_container_str, pure)
+
+    ketabir_task = submit('isbn', get_ketabir_dict, isbn)
+    citoid_task = submit('isbn', get_citoid_dict, isbn)
+
+    # ketab.ir alone is used if ottobib is not available
+    try:
+        ottobib_bibtex = ottobib(isbn)
+    except DeadlineExceeded:
+        raise
+    except CircuitOpenError:
+        ottobib_bibtex = None
+    except RequestException:
+        logger.exception('isbn: %s', isbn)
+        ottobib_bibtex = None
+
+    return isbn_dicts_to_scr(
+        result_or_none(ketabir_task, remaining()),
+        ottobib_bibtex,
+        result_or_none(citoid_task, remaining()),
+        date_format)
+
+
+async def isbn_scr_async(
+    isbn_container_str: str, pure: bool = False, date_format: str = '%Y-%m-%d'
+) -> tuple:
+    """Create the response namedtuple; async version of isbn_scr."""
+    isbn = find_isbn(isbn_container_str, pure)
+
+    # ketab.ir is queried using mechanicalsoup which has no async API
+    ketabir_task = create_task(run_async('isbn', get_ketabir_dict, isbn))
+    citoid_task = create_task(get_citoid_dict_async(isbn))
+
+    try:
+        ottobib_bibtex = await ottobib_async(isbn)
+    except DeadlineExceeded:
+        raise
+    except CircuitOpenError:
+        ottobib_bibtex = None
+    except RequestException:
+        logger.exception('isbn: %s', isbn)
+        ottobib_bibtex = None
+
+    return isbn_dicts_to_scr(
+        await ketabir_task, ottobib_bibtex, await citoid_task, date_format)
+
+
+def find_isbn(isbn_container_str: str, pure: bool) -> str:
     if pure:
-        isbn = isbn_container_str
-    else:
-        # search for isbn13
-        m = ISBN13_SEARCH(isbn_container_str)
-        if m is not None:
-            isbn = m[0]
-        else:
-            # search for isbn10
-            m = ISBN10_SEARCH(isbn_container_str)
-            isbn = m[0]
-
-    ketabir_result_list = []
-    ketabir_thread = Thread(
-        target=ketabir_thread_target,
-        args=(isbn, ketabir_result_list))
-    ketabir_thread.start()
-
-    citoid_result_list = []
-    citoid_thread = Thread(
-        target=citoid_thread_target,
-        args=(isbn, citoid_result_list))
-    citoid_thread.start()
-
-    ottobib_bibtex = ottobib(isbn)
+        return isbn_container_str
+    # search for isbn13
+    m = ISBN13_SEARCH(isbn_container_str)
+    if m is not None:
+        return m[0]
+    # search for isbn10
+    return ISBN10_SEARCH(isbn_container_str)[0]
+
+
+def isbn_dicts_to_scr(
+    ketabir_dict: Optional[dict], ottobib_bibtex: Optional[str],
+    citoid_dict: Optional[dict], date_format: str,
+) -> tuple:
     if ottobib_bibtex:
         otto_dict = bibtex_parse(ottobib_bibtex)
     else:
         otto_dict = None
 
-    ketabir_thread.join()
-    if ketabir_result_list:
-        ketabir_dict = ketabir_result_list[0]
-    else:
-        ketabir_dict = None
     dictionary = choose_dict(ketabir_dict, otto_dict)
 
-    citoid_thread.join()
-    if citoid_result_list:
-        dictionary['oclc'] = citoid_result_list[0]['oclc']
+    if citoid_dict:
+        dictionary['oclc'] = citoid_dict['oclc']
 
     dictionary['date_format'] = date_format
     if 'language' not in dictionary:
@@ -83,15 +118,13 @@ def isbn_scr(
     return dict_to_sfn_cit_ref(dictionary)
 
 
-def ketabir_thread_target(isbn: str, result: list) -> None:
+def get_ketabir_dict(isbn: str) -> Optional[dict]:
     # noinspection PyBroadException
     try:
         url = ketabir_isbn2url(isbn)
         if url is None:  # ketab.ir does not have any entries for this isbn
             return
-        d = ketabir_url2dictionary(url)
-        if d:
-            result.append(d)
+        return ketabir_url2dictionary(url) or None
     except Exception:
         logger.exception('isbn: %s', isbn)
         return
@@ -147,10 +180,18 @@ def get_citoid_dict(isbn) -> Optional[dict]:
     # return d
 
 
-def citoid_thread_target(isbn: str, result: list) -> None:
-    citoid_dict = get_citoid_dict(isbn)
-    if citoid_dict:
-        result.append(citoid_dict)
+async def get_citoid_dict_async(isbn) -> Optional[dict]:
+    """Async version of get_citoid_dict, return None on failures."""
+    # noinspection PyBroadException
+    try:
+        r = await async_request(
+            'https://en.wikipedia.org/api/rest_v1/data/citation/mediawiki/'
+            + isbn)
+        if r.status_code != 200:
+            return
+        return r.json()[0]
+    except Exception:
+        logger.exception('citoid isbn: %s', isbn)
 
 
 def ottobib(isbn):
@@ -161,6 +202,14 @@ def ottobib(isbn):
         return m[1]
 
 
+async def ottobib_async(isbn):
+    """Convert ISBN to bibtex using ottobib.com."""
+    m = OTTOBIB_SEARCH((await async_request(
+        'http://www.ottobib.com/isbn/' + isbn + '/bibtex')).content.decode())
+    if m is not None:
+        return m[1]
+
+
 def oclc_scr(oclc: str, date_format: str = '%Y-%m-%d') -> tuple:
     text = request(
         'https://www.worldcat.org/oclc/' + oclc + '?page=endnote'
@@ -1,25 +1,53 @@
-from threading import Thread
+from asyncio import gather
+from logging import getLogger
 from urllib.parse import urlparse
 
+from lib.asynchttp import request as async_request
 from lib.commons import request, dict_to_sfn_cit_ref
+from lib.deadline import remaining
+from lib.executor import submit, result_or_none
 from lib.bibtex import parse as bibtex_parse
 
 
 def jstor_scr(url: str, date_format: str = '%Y-%m-%d') -> tuple:
-    open_access = []
-    thread = Thread(target=is_open_access, args=(url, open_access))
-    thread.start()
+    open_access_task = submit('jstor', is_open_access, url)
     id_ = urlparse(url).path.rpartition('/')[2]
     bibtex = request('https://www.jstor.org/citation/text/' + id_).content.decode('utf8')
     dictionary = bibtex_parse(bibtex)
     dictionary['jstor'] = id_
     dictionary['date_format'] = date_format
-    thread.join()
+    if result_or_none(open_access_task, remaining()):
+        dictionary['jstor-access'] = 'free'
+    return dict_to_sfn_cit_ref(dictionary)
+
+
+async def jstor_scr_async(url: str, date_format: str = '%Y-%m-%d') -> tuple:
+    """Async version of jstor_scr."""
+    id_ = urlparse(url).path.rpartition('/')[2]
+    bibtex_response, open_access = await gather(
+        async_request('https://www.jstor.org/citation/text/' + id_),
+        is_open_access_async(url))
+    dictionary = bibtex_parse(bibtex_response.content.decode('utf8'))
+    dictionary['jstor'] = id_
+    dictionary['date_format'] = date_format
     if open_access:
         dictionary['jstor-access'] = 'free'
     return dict_to_sfn_cit_ref(dictionary)
 
 
-def is_open_access(url: str, result: list):
-    if '"openAccess" : "True"' in request(url, spoof=True).text:
-        result.append(True)
+def is_open_access(url: str) -> bool:
+    return '"openAccess" : "True"' in request(url, spoof=True).text
+
+
+async def is_open_access_async(url: str) -> bool:
+    # like result_or_none in jstor_scr, failures only lose the access flag
+    # noinspection PyBroadException
+    try:
+        return '"openAccess" : "True"' in (
+            await async_request(url, spoof=True)).text
+    except Exception:
+        logger.exception('jstor open access check failed: %s', url)
+        return False
+
+
+logger = getLogger(__name__)
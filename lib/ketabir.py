@@ -4,12 +4,15 @@ from collections import defaultdict
 from logging import getLogger
 from typing import Optional
 
-from langid import classify
 from regex import compile as regex_compile
-from requests import RequestException
+from requests import ConnectionError as RequestsConnectionError, \
+    RequestException, Timeout
 from mechanicalsoup import StatefulBrowser
 
-from lib.commons import first_last, dict_to_sfn_cit_ref, request, USER_AGENT
+from lib.commons import (
+    classify, first_last, dict_to_sfn_cit_ref, request, USER_AGENT, TIMEOUT)
+from lib.circuitbreaker import breaker
+from lib.deadline import call_timeout, DeadlineExceeded
 
 
 ISBN_SEARCH = regex_compile(r'ISBN: </b> ([-\d]++)').search
@@ -38,12 +41,30 @@ def ketabir_scr(url: str, date_format='%Y-%m-%d') -> tuple:
 
 def isbn2url(isbn: str) -> Optional[str]:
     """Return the ketab.ir book-url for the given isbn."""
+    search_url = 'http://www.ketab.ir/Search.aspx'
+    host_breaker = breaker(search_url)
+    host_breaker.check()
     browser = StatefulBrowser(user_agent=USER_AGENT)
     # todo: check if this url still works
-    browser.open('http://www.ketab.ir/Search.aspx')
-    browser.select_form()
-    browser['ctl00$ContentPlaceHolder1$TxtIsbn'] = isbn
-    browser.submit_selected()
+    timeout = TIMEOUT
+    try:
+        timeout = call_timeout(TIMEOUT)
+        browser.open(search_url, timeout=timeout)
+        browser.select_form()
+        browser['ctl00$ContentPlaceHolder1$TxtIsbn'] = isbn
+        timeout = call_timeout(TIMEOUT)
+        browser.submit_selected(timeout=timeout)
+    except DeadlineExceeded:
+        raise
+    except RequestsConnectionError:
+        host_breaker.failed()
+        raise
+    except Timeout:
+        # a timeout shortened by the request deadline is not the host's fault
+        if timeout == TIMEOUT:
+            host_breaker.failed()
+        raise
+    host_breaker.succeeded()
     first_link = browser.get_current_page().select_one('.HyperLink2')
     if first_link is None:
         return
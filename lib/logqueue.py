@@ -0,0 +1,242 @@
+"""Logging that keeps file I/O off the request threads.
+
+QueueHandler merges the message, args, and traceback of a copy of each
+record, like logging.handlers.QueueHandler.prepare, and puts the copy in a
+bounded queue; a background thread formats it and writes it to a rotating
+file in batches, flushing once per batch. Repetitive tracebacks, e.g. of an
+upstream that is down, are sampled: one traceback per place and
+LOG_TRACEBACK_INTERVAL is kept and the other records of that place are
+queued without traceback.
+"""
+
+from atexit import register
+from copy import copy
+from logging import Formatter, Handler, LogRecord
+from logging.handlers import RotatingFileHandler
+from os import register_at_fork
+from os.path import abspath, splitext
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+
+from lib.settings import (
+    LOG_BACKUP_COUNT, LOG_MAX_BYTES, LOG_QUEUE_SIZE, LOG_TRACEBACK_INTERVAL)
+
+
+# The maximum number of records written before each flush
+BATCH_SIZE = 512
+# The maximum number of places whose tracebacks are tracked for sampling
+MAX_SAMPLED_PLACES = 1000
+
+
+class BatchFileHandler(RotatingFileHandler):
+
+    """A RotatingFileHandler that is flushed by the caller, per batch."""
+
+    def use_file(self, filename: str) -> None:
+        """Write to filename, and rotate it, from now on."""
+        self.acquire()
+        try:
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None
+            self.baseFilename = abspath(filename)
+        finally:
+            self.release()
+
+    def emit(self, record: LogRecord) -> None:
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class TracebackSampler:
+
+    """Decide which tracebacks of repeated errors are kept."""
+
+    __slots__ = ('interval', 'sampled_out', '_places', '_lock')
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.sampled_out = 0
+        # place -> [monotonic time of the last kept traceback, skipped]
+        self._places: Dict[Tuple, list] = {}
+        self._lock = Lock()
+
+    def sample(self, record: LogRecord) -> None:
+        """Remove the traceback of record if one was kept recently."""
+        exc_type, _, tb = record.exc_info
+        if tb is not None:
+            while tb.tb_next is not None:
+                tb = tb.tb_next
+            code = tb.tb_frame.f_code
+            place = (exc_type, code.co_filename, tb.tb_lineno)
+        else:
+            place = (exc_type, record.pathname, record.lineno)
+        now = monotonic()
+        with self._lock:
+            state = self._places.get(place)
+            if state is None:
+                if len(self._places) >= MAX_SAMPLED_PLACES:
+                    self._places.clear()
+                self._places[place] = [now, 0]
+                return
+            if now - state[0] >= self.interval:
+                skipped = state[1]
+                state[:] = now, 0
+                if skipped:
+                    record.msg = f'{record.msg}\n(the tracebacks of ' \
+                        f'{skipped} similar records were not logged)'
+                return
+            state[1] += 1
+            self.sampled_out += 1
+        record.exc_info = record.exc_text = None
+        record.msg = f'{record.msg}\n({exc_type.__name__}, ' \
+            'traceback not logged)'
+
+
+class QueueHandler(Handler):
+
+    """Put records in the queue of a Writer without blocking."""
+
+    def __init__(self, writer: 'Writer'):
+        super().__init__()
+        self.writer = writer
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        """Return a copy of record that holds no args or traceback.
+
+        The args may change before the writer thread formats the record, and
+        the traceback would keep the frames of the request alive until then.
+        Other handlers of the record see it unchanged.
+        """
+        record = copy(record)
+        if record.exc_info and record.exc_info[0] is not None:
+            self.writer.sampler.sample(record)
+        record.msg = record.message = self.format(record)
+        record.args = record.exc_info = record.exc_text = None
+        record.stack_info = None
+        return record
+
+    def emit(self, record: LogRecord) -> None:
+        writer = self.writer
+        try:
+            writer.queue.put_nowait(self.prepare(record))
+        except Full:
+            writer.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class Writer:
+
+    """The background thread that writes the queued records."""
+
+    def __init__(self, handler: Handler, queue_size: int):
+        self.handler = handler
+        self.queue_size = queue_size
+        self.dropped = self.written = 0
+        self.sampler: Optional[TracebackSampler] = None
+        self.queue: Optional[Queue] = None
+        self._thread: Optional[Thread] = None
+        self.start()
+        _writers.append(self)
+        # threads do not survive fork(), e.g. in lib.prefork workers
+        register_at_fork(after_in_child=self.start)
+        register(self.stop)
+
+    def start(self) -> None:
+        # the locks of the parent may be held by threads that are not
+        # copied to the child
+        self.sampler = TracebackSampler(LOG_TRACEBACK_INTERVAL)
+        self.queue = Queue(self.queue_size)
+        self._thread = Thread(
+            target=self.run, name='citer-log-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Write the queued records and stop the thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=1)
+        except Full:
+            return
+        self._thread.join(5)
+
+    def run(self) -> None:
+        queue, handler = self.queue, self.handler
+        while True:
+            record = queue.get()
+            batch = [record]
+            while record is not None and len(batch) < BATCH_SIZE:
+                try:
+                    record = queue.get_nowait()
+                except Empty:
+                    break
+                batch.append(record)
+            for record in batch:
+                if record is None:
+                    break
+                handler.handle(record)
+                self.written += 1
+            handler.flush()
+            if batch[-1] is None:
+                return
+
+    def stats(self) -> dict:
+        return {
+            'queued': self.queue.qsize(), 'written': self.written,
+            'dropped': self.dropped,
+            'tracebacks_sampled_out': self.sampler.sampled_out}
+
+
+_writers: List[Writer] = []
+
+
+def queue_handler(filename: str, formatter: Formatter) -> QueueHandler:
+    """Return a QueueHandler that writes to the rotating file filename."""
+    handler = BatchFileHandler(
+        filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+        encoding='utf-8', delay=True)
+    handler.setFormatter(formatter)
+    return QueueHandler(Writer(handler, LOG_QUEUE_SIZE))
+
+
+def split_files(suffix: str) -> None:
+    """Make the writers of this process write to files of their own.
+
+    Call it in forked processes, e.g. lib.prefork workers; separate processes
+    that rotate the same file lose or overwrite each other's records.
+    citer.log becomes citer-<suffix>.log.
+    """
+    for writer in _writers:
+        handler = writer.handler
+        if isinstance(handler, BatchFileHandler):
+            root, ext = splitext(handler.baseFilename)
+            handler.use_file(f'{root}-{suffix}{ext}')
+
+
+def stop() -> None:
+    """Write the queued records of all writers and stop their threads.
+
+    Call it before os._exit, which skips the atexit handlers.
+    """
+    for writer in _writers:
+        writer.stop()
+
+
+def stats() -> Dict[str, int]:
+    """Return the queued, written, and dropped record counts."""
+    totals = dict.fromkeys(
+        ('queued', 'written', 'dropped', 'tracebacks_sampled_out'), 0)
+    for writer in _writers:
+        for name, value in writer.stats().items():
+            totals[name] += value
+    return totals
@@ -0,0 +1,265 @@
+"""Counters and histograms exposed in the Prometheus text format.
+
+app() serves render() on the /metrics path. Besides the metrics defined
+here, render() reports the statistics of lib.executor, lib.ratelimit,
+lib.circuitbreaker, lib.connpool, lib.admission, and lib.logqueue, and
+the caches and single-flight groups added with add_cache() and
+add_flights().
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from threading import Lock
+from time import monotonic
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import urlparse
+
+from lib import admission, circuitbreaker, connpool, executor, logqueue, \
+    ratelimit
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 20)
+# Label values of upstream hosts; other hosts are reported as "other" to
+# keep the number of series bounded. Keys are matched like RATE_LIMITS keys.
+UPSTREAMS = {
+    'api.crossref.org': 'crossref',
+    'eutils.ncbi.nlm.nih.gov': 'eutils',
+    'ottobib.com': 'ottobib',
+    'ketab.ir': 'ketab.ir',
+    'worldcat.org': 'worldcat',
+    'jstor.org': 'jstor',
+    'noormags.ir': 'noormags',
+    'noormags.net': 'noormags',
+    'noorlib.ir': 'noorlib',
+    'noorlib.net': 'noorlib',
+    'books.google.': 'books.google',
+    'archive.org': 'archive.org',
+    'en.wikipedia.org': 'citoid',
+}
+
+# (name, type, help, [(name suffix, labels, value)])
+Family = Tuple[str, str, str, List[Tuple[str, Dict[str, str], float]]]
+
+
+class Counter:
+
+    __slots__ = ('name', 'help', 'labelnames', '_values', '_lock')
+
+    def __init__(self, name: str, help_: str, *labelnames: str):
+        self.name = name
+        self.help = help_
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def families(self) -> List[Family]:
+        with self._lock:
+            values = [*self._values.items()]
+        return [(self.name, 'counter', self.help, [
+            ('', dict(zip(self.labelnames, labels)), value)
+            for labels, value in values])]
+
+
+class Histogram:
+
+    __slots__ = ('name', 'help', 'labelnames', 'buckets', '_values', '_lock')
+
+    def __init__(
+        self, name: str, help_: str, *labelnames: str,
+        buckets: Tuple[float, ...] = BUCKETS,
+    ):
+        self.name = name
+        self.help = help_
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [count of each bucket (not cumulative), sum, count]
+        self._values: Dict[tuple, list] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            try:
+                counts, total, count = self._values[labels]
+            except KeyError:
+                counts, total, count = [0] * (len(self.buckets) + 1), 0, 0
+            counts[i] += 1
+            self._values[labels] = [counts, total + value, count + 1]
+
+    def families(self) -> List[Family]:
+        with self._lock:
+            values = [
+                (labels, [*counts], total, count)
+                for labels, (counts, total, count) in self._values.items()]
+        samples = []
+        for labels, counts, total, count in values:
+            labels = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                samples.append(
+                    ('_bucket', {**labels, 'le': str(bound)}, cumulative))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, count))
+        return [(self.name, 'histogram', self.help, samples)]
+
+
+RESOLVE_SECONDS = Histogram(
+    'citer_resolve_seconds',
+    'Duration of uncached lookups by input kind and resolver.',
+    'kind', 'resolver')
+UPSTREAM_SECONDS = Histogram(
+    'citer_upstream_request_seconds',
+    'Duration of outbound requests by upstream.', 'upstream')
+UPSTREAM_REQUESTS = Counter(
+    'citer_upstream_requests_total',
+    'Outbound requests by upstream and status class or exception.',
+    'upstream', 'outcome')
+ERRORS = Counter(
+    'citer_errors_total',
+    'Requests that failed, by exception class.', 'exception')
+
+METRICS = [RESOLVE_SECONDS, UPSTREAM_SECONDS, UPSTREAM_REQUESTS, ERRORS]
+
+_lock = Lock()
+# name -> an object having hits and misses attributes, e.g. TTLCache
+_caches: Dict[str, object] = {}
+# name -> lib.singleflight.SingleFlight or AsyncSingleFlight
+_flights: Dict[str, object] = {}
+
+
+def upstream(url: str) -> str:
+    """Return the upstream label of the host of url."""
+    hostname = (urlparse(url).hostname or '').lower()
+    for key, label in UPSTREAMS.items():
+        if key[-1] == '.':
+            if hostname.startswith(key):
+                return label
+        elif hostname == key or hostname.endswith('.' + key):
+            return label
+    return 'other'
+
+
+def observe_upstream(url: str, seconds: float, outcome: str) -> None:
+    """Record an outbound request; outcome is e.g. '2xx' or 'Timeout'."""
+    label = upstream(url)
+    UPSTREAM_SECONDS.observe(seconds, label)
+    UPSTREAM_REQUESTS.inc(label, outcome)
+
+
+@contextmanager
+def observe_resolve(kind: str, resolver: str):
+    """Record the duration and the exception, if any, of the block."""
+    started_at = monotonic()
+    try:
+        yield
+    except Exception as e:
+        ERRORS.inc(type(e).__name__)
+        raise
+    finally:
+        RESOLVE_SECONDS.observe(monotonic() - started_at, kind, resolver)
+
+
+def add_cache(name: str, cache) -> None:
+    """Report the hits and misses of cache."""
+    with _lock:
+        _caches[name] = cache
+
+
+def add_flights(name: str, flights) -> None:
+    """Report the calls and shared calls of a SingleFlight group."""
+    with _lock:
+        _flights[name] = flights
+
+
+def stats_families(
+    prefix: str, label: str, stats: Dict[str, dict], types: Dict[str, str],
+) -> List[Family]:
+    """Convert the stats() dict of a module to families.
+
+    types maps the keys of the inner dicts to 'counter' or 'gauge'.
+    """
+    families = []
+    for key, type_ in types.items():
+        name = prefix + key + ('_total' if type_ == 'counter' else '')
+        help_ = key.replace('_', ' ').capitalize()
+        families.append((name, type_, f'{help_} by {label}.', [
+            ('', {label: label_value}, s[key])
+            for label_value, s in stats.items()]))
+    return families
+
+
+def collect() -> Iterable[Family]:
+    for metric in METRICS:
+        yield from metric.families()
+    with _lock:
+        caches = [*_caches.items()]
+        flights = [*_flights.items()]
+    yield 'citer_cache_requests_total', 'counter', 'Cache lookups.', [
+        sample for name, cache in caches for sample in (
+            ('', {'cache': name, 'result': 'hit'}, cache.hits),
+            ('', {'cache': name, 'result': 'miss'}, cache.misses))]
+    yield from stats_families('citer_executor_', 'group', executor.stats(), {
+        'queued': 'gauge', 'running': 'gauge', 'completed': 'counter',
+        'cancelled': 'counter'})
+    yield from stats_families(
+        'citer_rate_limit_', 'limit', ratelimit.stats(), {
+            'calls': 'counter', 'delayed': 'counter', 'rejected': 'counter',
+            'wait': 'counter'})
+    breakers = circuitbreaker.stats()
+    yield (
+        'citer_circuit_open', 'gauge', 'Whether the circuit of a host is '
+        'open (1), half-open (0.5), or closed (0).', [
+            ('', {'host': host},
+             {'open': 1, 'half-open': .5}.get(s['state'], 0))
+            for host, s in breakers.items()])
+    yield from stats_families('citer_circuit_', 'host', breakers, {
+        'failures': 'gauge', 'short_circuited': 'counter'})
+    yield from stats_families(
+        'citer_connection_pool_', 'host', connpool.stats(), {
+            'hits': 'counter', 'misses': 'counter', 'discarded': 'counter',
+            'reaped': 'counter', 'tls_handshakes': 'counter'})
+    yield from stats_families(
+        'citer_admission_', 'kind', admission.stats(), {
+            'limit': 'gauge', 'in_flight': 'gauge', 'admitted': 'counter',
+            'rejected': 'counter', 'queue_time': 'counter',
+            'max_queue_time': 'gauge'})
+    for key, value in logqueue.stats().items():
+        if key == 'queued':
+            yield 'citer_log_records_queued', 'gauge', 'Log records ' \
+                'waiting to be written.', [('', {}, value)]
+        else:
+            yield f'citer_log_records_{key}_total', 'counter', \
+                f'Log records {key}.', [('', {}, value)]
+    yield 'citer_single_flight_calls_total', 'counter', \
+        'Calls of single-flight groups.', [
+            ('', {'group': name}, f.calls) for name, f in flights]
+    yield 'citer_single_flight_shared_total', 'counter', \
+        'Calls that waited for an identical call.', [
+            ('', {'group': name}, f.shared) for name, f in flights]
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace(
+        '"', r'\"')
+
+
+def render() -> bytes:
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    for name, type_, help_, samples in collect():
+        lines.append(f'# HELP {name} {help_}')
+        lines.append(f'# TYPE {name} {type_}')
+        for suffix, labels, value in samples:
+            if labels:
+                label_text = ','.join(
+                    f'{k}="{escape(v)}"' for k, v in labels.items())
+                lines.append(f'{name}{suffix}{{{label_text}}} {value}')
+            else:
+                lines.append(f'{name}{suffix} {value}')
+    return ('\n'.join(lines) + '\n').encode()
@@ -1,11 +1,16 @@
 """Codes specifically related to Noormags website."""
 
-from threading import Thread
+from asyncio import create_task
+from logging import getLogger
+from typing import Optional
 
 from regex import compile as regex_compile
 
+from lib.asynchttp import request as async_request
 from lib.commons import dict_to_sfn_cit_ref, request
 from lib.bibtex import parse as bibtex_parse
+from lib.deadline import remaining
+from lib.executor import submit, result_or_none
 from lib.ris import ris_parse
 
 
@@ -15,17 +20,32 @@ RIS_ARTICLE_ID_SEARCH = regex_compile(r'(?<=/citation/ris/)\d+').search
 
 def noormags_scr(url: str, date_format: str = '%Y-%m-%d') -> tuple:
     """Create the response namedtuple."""
-    ris_collection = {}
-    ris_thread = Thread(target=ris_fetcher_thread, args=(url, ris_collection))
-    ris_thread.start()
+    ris_task = submit('noormags', ris_fetcher, url)
     dictionary = bibtex_parse(get_bibtex(url))
     dictionary['date_format'] = date_format
     # language parameter needs to be taken from RIS
     # other information are more accurate in bibtex
     # for example: http://www.noormags.ir/view/fa/articlepage/104040
     # "IS  - 1" is wrong in RIS but "number = { 45 }," is correct in bibtex
-    ris_thread.join()
-    dictionary.update(ris_collection)
+    ris_collection = result_or_none(ris_task, remaining())
+    if ris_collection:
+        dictionary.update(ris_collection)
+    return dict_to_sfn_cit_ref(dictionary)
+
+
+async def noormags_scr_async(
+    url: str, date_format: str = '%Y-%m-%d'
+) -> tuple:
+    """Async version of noormags_scr. The article page is fetched once."""
+    page_text = (await async_request(url)).text
+    ris_task = create_task(ris_collection_async(page_text))
+    dictionary = bibtex_parse((await async_request(
+        'http://www.noormags.ir/view/fa/citation/bibtex/'
+        + BIBTEX_ARTICLE_ID_SEARCH(page_text)[0])).text)
+    dictionary['date_format'] = date_format
+    ris = await ris_task
+    if ris:
+        dictionary.update(ris)
     return dict_to_sfn_cit_ref(dictionary)
 
 
@@ -45,12 +65,33 @@ def get_ris(noormags_url):
         'http://www.noormags.ir/view/fa/citation/ris/' + article_id).text
 
 
-def ris_fetcher_thread(url, ris_collection):
-    """Fill the ris_dict. This function is called in a thread."""
-    ris_dict = ris_parse(get_ris(url))
+def ris_fetcher(url) -> dict:
+    """Return language and authors found in the ris data of the url."""
+    return ris_collection(get_ris(url))
+
+
+async def ris_collection_async(page_text: str) -> Optional[dict]:
+    """Return ris_collection of the article page or None on failure."""
+    # noinspection PyBroadException
+    try:
+        article_id = RIS_ARTICLE_ID_SEARCH(page_text)[0]
+        return ris_collection((await async_request(
+            'http://www.noormags.ir/view/fa/citation/ris/' + article_id)).text)
+    except Exception:
+        logger.exception('could not get the ris data of a noormags page')
+
+
+def ris_collection(ris: str) -> dict:
+    """Return language and authors found in the ris data."""
+    collection = {}
+    ris_dict = ris_parse(ris)
     language = ris_dict.get('language')
     if language:
-        ris_collection['language'] = language
+        collection['language'] = language
     authors = ris_dict.get('authors')
     if authors:
-        ris_collection['authors'] = authors
+        collection['authors'] = authors
+    return collection
+
+
+logger = getLogger(__name__)
@@ -0,0 +1,117 @@
+"""Pre-fork mode of lib.asgiserver.
+
+The parent process binds the listening socket, loads the langid model and
+everything else that can be loaded ahead of time, moves the loaded objects
+out of the reach of the garbage collector (gc.freeze) so that their pages
+stay shared copy-on-write, and then forks the workers. All workers accept
+connections from the same socket. Workers that die are replaced; SIGTERM or
+SIGINT is passed on to the workers for a graceful shutdown. Each worker
+logs to its own file (see lib.logqueue.split_files). The rate limits
+of lib.ratelimit and the admission limits of lib.admission are divided
+between the workers.
+"""
+
+from asyncio import run
+from gc import collect, freeze
+from logging import getLogger
+from os import _exit, cpu_count, fork, getpid, kill, wait
+from signal import SIG_DFL, SIGINT, SIGTERM, signal
+from socket import socket, SOL_SOCKET, SO_REUSEADDR
+from time import monotonic, sleep
+from typing import Callable, Dict, Tuple
+
+from langid.langid import load_model
+
+from lib.admission import share_limits as share_admission_limits
+from lib.asgiserver import Server
+from lib.logqueue import split_files as split_log_files, stop as stop_logging
+from lib.ratelimit import share_limits as share_rate_limits
+
+
+# Workers that exit sooner than this (seconds) are restarted after it
+MIN_WORKER_LIFETIME = 1
+
+
+def warm_up() -> None:
+    """Load what would otherwise be loaded lazily by each worker."""
+    load_model()  # langid.classify loads its model on first use
+    collect()
+    # objects created so far are not touched by the gc of the workers,
+    # otherwise their reference counts and gc headers would be copied
+    freeze()
+
+
+def bind(host: str, port: int, backlog: int = 1024) -> socket:
+    sock = socket()
+    sock.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def serve(app: Callable, host: str, port: int, workers: int) -> None:
+    """Serve app with `workers` processes, 0 means one per CPU core."""
+    serve_socket(app, bind(host, port), workers or cpu_count() or 1)
+
+
+def serve_socket(app: Callable, sock: socket, workers: int) -> None:
+    warm_up()
+    host, port = sock.getsockname()[:2]
+    # pid -> (worker number, monotonic start time)
+    children: Dict[int, Tuple[int, float]] = {}
+    stopping = False
+
+    def spawn(number: int) -> None:
+        pid = fork()
+        if pid:
+            children[pid] = number, monotonic()
+            return
+        # worker; lib.asgiserver.Server handles the signals itself
+        status = 1
+        try:
+            signal(SIGTERM, SIG_DFL)
+            signal(SIGINT, SIG_DFL)
+            split_log_files(str(number))
+            # the configured limits apply to all the workers together
+            share_rate_limits(workers)
+            share_admission_limits(workers)
+            run(Server(app, host, port, sock=sock).serve())
+            status = 0
+        except BaseException:
+            logger.exception('worker %d failed', getpid())
+        finally:
+            # _exit skips the atexit handlers that write the queued records
+            stop_logging()
+            _exit(status)
+
+    def stop(*_) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in [*children]:
+            kill(pid, SIGTERM)
+
+    logger.info('forking %d workers, serving on %s:%d', workers, host, port)
+    for number in range(1, workers + 1):
+        spawn(number)
+    signal(SIGTERM, stop)
+    signal(SIGINT, stop)
+    while children:
+        try:
+            pid, status = wait()
+        except ChildProcessError:
+            break
+        child = children.pop(pid, None)
+        if stopping or child is None:
+            continue
+        number, started_at = child
+        logger.error('worker %d exited with status %d', pid, status)
+        lifetime = monotonic() - started_at
+        if lifetime < MIN_WORKER_LIFETIME:
+            sleep(MIN_WORKER_LIFETIME - lifetime)
+        if not stopping:
+            spawn(number)
+    sock.close()
+
+
+logger = getLogger(__name__)
@@ -0,0 +1,112 @@
+"""Opt-in cProfile capture of single requests.
+
+profile() profiles the calling thread and the lib.executor tasks submitted
+from it (see call), then saves the merged pstats file in PROFILE_DIR and
+deletes the oldest files beyond PROFILE_MAX_FILES. Only one request is
+profiled at a time. Load the files with pstats.Stats or snakeviz.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from cProfile import Profile
+from glob import glob
+from hmac import compare_digest
+from logging import getLogger
+from os import makedirs, remove
+from os.path import getmtime, join
+from pstats import Stats
+from threading import Lock, local
+from typing import List, Optional
+from uuid import uuid4
+
+from lib.settings import PROFILE_DIR, PROFILE_MAX_FILES, PROFILE_TOKEN
+
+
+class Session:
+
+    """The profiles of the threads that worked on a profiled request."""
+
+    __slots__ = ('profiles', '_lock')
+
+    def __init__(self):
+        self.profiles: List[Profile] = []
+        self._lock = Lock()
+
+    def add(self, profile: Profile) -> None:
+        with self._lock:
+            self.profiles.append(profile)
+
+
+_session: ContextVar[Optional[Session]] = ContextVar('session', default=None)
+# .profiling is True while the thread is being profiled
+_local = local()
+_lock = Lock()
+
+
+def authorized(token: str) -> bool:
+    """Return True if token is the configured PROFILE_TOKEN."""
+    return bool(PROFILE_TOKEN) and compare_digest(
+        token.encode(), PROFILE_TOKEN.encode())
+
+
+def call(fn, *args):
+    """Call fn(*args), profiled if it belongs to a profiled request."""
+    session = _session.get()
+    if session is None or getattr(_local, 'profiling', False):
+        return fn(*args)
+    profile = Profile()
+    try:
+        profile.enable()
+    except ValueError:  # another profiler is active, e.g. Python 3.12+
+        return fn(*args)
+    _local.profiling = True
+    try:
+        return fn(*args)
+    finally:
+        profile.disable()
+        _local.profiling = False
+        session.add(profile)
+
+
+@contextmanager
+def profile():
+    """Profile the block and yield the id of the profile.
+
+    Yield None, without profiling, if another request is being profiled.
+    """
+    if not _lock.acquire(blocking=False):
+        yield None
+        return
+    try:
+        session = Session()
+        token = _session.set(session)
+        main = Profile()
+        profile_id = uuid4().hex
+        main.enable()
+        _local.profiling = True
+        try:
+            yield profile_id
+        finally:
+            main.disable()
+            _local.profiling = False
+            _session.reset(token)
+            save(profile_id, [main, *session.profiles])
+    finally:
+        _lock.release()
+
+
+def save(profile_id: str, profiles: List[Profile]) -> None:
+    makedirs(PROFILE_DIR, exist_ok=True)
+    stats = Stats(profiles[0])
+    for p in profiles[1:]:
+        stats.add(p)
+    stats.dump_stats(join(PROFILE_DIR, profile_id + '.pstats'))
+    paths = sorted(glob(join(PROFILE_DIR, '*.pstats')), key=getmtime)
+    for path in paths[:-PROFILE_MAX_FILES]:
+        try:
+            remove(path)
+        except OSError:  # removed by another process
+            logger.warning('could not remove %s', path)
+
+
+logger = getLogger(__name__)
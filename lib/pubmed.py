@@ -1,15 +1,24 @@
 """Codes specifically related to PubMed inputs."""
 
+from asyncio import CancelledError, TimeoutError as AsyncTimeoutError, \
+    create_task, shield, sleep as async_sleep, wait_for, wrap_future
 from collections import defaultdict
+from concurrent.futures import Future, TimeoutError
 from config import NCBI_API_KEY, NCBI_EMAIL, NCBI_TOOL
 from datetime import datetime
 from logging import getLogger
-from threading import Thread
+from threading import Lock
+from time import sleep
+from typing import Dict, Iterator, List, Optional
 
 from regex import compile as regex_compile
 
 from lib.commons import dict_to_sfn_cit_ref, b_TO_NUM, request
-from lib.doi import get_crossref_dict
+from lib.asynchttp import request as async_request
+from lib.doi import get_crossref_dict, get_crossref_dict_async, \
+    prefetch_crossref_dicts
+from lib.deadline import DeadlineExceeded, remaining
+from lib.executor import submit, result_or_none
 
 NON_DIGITS_SUB = regex_compile(r'[^\d]').sub
 
@@ -20,12 +29,157 @@ NCBI_URL = (
 PUBMED_URL = NCBI_URL + '&db=pubmed&id='
 PMC_URL = NCBI_URL + '&db=pmc&id='
 
+# Seconds to wait for other lookups to join an esummary call
+ESUMMARY_WINDOW = .01
+# The maximum number of ids in one esummary call
+ESUMMARY_BATCH_SIZE = 200
+
+
+# References to the fetches of cancelled leaders until they are done
+_FETCH_TASKS = set()
+
 
 class NCBIError(Exception):
 
     pass
 
 
+class ESummaryBatcher:
+
+    """Combine concurrent esummary lookups of a database into one call.
+
+    The first caller waits ESUMMARY_WINDOW seconds for other ids, then
+    fetches all of them and hands each waiter the summary of its own id.
+    """
+
+    __slots__ = ('url', '_lock', '_pending', '_collecting')
+
+    def __init__(self, url: str):
+        self.url = url
+        self._lock = Lock()
+        self._pending: Dict[str, Future] = {}
+        self._collecting = False
+
+    def summary(self, id_: str) -> dict:
+        """Return the esummary result of id_.
+
+        Raise NCBIError if NCBI returns an error or has no summary for id_.
+        """
+        future, leader = self._join(id_)
+        if leader:
+            sleep(ESUMMARY_WINDOW)
+            pending = self._take()
+            for chunk in self._chunks(pending):
+                try:
+                    result = self._result(
+                        request(self.url + ','.join(chunk)).json())
+                except BaseException as e:
+                    self._fail(pending, chunk, e)
+                    continue
+                self._deliver(pending, chunk, result)
+        try:
+            return future.result(remaining())
+        except TimeoutError:
+            raise DeadlineExceeded('esummary lookup timed out') from None
+
+    async def summary_async(self, id_: str) -> dict:
+        """Return the esummary result of id_; async version of summary.
+
+        The lookups of both versions are combined into the same calls.
+        """
+        future, leader = self._join(id_)
+        if leader:
+            try:
+                await async_sleep(ESUMMARY_WINDOW)
+            except CancelledError:
+                # the batch must be taken, otherwise _collecting stays set,
+                # and the other callers still wait for their summaries
+                task = create_task(self._fetch_async(self._take()))
+                _FETCH_TASKS.add(task)
+                task.add_done_callback(_FETCH_TASKS.discard)
+                raise
+            await self._fetch_async(self._take())
+        try:
+            return await wait_for(shield(wrap_future(future)), remaining())
+        except AsyncTimeoutError:
+            raise DeadlineExceeded('esummary lookup timed out') from None
+
+    async def _fetch_async(self, pending: Dict[str, Future]) -> None:
+        for chunk in self._chunks(pending):
+            try:
+                result = self._result((await async_request(
+                    self.url + ','.join(chunk))).json())
+            except CancelledError:
+                self._fail(pending, [*pending], DeadlineExceeded(
+                    'esummary lookup was cancelled'))
+                raise
+            except BaseException as e:
+                self._fail(pending, chunk, e)
+                continue
+            self._deliver(pending, chunk, result)
+
+    def _join(self, id_: str) -> tuple:
+        """Return (future of id_, whether the caller must fetch the batch)."""
+        with self._lock:
+            future = self._pending.get(id_)
+            if future is None:
+                future = self._pending[id_] = Future()
+            leader = not self._collecting
+            self._collecting = True
+        return future, leader
+
+    def _take(self) -> Dict[str, Future]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._collecting = False
+        return pending
+
+    @staticmethod
+    def _chunks(pending: Dict[str, Future]) -> Iterator[List[str]]:
+        ids = [*pending]
+        for i in range(0, len(ids), ESUMMARY_BATCH_SIZE):
+            yield ids[i:i + ESUMMARY_BATCH_SIZE]
+
+    @staticmethod
+    def _result(json_response: dict) -> dict:
+        if 'error' in json_response:
+            # Example error message if rates are exceeded:
+            # {"error":"API rate limit exceeded","count":"11"}
+            # https://www.ncbi.nlm.nih.gov/books/NBK25497/#chapter2.Coming_in_May_2018_API_Keys
+            raise NCBIError(json_response)
+        return json_response['result']
+
+    @staticmethod
+    def _fail(
+        pending: Dict[str, Future], chunk: List[str], e: BaseException,
+    ) -> None:
+        for id_ in chunk:
+            future = pending[id_]
+            if not future.done():
+                future.set_exception(e)
+
+    @staticmethod
+    def _deliver(
+        pending: Dict[str, Future], chunk: List[str], result: dict,
+    ) -> None:
+        summaries = [result.get(id_) for id_ in chunk]
+        if len(chunk) > 1:
+            prefetch_crossref_dicts(
+                a['value'] for s in summaries if s
+                for a in s.get('articleids', ()) if a['idtype'] == 'doi')
+        for id_, summary in zip(chunk, summaries):
+            if summary is None or 'error' in summary:
+                pending[id_].set_exception(NCBIError(summary))
+            else:
+                pending[id_].set_result(summary)
+
+
+ESUMMARY_BATCHERS = {
+    'pmid': ESummaryBatcher(PUBMED_URL),
+    'pmcid': ESummaryBatcher(PMC_URL),
+}
+
+
 def pmid_scr(pmid: str, date_format='%Y-%m-%d') -> tuple:
     """Return the response namedtuple."""
     pmid = NON_DIGITS_SUB('', pmid)
@@ -42,33 +196,70 @@ def pmcid_scr(pmcid: str, date_format='%Y-%m-%d') -> tuple:
     return dict_to_sfn_cit_ref(dictionary)
 
 
+async def pmid_scr_async(pmid: str, date_format='%Y-%m-%d') -> tuple:
+    """Return the response namedtuple; async version of pmid_scr."""
+    pmid = NON_DIGITS_SUB('', pmid)
+    dictionary = await ncbi_async('pmid', pmid)
+    dictionary['date_format'] = date_format
+    return dict_to_sfn_cit_ref(dictionary)
+
+
+async def pmcid_scr_async(pmcid: str, date_format='%Y-%m-%d') -> tuple:
+    """Return the response namedtuple; async version of pmcid_scr."""
+    pmcid = NON_DIGITS_SUB('', pmcid)
+    dictionary = await ncbi_async('pmcid', pmcid)
+    dictionary['date_format'] = date_format
+    return dict_to_sfn_cit_ref(dictionary)
+
+
 def ncbi(type_: str, id_: str) -> defaultdict:
     """Return the NCBI data for the given id_."""
     # According to https://www.ncbi.nlm.nih.gov/pmc/tools/get-metadata/
-    if type_ == 'pmid':
-        json_response = request(PUBMED_URL + id_).json()
-    else:  # type_ == 'pmcid'
-        json_response = request(PMC_URL + id_).json()
-    if 'error' in json_response:
-        # Example error message if rates are exceeded:
-        # {"error":"API rate limit exceeded","count":"11"}
-        # https://www.ncbi.nlm.nih.gov/books/NBK25497/#chapter2.Coming_in_May_2018_API_Keys
-        # Return a 503 Service Unavailable
-        raise NCBIError(json_response)
-    result_get = json_response['result'][id_].get
+    summary = ESUMMARY_BATCHERS[type_].summary(id_)
+    doi = summary_doi(summary)
+    if doi:
+        crossref_task = submit('pubmed', crossref_update, doi)
+    d = summary_to_dict(summary)
+    if doi:
+        # noinspection PyUnboundLocalVariable
+        crossref_dict = result_or_none(crossref_task, remaining())
+        if crossref_dict:
+            d.update(crossref_dict)
+    return d
+
+
+async def ncbi_async(type_: str, id_: str) -> defaultdict:
+    """Return the NCBI data for the given id_; async version of ncbi."""
+    summary = await ESUMMARY_BATCHERS[type_].summary_async(id_)
+    doi = summary_doi(summary)
+    if doi:
+        crossref_task = create_task(crossref_update_async(doi))
+    d = summary_to_dict(summary)
+    if doi:
+        # noinspection PyUnboundLocalVariable
+        crossref_dict = await crossref_task
+        if crossref_dict:
+            d.update(crossref_dict)
+    return d
+
+
+def summary_doi(summary: dict) -> Optional[str]:
+    for articleid in summary.get('articleids', ()):
+        if articleid['idtype'] == 'doi':
+            return articleid['value']
+    return None
+
+
+def summary_to_dict(summary: dict) -> defaultdict:
+    """Convert an esummary result to the dictionary used by sfn_cit_ref."""
+    result_get = summary.get
     d = defaultdict(lambda: None)
 
-    doi = None
     articleids = result_get('articleids', ())
     for articleid in articleids:
         idtype = articleid['idtype']
         if idtype == 'doi':
-            doi = articleid['value']
-            crossref_dict = {}
-            crossref_thread = Thread(
-                target=crossref_update, args=(crossref_dict, doi))
-            crossref_thread.start()
-            d['doi'] = doi
+            d['doi'] = articleid['value']
         elif idtype == 'pmcid':
             # Use NON_DIGITS_SUB to remove the PMC prefix e.g. in PMC3539452
             d['pmcid'] = NON_DIGITS_SUB('', articleid['value'])
@@ -128,20 +319,24 @@ def ncbi(type_: str, id_: str) -> defaultdict:
     if lang:
         d['language'] = lang[0]
 
-    if doi:
-        # noinspection PyUnboundLocalVariable
-        crossref_thread.join()
-        # noinspection PyUnboundLocalVariable
-        d.update(crossref_dict)
-
     return d
 
 
-def crossref_update(dct: dict, doi: str):
-    """Update dct using crossref result."""
+def crossref_update(doi: str) -> Optional[dict]:
+    """Return the crossref result for doi or None if it is not available."""
+    # noinspection PyBroadException
+    try:
+        return get_crossref_dict(doi)
+    except Exception:
+        logger.exception(
+            'There was an error in resolving crossref DOI: ' + doi)
+
+
+async def crossref_update_async(doi: str) -> Optional[dict]:
+    """Return the crossref result for doi or None if it is not available."""
     # noinspection PyBroadException
     try:
-        dct.update(get_crossref_dict(doi))
+        return await get_crossref_dict_async(doi)
     except Exception:
         logger.exception(
             'There was an error in resolving crossref DOI: ' + doi)
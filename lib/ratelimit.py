@@ -0,0 +1,135 @@
+"""Per-host token buckets that shape the outbound traffic of request().
+
+The limits are configured in config.RATE_LIMITS and are shared by all the
+worker processes (see share_limits). Calls that exceed the rate
+of their host wait for a token, unless the wait would pass the deadline of
+the current request, in which case DeadlineExceeded is raised.
+"""
+
+from threading import Lock
+from time import monotonic, sleep
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+from lib.settings import RATE_LIMITS
+from lib.deadline import DeadlineExceeded, remaining
+
+
+class TokenBucket:
+
+    """Allow `rate` calls per second with bursts of up to `capacity`."""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', '_lock')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = monotonic()
+        self._lock = Lock()
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        """Take a token and return the seconds to wait before using it.
+
+        Return None, without taking a token, if the wait would be longer than
+        max_wait.
+        """
+        with self._lock:
+            now = monotonic()
+            tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = 0. if tokens >= 1 else (1 - tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                self.tokens = tokens
+                return None
+            # tokens may become negative, i.e. reserved by waiting callers
+            self.tokens = tokens - 1
+            return wait
+
+
+_lock = Lock()
+# RATE_LIMITS key -> bucket
+_buckets: Dict[str, TokenBucket] = {}
+# hostname -> RATE_LIMITS key, or None if the host is not limited
+_host_keys: Dict[str, Optional[str]] = {}
+# RATE_LIMITS key -> {'calls': int, 'delayed': int, 'rejected': int,
+#   'wait': float}
+_stats: Dict[str, dict] = {}
+# the number of processes that share RATE_LIMITS, see share_limits
+_processes = 1
+
+
+def limit_key(hostname: str) -> Optional[str]:
+    """Return the RATE_LIMITS key that applies to hostname.
+
+    Keys match the hostname itself and its subdomains. Keys ending with a
+    dot, e.g. 'books.google.', match hostnames starting with them.
+    """
+    for key in RATE_LIMITS:
+        if key[-1] == '.':
+            if hostname.startswith(key):
+                return key
+        elif hostname == key or hostname.endswith('.' + key):
+            return key
+    return None
+
+
+def throttle(url: str) -> None:
+    """Wait until the rate limit of the host of url allows another call."""
+    wait = reserve(url)
+    if wait:
+        sleep(wait)
+
+
+def reserve(url: str) -> float:
+    """Reserve a call to the host of url and return the seconds to wait.
+
+    Raise DeadlineExceeded if the wait would pass the request deadline.
+    """
+    hostname = (urlparse(url).hostname or '').lower()
+    try:
+        key = _host_keys[hostname]
+    except KeyError:
+        key = _host_keys[hostname] = limit_key(hostname)
+    if key is None:
+        return 0.
+    with _lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            rate, capacity = RATE_LIMITS[key]
+            # a burst of one call does not wait in any of the processes
+            bucket = _buckets[key] = TokenBucket(
+                rate / _processes, max(capacity / _processes, 1))
+            _stats.setdefault(key, dict.fromkeys(
+                ('calls', 'delayed', 'rejected', 'wait'), 0))
+        stats = _stats[key]
+    wait = bucket.reserve(remaining())
+    with _lock:
+        stats['calls'] += 1
+        if wait is None:
+            stats['rejected'] += 1
+        elif wait:
+            stats['delayed'] += 1
+            stats['wait'] += wait
+    if wait is None:
+        raise DeadlineExceeded(f'rate limit of {hostname} exceeds deadline')
+    return wait
+
+
+def share_limits(processes: int) -> None:
+    """Divide RATE_LIMITS between processes, e.g. the lib.prefork workers.
+
+    Each process has its own buckets, so without this the hosts would get
+    `processes` times the configured rate.
+    """
+    global _processes
+    with _lock:
+        _processes = processes
+        _buckets.clear()
+
+
+def stats() -> Dict[str, dict]:
+    """Return the call counts and total wait seconds of each limited host."""
+    with _lock:
+        return {key: {**s} for key, s in _stats.items()}
@@ -0,0 +1,95 @@
+"""Cache of the (sfn, cite, ref) tuples returned by the resolvers of app().
+
+Inputs that are expected to give the same result share one key: tracking
+parameters are removed from URLs, digits are converted to ASCII, DOIs are
+case-folded, and ISBN separators are dropped.
+"""
+
+from html import unescape
+from typing import Hashable, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlencode, urlparse
+
+from config import LANG
+from lib.cache import TTLCache, MISSING
+from lib.commons import uninum2en, ISBN_10OR13_SEARCH
+from lib.doi import DOI_SEARCH
+
+
+# Query parameters that only track the referrer and never change the page
+TRACKING_PARAMS = {
+    '_ga', 'dclid', 'fbclid', 'gclid', 'igshid', 'mc_cid', 'mc_eid',
+    'msclkid', 'yclid'}
+TRACKING_PARAM_PREFIXES = ('utm_',)
+
+DOI_NETLOCS = {'doi.org', 'dx.doi.org', 'www.doi.org'}
+
+# Time to live of results per input kind (seconds). Web pages change more
+# often than the metadata of DOIs, ISBNs, and database records.
+RESULT_TTLS = {
+    'doi': 7 * 24 * 3600,
+    'isbn': 7 * 24 * 3600,
+    'oclc': 7 * 24 * 3600,
+    'pmcid': 7 * 24 * 3600,
+    'pmid': 7 * 24 * 3600,
+    'url': 6 * 3600,
+}
+DEFAULT_RESULT_TTL = 3600
+
+RESULT_CACHE = TTLCache(4096, DEFAULT_RESULT_TTL)
+
+
+def strip_tracking_params(url: str) -> str:
+    """Remove utm_* and the other TRACKING_PARAMS from the query of url."""
+    if '?' not in url:
+        return url
+    parsed_url = urlparse(url)
+    query = parse_qsl(parsed_url.query, keep_blank_values=True)
+    kept = [
+        (k, v) for k, v in query
+        if k not in TRACKING_PARAMS
+        and not k.startswith(TRACKING_PARAM_PREFIXES)]
+    if len(kept) == len(query):
+        return url
+    return parsed_url._replace(query=urlencode(kept)).geturl()
+
+
+def normalize_input(input_type: str, user_input: str) -> Tuple[str, str]:
+    """Return (kind, normalized_input) for the given user input.
+
+    kind is one of the keys of RESULT_TTLS.
+    """
+    en_input = uninum2en(user_input).strip()
+    if input_type in ('pmid', 'pmcid', 'oclc'):
+        return input_type, en_input.lower()
+    if '.' not in en_input:
+        m = ISBN_10OR13_SEARCH(en_input)
+        if m is not None:
+            return 'isbn', m[0].replace('-', '').replace(' ', '').upper()
+        return 'url', en_input
+    unquoted = unescape(unquote(en_input))
+    netloc = urlparse(
+        unquoted if unquoted.startswith('http') else 'http://' + unquoted
+    ).netloc.lower()
+    if unquoted.startswith('10.') or netloc in DOI_NETLOCS:
+        m = DOI_SEARCH(unquoted)
+        if m is not None:
+            return 'doi', m[0].lower()
+    return 'url', strip_tracking_params(en_input)
+
+
+def cache_key(
+    resolver_name: str, input_type: str, user_input: str, date_format: str
+) -> Tuple[str, Hashable]:
+    """Return (kind, key) of the result of the given request parameters."""
+    kind, normalized_input = normalize_input(input_type, user_input)
+    return kind, (resolver_name, normalized_input, date_format, LANG)
+
+
+def get_result(key: Hashable) -> Optional[tuple]:
+    """Return the cached (sfn, cite, ref) tuple or None."""
+    result = RESULT_CACHE.get(key)
+    return None if result is MISSING else result
+
+
+def set_result(kind: str, key: Hashable, result: tuple) -> None:
+    RESULT_CACHE.set(key, result, RESULT_TTLS.get(kind, DEFAULT_RESULT_TTL))
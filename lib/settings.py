@@ -0,0 +1,71 @@
+"""The settings of config.py that have a default value.
+
+config.py is a copy of config.py.example made when citer is installed.
+Settings that were added to config.py.example later fall back to the
+defaults below, so existing config.py files keep working. See
+config.py.example for the meaning of each setting.
+"""
+
+import config
+
+
+def _setting(name: str, default):
+    return getattr(config, name, default)
+
+
+REQUEST_DEADLINE = _setting('REQUEST_DEADLINE', 20)
+
+BATCH_MAX_INPUTS = _setting('BATCH_MAX_INPUTS', 100)
+BATCH_DEADLINE = _setting('BATCH_DEADLINE', 60)
+MAX_BATCH_BODY = _setting('MAX_BATCH_BODY', 1_000_000)
+
+HTTP_CACHE_PATH = _setting('HTTP_CACHE_PATH', '')
+HTTP_CACHE_TTL = _setting('HTTP_CACHE_TTL', 30 * 24 * 3600)
+HTTP_CACHE_MAX_ENTRIES = _setting('HTTP_CACHE_MAX_ENTRIES', 100000)
+
+RATE_LIMITS = _setting('RATE_LIMITS', {
+    'eutils.ncbi.nlm.nih.gov': (10 if config.NCBI_API_KEY else 3, 1),
+    'api.crossref.org': (10, 10),
+    'worldcat.org': (2, 4),
+    'books.google.': (5, 5),
+})
+
+CONNECTION_POOL_SIZE = _setting('CONNECTION_POOL_SIZE', 10)
+CONNECTION_POOL_SIZES = _setting('CONNECTION_POOL_SIZES', {
+    'api.crossref.org': 32,
+    'eutils.ncbi.nlm.nih.gov': 16,
+    'web.archive.org': 32,
+    'archive.org': 32,
+})
+CONNECTION_POOL_BLOCK = _setting('CONNECTION_POOL_BLOCK', False)
+CONNECTION_IDLE_TIMEOUT = _setting('CONNECTION_IDLE_TIMEOUT', 30)
+
+FASTCGI = _setting('FASTCGI', False)
+SERVER_HOST = _setting('SERVER_HOST', 'localhost')
+SERVER_PORT = _setting('SERVER_PORT', 5000)
+MAX_CONCURRENT_REQUESTS = _setting('MAX_CONCURRENT_REQUESTS', 256)
+SHUTDOWN_TIMEOUT = _setting('SHUTDOWN_TIMEOUT', 30)
+KEEP_ALIVE_TIMEOUT = _setting('KEEP_ALIVE_TIMEOUT', 5)
+MAX_REQUEST_BODY = _setting('MAX_REQUEST_BODY', 1_000_000)
+WORKERS = _setting('WORKERS', 1)
+
+ADMISSION_LIMITS = _setting('ADMISSION_LIMITS', {
+    'url': 32,
+    'isbn': 16,
+    'oclc': 8,
+    'doi': 64,
+    'pmid': 64,
+    'pmcid': 64,
+})
+ADMISSION_MAX_QUEUE_TIME = _setting('ADMISSION_MAX_QUEUE_TIME', 10)
+ADMISSION_RETRY_AFTER = _setting('ADMISSION_RETRY_AFTER', 5)
+
+LOG_DIR = _setting('LOG_DIR', None)
+LOG_MAX_BYTES = _setting('LOG_MAX_BYTES', 1_000_000)
+LOG_BACKUP_COUNT = _setting('LOG_BACKUP_COUNT', 1)
+LOG_QUEUE_SIZE = _setting('LOG_QUEUE_SIZE', 10000)
+LOG_TRACEBACK_INTERVAL = _setting('LOG_TRACEBACK_INTERVAL', 60)
+
+PROFILE_TOKEN = _setting('PROFILE_TOKEN', '')
+PROFILE_DIR = _setting('PROFILE_DIR', './profiles')
+PROFILE_MAX_FILES = _setting('PROFILE_MAX_FILES', 50)
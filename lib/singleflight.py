@@ -0,0 +1,101 @@
+"""Coalesce identical calls that are in progress at the same time.
+
+The first caller of a key runs the function; callers that arrive before it
+returns wait for it and get the same return value or exception.
+"""
+
+from asyncio import CancelledError, TimeoutError as AsyncTimeoutError, \
+    get_running_loop, shield, wait_for
+from concurrent.futures import Future, TimeoutError
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable
+
+from lib.deadline import DeadlineExceeded, remaining
+
+
+class SingleFlight:
+
+    """A group of calls deduplicated by key."""
+
+    __slots__ = ('calls', 'shared', '_futures', '_lock')
+
+    def __init__(self):
+        self.calls = self.shared = 0
+        self._futures: Dict[Hashable, Future] = {}
+        self._lock = Lock()
+
+    def do(self, key: Hashable, fn: Callable, *args) -> Any:
+        """Return fn(*args), sharing the call with concurrent callers of key.
+
+        Waiting callers give up with DeadlineExceeded when the deadline of
+        their own request is reached; the running call is not affected.
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._futures.get(key)
+            if future is None:
+                future = self._futures[key] = Future()
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            timeout = remaining()
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded('request deadline exceeded')
+            try:
+                return future.result(timeout)
+            except TimeoutError:
+                raise DeadlineExceeded('request deadline exceeded') from None
+        try:
+            result = fn(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._futures[key]
+
+
+class AsyncSingleFlight:
+
+    """SingleFlight for coroutine functions called within one event loop."""
+
+    __slots__ = ('calls', 'shared', '_futures')
+
+    def __init__(self):
+        self.calls = self.shared = 0
+        self._futures: Dict[Hashable, Any] = {}
+
+    async def do(self, key: Hashable, fn: Callable, *args) -> Any:
+        """Return await fn(*args); see SingleFlight.do."""
+        self.calls += 1
+        future = self._futures.get(key)
+        if future is not None:
+            self.shared += 1
+            timeout = remaining()
+            if timeout is not None and timeout <= 0:
+                raise DeadlineExceeded('request deadline exceeded')
+            try:
+                # shield: a waiter that gives up must not cancel the call
+                return await wait_for(shield(future), timeout)
+            except AsyncTimeoutError:
+                raise DeadlineExceeded('request deadline exceeded') from None
+        future = self._futures[key] = get_running_loop().create_future()
+        try:
+            result = await fn(*args)
+        except CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # do not log it if there were no waiters
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[key]
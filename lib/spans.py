@@ -0,0 +1,93 @@
+"""Per-request timing of phases, reported in the Server-Timing header.
+
+app() wraps each request in collect(); lib modules wrap their phases in
+span(name) or decorate functions with timed(name). Durations of spans with
+the same name are summed. Spans are inclusive and may run in parallel on
+lib.executor threads, so their sum may exceed the total. Outside of
+collect() spans cost one context variable lookup.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from threading import Lock
+from time import perf_counter
+from typing import Callable, Dict, Optional
+
+
+class Timings:
+
+    """The span durations of a request."""
+
+    __slots__ = ('durations', '_lock')
+
+    def __init__(self):
+        # name -> [seconds, count]
+        self.durations: Dict[str, list] = {}
+        self._lock = Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            try:
+                duration = self.durations[name]
+            except KeyError:
+                self.durations[name] = [seconds, 1]
+            else:
+                duration[0] += seconds
+                duration[1] += 1
+
+    def header(self) -> str:
+        """Return the value of the Server-Timing header."""
+        with self._lock:
+            durations = [*self.durations.items()]
+        return ', '.join(
+            f'{name};dur={seconds * 1000:.1f}'
+            + (f';desc="{count} calls"' if count > 1 else '')
+            for name, (seconds, count) in durations)
+
+
+_timings: ContextVar[Optional[Timings]] = ContextVar('timings', default=None)
+
+
+@contextmanager
+def collect():
+    """Collect the spans of the block, including a "total" span."""
+    timings = Timings()
+    token = _timings.set(timings)
+    started_at = perf_counter()
+    try:
+        yield timings
+    finally:
+        timings.add('total', perf_counter() - started_at)
+        _timings.reset(token)
+
+
+@contextmanager
+def span(name: str):
+    """Add the duration of the block to the timings of the request."""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    started_at = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, perf_counter() - started_at)
+
+
+def timed(name: str) -> Callable[[Callable], Callable]:
+    """Decorate a function to record its calls as spans named name."""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            timings = _timings.get()
+            if timings is None:
+                return fn(*args, **kwargs)
+            started_at = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                timings.add(name, perf_counter() - started_at)
+        return wrapper
+    return decorator
@@ -1,27 +1,53 @@
 """Codes used for parsing contents of an arbitrary URL."""
 
 
+from asyncio import create_task
 from collections import defaultdict
 from datetime import date as datetime_date
 from difflib import get_close_matches
 from html import unescape as html_unescape
 from logging import getLogger
-from threading import Thread
-from typing import Optional, List, Dict, Any, Tuple
+from threading import Lock
+from typing import Optional, List, Dict, Any, Tuple, Callable
 from urllib.parse import urlparse
 
-from langid import classify
 from regex import compile as regex_compile, VERBOSE, IGNORECASE
 from requests import Response as RequestsResponse
 from requests.exceptions import RequestException
 
+from lib.asynchttp import stream as async_stream
+from lib.cache import TTLCache, MISSING
 from lib.commons import (
-    find_any_date, dict_to_sfn_cit_ref, ANYDATE_PATTERN,
+    classify, find_any_date, dict_to_sfn_cit_ref, ANYDATE_PATTERN,
     request)
-from lib.urls_authors import find_authors, CONTENT_ATTR
+from lib.deadline import DeadlineExceeded, remaining
+from lib.executor import submit, result_or_none
+from lib.metrics import add_flights
+from lib.singleflight import AsyncSingleFlight, SingleFlight
+from lib.spans import timed
+from lib.urls_authors import find_authors, find_meta_authors
 
 
 MAX_RESPONSE_LENGTH = 2000000
+# Size of the chunks that are read before the end of <head> is reached
+HEAD_CHUNK_SIZE = 32768
+
+# Homepage titles keyed by scheme://netloc, shared by all url2dict calls.
+HOME_TITLE_CACHE = TTLCache(maxsize=2048, ttl=24 * 3600)
+# Failed homepage fetches are retried after this many seconds.
+HOME_TITLE_NEGATIVE_TTL = 600
+# Concurrent fetches of the same homepage are coalesced.
+HOME_TITLE_FLIGHTS = SingleFlight()
+HOME_TITLE_ASYNC_FLIGHTS = AsyncSingleFlight()
+add_flights('home_title', HOME_TITLE_FLIGHTS)
+add_flights('home_title_async', HOME_TITLE_ASYNC_FLIGHTS)
+# Per netloc (used, total) counts of url2dict calls that needed the homepage
+# title. The title is prefetched for hosts that usually need it.
+HOME_TITLE_STATS = TTLCache(maxsize=2048, ttl=7 * 24 * 3600)
+# makes the read-modify-write of HOME_TITLE_STATS entries atomic
+HOME_TITLE_STATS_LOCK = Lock()
+HOME_TITLE_PREFETCH_MIN_SAMPLES = 5
+HOME_TITLE_PREFETCH_RATIO = .5
 
 # https://stackoverflow.com/questions/3458217/how-to-use-regular-expression-to-match-the-charset-string-in-html
 CHARSET = regex_compile(
@@ -31,20 +57,32 @@ CHARSET = regex_compile(
     IGNORECASE | VERBOSE,
 ).search
 
-TITLE_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])
-        (?>citation_title|title|Headline|og:title)
-    (?P=q)
-'''
-TITLE_SEARCH = regex_compile(
-    r'<meta\s++(?:'
-    + TITLE_META_NAME_OR_PROP + r'\s++' + CONTENT_ATTR
-    + '|'
-    + CONTENT_ATTR + r'\s++' + TITLE_META_NAME_OR_PROP
-    + ')'
-    '|'
-    r'class=(?<q>["\'])(?>main-hed|heading1)(?P=q)[^>]++>(?<result>[^<]*+)<',
+# Each <meta> tag is tokenized once; see meta_index().
+META_TAG_FINDITER = regex_compile(
+    r"""
+    <meta\b
+    (?<attrs>(?>
+        [^>"']++
+        |"[^"]*+"
+        |'[^']*+'
+    )*+)
+    >
+    """,
     VERBOSE | IGNORECASE,
+).finditer
+
+META_ATTR_FINDALL = regex_compile(
+    r"""
+    (?<attr>[^\s"'=/>]++)
+    (?:=(?>"(?<value>[^"]*+)"|'(?<value>[^']*+)'|[^\s"'>]++))?
+    """,
+    VERBOSE,
+).findall
+
+TITLE_META_NAMES = ('citation_title', 'title', 'headline', 'og:title')
+TITLE_CLASS_SEARCH = regex_compile(
+    r'class=(?<q>["\'])(?>main-hed|heading1)(?P=q)[^>]++>(?<result>[^<]*+)<',
+    IGNORECASE,
 ).search
 
 TITLE_TAG = regex_compile(
@@ -56,154 +94,29 @@ TITLE_TAG = regex_compile(
     VERBOSE | IGNORECASE,
 ).search
 
-DATE_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])(?>
-        article:(?>modified_time|published_time)
-        |citation_(?>date|publication_date)
-        |date
-        |DC.date.[^'"\n>]*+
-        |last-modified
-        |pub_?date
-        |sailthru\.date
-    )(?P=q)
-'''
-DATE_CONTENT_ATTR =\
-    r'content=(?<q>["\'])[^"\'<]*?' + ANYDATE_PATTERN + r'[^"\'<]*+(?P=q)'
-DATE_SEARCH = regex_compile(
-    r'<meta\s+[^\n<]*?(?:'
-    + DATE_META_NAME_OR_PROP + r'\s++[^\n<]*?' + DATE_CONTENT_ATTR
-    + '|'
-    + DATE_CONTENT_ATTR + r'\s++[^\n<]*?' + DATE_META_NAME_OR_PROP
-    + ')'
-    '|'
+DATE_META_NAME_FULLMATCH = regex_compile(
+    r'''
+    article:(?>modified_time|published_time)
+    |citation_(?>date|publication_date)
+    |date
+    |dc.date.[^'"\n>]*+
+    |last-modified
+    |pub_?date
+    |sailthru\.date
+    ''',
+    VERBOSE | IGNORECASE,
+).fullmatch
+# Meta contents are matched case-insensitively, e.g. content="june 3, 2014".
+CONTENT_DATE_SEARCH = regex_compile(
+    ANYDATE_PATTERN, VERBOSE | IGNORECASE).search
+DATE_TEXT_SEARCH = regex_compile(
     # http://livescience.com/46619-sterile-neutrino-experiment-beginning.html
     # https://www.thetimes.co.uk/article/woman-who-lost-brother-on-mh370-mourns-relatives-on-board-mh17-r07q5rwppl0
     r'date(?>Published|line)[^\w]++' + ANYDATE_PATTERN,
     VERBOSE | IGNORECASE,
 ).search
 
-JOURNAL_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])citation_journal_title(?P=q)
-'''
-JOURNAL_TITLE_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + JOURNAL_META_NAME_OR_PROP
-    + '|'
-    + JOURNAL_META_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-URL_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])og:url(?P=q)
-'''
-URL_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + URL_META_NAME_OR_PROP
-    + '|'
-    + URL_META_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-ISSN_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])citation_issn(?P=q)
-'''
-ISSN_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + ISSN_META_NAME_OR_PROP
-    + '|'
-    + ISSN_META_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-PMID_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])citation_pmid(?P=q)
-'''
-PMID_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + PMID_META_NAME_OR_PROP
-    + '|'
-    + PMID_META_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-DOI_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])citation_doi(?P=q)
-'''
-DOI_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + DOI_META_NAME_OR_PROP
-    + '|'
-    + DOI_META_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-
-VOLUME_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])citation_volume(?P=q)
-'''
-VOLUME_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + VOLUME_META_NAME_OR_PROP
-    + '|'
-    + VOLUME_META_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-ISSUE_META_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])citation_issue(?P=q)
-'''
-ISSUE_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + ISSUE_META_NAME_OR_PROP
-    + '|'
-    + ISSUE_META_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-FIRST_PAGE_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])citation_firstpage(?P=q)
-'''
-FIRST_PAGE_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + FIRST_PAGE_NAME_OR_PROP
-    + '|'
-    + FIRST_PAGE_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-
-LAST_PAGE_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])citation_lastpage(?P=q)
-'''
-LAST_PAGE_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + LAST_PAGE_NAME_OR_PROP
-    + '|'
-    + LAST_PAGE_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
-
-
-SITE_NAME_NAME_OR_PROP = r'''
-    (?>name|property)=(?<q>["\'])og:site_name(?P=q)
-'''
-SITE_NAME_SEARCH = regex_compile(
-    r'<meta\s++[^\n<]*?(?:'
-    + CONTENT_ATTR + r'\s++[^\n<]*?' + SITE_NAME_NAME_OR_PROP
-    + '|'
-    + SITE_NAME_NAME_OR_PROP + r'\s++[^\n<]*?' + CONTENT_ATTR
-    + ')',
-    VERBOSE | IGNORECASE,
-).search
+HEAD_END_SEARCH = regex_compile(rb'</head\s*+>', IGNORECASE).search
 
 TITLE_SPLIT = regex_compile(r' - | — |\|').split
 
@@ -241,122 +154,161 @@ def urls_scr(url: str, date_format: str = '%Y-%m-%d') -> tuple:
     return dict_to_sfn_cit_ref(dictionary)
 
 
-def find_journal(html: str) -> Optional[str]:
+async def urls_scr_async(url: str, date_format: str = '%Y-%m-%d') -> tuple:
+    """Create the response namedtuple; async version of urls_scr."""
+    try:
+        dictionary = await url2dict_async(url)
+    except (ContentTypeError, ContentLengthError) as e:
+        logger.exception(url)
+        # Todo: i18n
+        return 'Could not process the request.', e, ''
+    dictionary['date_format'] = date_format
+    return dict_to_sfn_cit_ref(dictionary)
+
+
+MetaIndex = Dict[str, List[Tuple[int, str]]]
+
+
+def meta_index(html: str) -> MetaIndex:
+    """Return {name: [(position, content), ...]} for the meta tags of html.
+
+    Both name and property attributes are used as (lower-cased) keys.
+    Meta tags without a non-empty content are ignored. Values of each key are
+    in document order.
+    """
+    index = {}
+    for match in META_TAG_FINDITER(html):
+        names = []
+        content = None
+        for attr, value in META_ATTR_FINDALL(match['attrs']):
+            attr = attr.lower()
+            if attr == 'content':
+                if content is None:
+                    content = value
+            elif attr in ('name', 'property') and value:
+                names.append(value.lower())
+        if not content:
+            continue
+        position = match.start()
+        for name in names:
+            index.setdefault(name, []).append((position, content))
+    return index
+
+
+def first_meta(meta: MetaIndex, *names: str) -> Optional[Tuple[int, str]]:
+    """Return the first (position, content) having any of the given names."""
+    found = [meta[name][0] for name in names if name in meta]
+    if found:
+        return min(found)
+
+
+def meta_content(meta: MetaIndex, name: str) -> Optional[str]:
+    """Return the content of the first meta tag with the given name."""
+    values = meta.get(name)
+    if values:
+        return values[0][1]
+
+
+def find_journal(meta: MetaIndex) -> Optional[str]:
     """Return journal title as a string."""
     # http://socialhistory.ihcs.ac.ir/article_319_84.html
-    m = JOURNAL_TITLE_SEARCH(html)
-    if m is not None:
-        return m['result']
+    return meta_content(meta, 'citation_journal_title')
 
 
-def find_url(html: str, url: str) -> str:
+def find_url(meta: MetaIndex, url: str) -> str:
     """Return og:url or url as a string."""
     # http://www.ft.com/cms/s/836f1b0e-f07c-11e3-b112-00144feabdc0,Authorised=false.html?_i_location=http%3A%2F%2Fwww.ft.com%2Fcms%2Fs%2F0%2F836f1b0e-f07c-11e3-b112-00144feabdc0.html%3Fsiteedition%3Duk&siteedition=uk&_i_referer=http%3A%2F%2Fwww.ft.com%2Fhome%2Fuk
-    m = URL_SEARCH(html)
-    if m is not None:
-        ogurl = m['result']
-        if urlparse(ogurl).path:
-            return ogurl
+    ogurl = meta_content(meta, 'og:url')
+    if ogurl is not None and urlparse(ogurl).path:
+        return ogurl
     return url
 
 
-def find_issn(html: str) -> Optional[str]:
+def find_issn(meta: MetaIndex) -> Optional[str]:
     r"""Return International Standard Serial Number as a string.
 
     Normally ISSN should be in the  '\d{4}\-\d{3}[\dX]' format, but this
     function does not check that.
     """
-    m = ISSN_SEARCH(html)
     # http://socialhistory.ihcs.ac.ir/article_319_84.html
     # http://psycnet.apa.org/journals/edu/30/9/641/
-    if m is not None:
-        return m['result']
+    return meta_content(meta, 'citation_issn')
 
 
-def find_pmid(html: str) -> Optional[str]:
+def find_pmid(meta: MetaIndex) -> Optional[str]:
     """Return pmid as a string."""
     # http://jn.physiology.org/content/81/1/319
-    m = PMID_SEARCH(html)
-    if m is not None:
-        return m['result']
+    return meta_content(meta, 'citation_pmid')
 
 
-def find_doi(html: str) -> Optional[str]:
+def find_doi(meta: MetaIndex) -> Optional[str]:
     """Return DOI as a string."""
     # http://jn.physiology.org/content/81/1/319
-    m = DOI_SEARCH(html)
-    if m is not None:
-        return m['result']
+    return meta_content(meta, 'citation_doi')
 
 
-def find_volume(html: str) -> Optional[str]:
+def find_volume(meta: MetaIndex) -> Optional[str]:
     """Return citatoin volume number as a string."""
     # http://socialhistory.ihcs.ac.ir/article_319_84.html
-    m = VOLUME_SEARCH(html)
-    if m is not None:
-        return m['result']
+    return meta_content(meta, 'citation_volume')
 
 
-def find_issue(html: str) -> Optional[str]:
+def find_issue(meta: MetaIndex) -> Optional[str]:
     """Return citation issue number as a string."""
     # http://socialhistory.ihcs.ac.ir/article_319_84.html
-    m = ISSUE_SEARCH(html)
-    if m is not None:
-        return m['result']
+    return meta_content(meta, 'citation_issue')
 
 
-def find_pages(html: str) -> Optional[str]:
+def find_pages(meta: MetaIndex) -> Optional[str]:
     """Return citation pages as a string."""
     # http://socialhistory.ihcs.ac.ir/article_319_84.html
-    fp_match = FIRST_PAGE_SEARCH(html)
-    if fp_match:
-        lp_match = LAST_PAGE_SEARCH(html)
-        if lp_match:
-            return \
-                fp_match['result'] + '–' + lp_match['result']
+    first_page = meta_content(meta, 'citation_firstpage')
+    if first_page:
+        last_page = meta_content(meta, 'citation_lastpage')
+        if last_page:
+            return first_page + '–' + last_page
 
 
 def find_site_name(
-    html: str,
+    meta: MetaIndex,
     html_title: str,
     url: str,
     authors: List[Tuple[str, str]],
-    home_title: List[str],
-    thread: Thread,
+    home_title: 'HomeTitle',
 ) -> str:
     """Return (site's name as a string, where).
 
     Parameters:
-        html: The html string of the page being processed.
+        meta: The meta_index of the page being processed.
         html_title: Title of the page found in the title tag of the html.
         url: URL of the page.
         authors: Authors list returned from find_authors function.
-        home_title: A list containing the title of the home page as a str.
-        thread: The thread that should be joined before using home_title list.
+        home_title: The HomeTitle of the url.
     Returns site's name as a string.
     """
-    m = SITE_NAME_SEARCH(html)
-    if m is not None:
-        return m['result']
+    site_name = meta_content(meta, 'og:site_name')
+    if site_name is not None:
+        return site_name
     # search the title
-    site_name = parse_title(
-        html_title, url, authors, home_title, thread
-    )[2]
+    site_name = parse_title(html_title, url, authors, home_title)[2]
     if site_name:
         return site_name
     # noinspection PyBroadException
     try:
         # using home_title
-        thread.join()
-        if ':' in home_title[0]:
-            # http://www.washingtonpost.com/wp-dyn/content/article/2005/09/02/AR2005090200822.html
-            site_name = home_title[0].split(':')[0].strip()
+        title = home_title.get()
+        if title:
+            if ':' in title:
+                # http://www.washingtonpost.com/wp-dyn/content/article/2005/09/02/AR2005090200822.html
+                site_name = title.split(':')[0].strip()
+                if site_name:
+                    return site_name
+            site_name = parse_title(title, url, None)[2]
             if site_name:
                 return site_name
-        site_name = parse_title(home_title[0], url, None)[2]
-        if site_name:
-            return site_name
-        return home_title[0]
+            return title
+    except HomeTitleMissing:  # url2dict_async provides it and retries
+        raise
     except Exception:
         logger.exception(url)
     # return hostname
@@ -368,20 +320,26 @@ def find_site_name(
 
 def find_title(
     html: str,
+    meta: MetaIndex,
     html_title: str,
     url: str,
     authors: List[Tuple[str, str]],
-    home_title: List[str],
-    thread: Thread,
+    home_title: 'HomeTitle',
 ) -> Optional[str]:
     """Return (title_string, where_info)."""
-    m = TITLE_SEARCH(html)
+    title = first_meta(meta, *TITLE_META_NAMES)
+    # Only the part of html before the title meta tag needs to be searched.
+    m = TITLE_CLASS_SEARCH(html, 0, title[0] if title else len(html))
     if m is not None:
+        title = m['result']
+    elif title is not None:
+        title = title[1]
+    if title is not None:
         return parse_title(
-            html_unescape(m['result']), url, authors, home_title, thread,
+            html_unescape(title), url, authors, home_title,
         )[1]
     elif html_title:
-        return parse_title(html_title, url, authors, home_title, thread)[1]
+        return parse_title(html_title, url, authors, home_title)[1]
     else:
         return None
 
@@ -390,8 +348,7 @@ def parse_title(
     title: str,
     url: str,
     authors: Optional[List[Tuple[str, str]]],
-    home_title_list: Optional[List[str]] = None,
-    thread: Thread = None,
+    home_title: 'HomeTitle' = None,
 ) -> Tuple[Optional[str], str, Optional[str]]:
     """Return (intitle_author, pure_title, intitle_sitename).
 
@@ -439,10 +396,9 @@ def parse_title(
         if close_matches:
             intitle_sitename = close_matches[0]
         else:
-            if thread:
-                thread.join()
-            if home_title_list:
-                home_title = home_title_list[0]
+            # The homepage is only fetched if it is required at this point.
+            home_title = home_title and home_title.get()
+            if home_title:
                 # 3. In homepage title
                 for part in title_parts:
                     if part in home_title:
@@ -473,40 +429,188 @@ def parse_title(
     return intitle_author, pure_title, intitle_sitename
 
 
-def find_date(html: str, url: str) -> datetime_date:
+def find_meta_date(meta: MetaIndex) -> Optional[Tuple[int, Any]]:
+    """Return (position, match) of the first date found in date meta tags."""
+    date_meta = None
+    for name, values in meta.items():
+        if DATE_META_NAME_FULLMATCH(name) is None:
+            continue
+        for position, content in values:
+            if date_meta is not None and position >= date_meta[0]:
+                break
+            m = CONTENT_DATE_SEARCH(content)
+            if m is not None:
+                date_meta = position, m
+                break
+    return date_meta
+
+
+def find_date(html: str, meta: MetaIndex, url: str) -> datetime_date:
     """Return the date of the document."""
     # Example for find_any_date(url):
     # http://ftalphaville.ft.com/2012/05/16/1002861/recap-and-tranche-primer/?Authorised=false
     # Example for find_any_date(html):
     # https://www.bbc.com/news/uk-england-25462900
-    m = DATE_SEARCH(html)
+    date_meta = find_meta_date(meta)
+    m = DATE_TEXT_SEARCH(html, 0, date_meta[0] if date_meta else len(html))
+    if m is None and date_meta is not None:
+        m = date_meta[1]
     return find_any_date(m) if m else find_any_date(url) or find_any_date(html)
 
 
-def get_home_title(url: str, home_title_list: List[str]) -> None:
-    """Get homepage of the url and return it's title.
+def get_home_title(url: str) -> Optional[str]:
+    """Return the title of the homepage of the url.
 
-    home_title_list will be used to return the thread result.
-    This function is invoked through a thread.
+    Titles (and failures) are cached per scheme and netloc in
+    HOME_TITLE_CACHE.
     """
-    # Todo: cache the result.
-    home_url = '://'.join(urlparse(url)[:2])
-    with request(
-        home_url, spoof=True, stream=True
-    ) as r:
+    home = home_url(url)
+    key = home.lower()
+    title = HOME_TITLE_CACHE.get(key)
+    if title is MISSING:
         try:
-            check_response_headers(r)
+            title = HOME_TITLE_FLIGHTS.do(key, fetch_home_title, home)
+        except DeadlineExceeded:  # not a failure of the host, do not cache
+            return None
         except (
             RequestException, StatusCodeError,
             ContentTypeError, ContentLengthError,
         ):
-            return
+            title = None
+            ttl = HOME_TITLE_NEGATIVE_TTL
+        else:
+            ttl = None
+        HOME_TITLE_CACHE.set(key, title, ttl)
+    return title
+
+
+async def get_home_title_async(url: str) -> Optional[str]:
+    """Return the title of the homepage of the url; async get_home_title."""
+    home = home_url(url)
+    key = home.lower()
+    title = HOME_TITLE_CACHE.get(key)
+    if title is MISSING:
+        try:
+            title = await HOME_TITLE_ASYNC_FLIGHTS.do(
+                key, fetch_home_title_async, home)
+        except DeadlineExceeded:  # not a failure of the host, do not cache
+            return None
+        except (
+            RequestException, StatusCodeError,
+            ContentTypeError, ContentLengthError,
+        ):
+            title = None
+            ttl = HOME_TITLE_NEGATIVE_TTL
+        else:
+            ttl = None
+        HOME_TITLE_CACHE.set(key, title, ttl)
+    return title
+
+
+def home_url(url: str) -> str:
+    """Return the scheme://netloc part of the url."""
+    scheme, netloc = urlparse(url)[:2]
+    return f'{scheme}://{netloc}'
+
+
+class HomeTitleMissing(Exception):
+
+    """Raise when HomeTitle.get needs a title that must not be fetched."""
+
+    pass
+
+
+class HomeTitle:
+
+    """Provide the homepage title of a URL, fetching it only when needed.
+
+    Use home_title() to create instances. The homepage is requested on the
+    first call to get(), unless prefetch() has already submitted the request
+    to the shared executor. If fetch is False, get() raises HomeTitleMissing
+    instead of requesting the homepage; the title can then be given by set().
+    """
+
+    __slots__ = ('url', 'used', 'fetch', '_task', '_result', '_lock')
+
+    def __init__(self, url: str, fetch: bool = True):
+        self.url = url
+        self.used = False
+        self.fetch = fetch
+        self._task = None
+        self._result = MISSING
+        self._lock = Lock()
+
+    def set(self, title: Optional[str]) -> None:
+        """Use the given title instead of fetching it."""
+        with self._lock:
+            self._result = title
+
+    def prefetch(self) -> None:
+        """Start fetching the title in the background."""
+        with self._lock:
+            if self._task is None and self._result is MISSING:
+                self._task = submit('urls', get_home_title, self.url)
+
+    def get(self) -> Optional[str]:
+        """Return the homepage title or None if it is not available."""
+        self.used = True
+        with self._lock:
+            if self._result is MISSING:
+                if self._task is None:
+                    if not self.fetch:
+                        raise HomeTitleMissing(self.url)
+                    self._result = get_home_title(self.url)
+                else:
+                    self._result = result_or_none(self._task, remaining())
+            return self._result
+
+
+def home_title(url: str) -> HomeTitle:
+    """Return the HomeTitle of the url.
+
+    The title is prefetched if the homepage title has often been needed for
+    the pages of the same host.
+    """
+    provider = HomeTitle(url)
+    if should_prefetch_home_title(url):
+        provider.prefetch()
+    return provider
+
+
+def should_prefetch_home_title(url: str) -> bool:
+    """Return True if the homepage title is usually needed for the host."""
+    netloc = urlparse(url).netloc.lower()
+    used, total = HOME_TITLE_STATS.get(netloc, (0, 0))
+    return (
+        total >= HOME_TITLE_PREFETCH_MIN_SAMPLES
+        and used >= total * HOME_TITLE_PREFETCH_RATIO)
+
+
+def record_home_title_usage(provider: HomeTitle) -> None:
+    """Update the per-host statistics used for prefetching decisions."""
+    netloc = urlparse(provider.url).netloc.lower()
+    with HOME_TITLE_STATS_LOCK:
+        used, total = HOME_TITLE_STATS.get(netloc, (0, 0))
+        HOME_TITLE_STATS.set(netloc, (used + provider.used, total + 1))
+
+
+def fetch_home_title(home_url: str) -> Optional[str]:
+    """Return the title of the given homepage."""
+    with request(
+        home_url, spoof=True, stream=True
+    ) as r:
+        check_response_headers(r)
         content = next(r.iter_content(MAX_RESPONSE_LENGTH))
-    m = CHARSET(content)
-    html = content.decode(m[1].decode() if m else r.encoding)
+    html = decode_html(content, r.encoding)
+    m = TITLE_TAG(html)
+    return html_unescape(m['result']) if m else None
+
+
+async def fetch_home_title_async(home_url: str) -> Optional[str]:
+    """Return the title of the given homepage."""
+    html = await get_html_async(home_url)
     m = TITLE_TAG(html)
-    title = html_unescape(m['result']) if m else None
-    home_title_list.append(title)
+    return html_unescape(m['result']) if m else None
 
 
 def check_response_headers(r: RequestsResponse) -> None:
@@ -534,29 +638,146 @@ def check_response_headers(r: RequestsResponse) -> None:
     return
 
 
-def get_html(url: str) -> str:
-    """Return the html string for the given url."""
+def decode_html(content: bytes, encoding: Optional[str]) -> str:
+    """Decode content using its meta charset or the given encoding."""
+    charset_match = CHARSET(content)
+    return content.decode(
+        charset_match[1].decode() if charset_match else encoding)
+
+
+def head_has_metadata(head: str) -> bool:
+    """Return True if head contains title, author, and date metadata.
+
+    Used with get_html to avoid reading the body of the page when the title,
+    byline, and date extractors do not need it. A <title> tag is not enough,
+    find_title prefers the headings of the body to it.
+    """
+    meta = meta_index(head)
+    return (
+        first_meta(meta, *TITLE_META_NAMES) is not None
+        and find_meta_date(meta) is not None
+        and bool(find_meta_authors(head))
+    )
+
+
+def get_html(
+    url: str, head_is_enough: Callable[[str], bool] = None
+) -> str:
+    """Return the html string for the given url.
+
+    If head_is_enough is given, the response is read in chunks and as soon as
+    the end of <head> is received, head_is_enough is called with the decoded
+    head. Reading the rest of the response is skipped if it returns True.
+    """
     with request(
         url, stream=True, spoof=True
     ) as r:
         check_response_headers(r)
-        content = next(r.iter_content(MAX_RESPONSE_LENGTH))
-    charset_match = CHARSET(content)
-    return content.decode(
-        charset_match[1].decode() if charset_match else r.encoding)
+        if head_is_enough is None:
+            content = next(r.iter_content(MAX_RESPONSE_LENGTH))
+        else:
+            page = PageReader(r.encoding, head_is_enough)
+            for chunk in r.iter_content(HEAD_CHUNK_SIZE):
+                if page.feed(chunk):
+                    break
+            content = bytes(page.content)
+    return decode_html(content, r.encoding)
+
+
+async def get_html_async(
+    url: str, head_is_enough: Callable[[str], bool] = None
+) -> str:
+    """Return the html string for the given url; async version of get_html."""
+    async with async_stream(url, spoof=True) as r:
+        check_response_headers(r)
+        page = PageReader(r.encoding, head_is_enough)
+        async for chunk in r.iter_content(
+            MAX_RESPONSE_LENGTH if head_is_enough is None
+            else HEAD_CHUNK_SIZE
+        ):
+            if page.feed(chunk):
+                break
+    return decode_html(bytes(page.content), r.encoding)
+
+
+class PageReader:
+
+    """Collect the chunks of a page until the rest of it is not needed.
+
+    See get_html for head_is_enough.
+    """
+
+    __slots__ = ('content', 'encoding', 'head_is_enough', '_head_end')
+
+    def __init__(
+        self, encoding: Optional[str],
+        head_is_enough: Optional[Callable[[str], bool]],
+    ):
+        self.content = bytearray()
+        self.encoding = encoding
+        self.head_is_enough = head_is_enough
+        self._head_end = None
+
+    def feed(self, chunk: bytes) -> bool:
+        """Add the chunk; return True if no more chunks are needed."""
+        content = self.content
+        # </head> may be split between the previous and this chunk
+        search_start = max(len(content) - 7, 0)
+        content += chunk
+        if len(content) >= MAX_RESPONSE_LENGTH:
+            del content[MAX_RESPONSE_LENGTH:]
+            return True
+        if self._head_end is None and self.head_is_enough is not None:
+            head_end = self._head_end = HEAD_END_SEARCH(content, search_start)
+            if head_end is not None and self.head_is_enough(decode_html(
+                bytes(content[:head_end.end()]), self.encoding)
+            ):
+                # the chunk may end in the middle of a multibyte character
+                del content[head_end.end():]
+                return True
+        return False
 
 
 def url2dict(url: str) -> Dict[str, Any]:
     """Get url and return the result as a dictionary."""
+    home_title_provider = home_title(url)
+    html = get_html(url, head_has_metadata)
+    d = html_to_dict(url, html, home_title_provider)
+    record_home_title_usage(home_title_provider)
+    return d
+
+
+async def url2dict_async(url: str) -> Dict[str, Any]:
+    """Get url and return the result as a dictionary; async version."""
+    provider = HomeTitle(url, fetch=False)
+    cached_title = HOME_TITLE_CACHE.get(home_url(url).lower())
+    if cached_title is not MISSING:
+        provider.set(cached_title)
+        title_task = None
+    elif should_prefetch_home_title(url):
+        title_task = create_task(get_home_title_async(url))
+    else:
+        title_task = None
+    html = await get_html_async(url, head_has_metadata)
+    if title_task is not None:
+        provider.set(await title_task)
+    try:
+        d = html_to_dict(url, html, provider)
+    except HomeTitleMissing:
+        provider.set(await get_home_title_async(url))
+        d = html_to_dict(url, html, provider)
+    record_home_title_usage(provider)
+    return d
+
+
+@timed('url2dict')
+def html_to_dict(
+    url: str, html: str, home_title_provider: 'HomeTitle'
+) -> Dict[str, Any]:
+    """Return the dictionary of the given page."""
     d = defaultdict(lambda: None)
-    # Creating a thread to request homepage title in background
-    home_title_list = []  # A mutable variable used to get the thread result
-    home_title_thread = Thread(
-        target=get_home_title, args=(url, home_title_list))
-    home_title_thread.start()
-
-    html = get_html(url)
-    d['url'] = find_url(html, url)
+    meta = meta_index(html)
+    d['url'] = find_url(meta, url)
     m = TITLE_TAG(html)
     html_title = html_unescape(m['result']) if m else None
     if html_title:
@@ -565,22 +786,22 @@ def url2dict(url: str) -> Dict[str, Any]:
     authors = find_authors(html)
     if authors:
         d['authors'] = authors
-    d['issn'] = find_issn(html)
-    d['pmid'] = find_pmid(html)
-    d['doi'] = find_doi(html)
-    d['volume'] = find_volume(html)
-    d['issue'] = find_issue(html)
-    d['page'] = find_pages(html)
-    d['journal'] = find_journal(html)
+    d['issn'] = find_issn(meta)
+    d['pmid'] = find_pmid(meta)
+    d['doi'] = find_doi(meta)
+    d['volume'] = find_volume(meta)
+    d['issue'] = find_issue(meta)
+    d['page'] = find_pages(meta)
+    d['journal'] = find_journal(meta)
     if d['journal']:
         d['cite_type'] = 'journal'
     else:
         d['cite_type'] = 'web'
         d['website'] = find_site_name(
-            html, html_title, url, authors, home_title_list, home_title_thread)
+            meta, html_title, url, authors, home_title_provider)
     d['title'] = find_title(
-        html, html_title, url, authors, home_title_list, home_title_thread)
-    date = find_date(html, url)
+        html, meta, html_title, url, authors, home_title_provider)
+    date = find_date(html, meta, url)
     if date:
         d['date'] = date
         d['year'] = str(date.year)
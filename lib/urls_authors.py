@@ -6,6 +6,7 @@ from typing import List, Optional, Tuple
 from regex import compile as regex_compile, VERBOSE, IGNORECASE, ASCII
 
 from lib.commons import ANYDATE_SEARCH, first_last, InvalidNameError
+from lib.spans import timed
 
 
 # Names in byline are required to be two or three parts
@@ -182,8 +183,8 @@ STOPWORDS_SEARCH = regex_compile(
 FOUR_DIGIT_NUM = regex_compile(r'\d\d\d\d').search
 
 
-def find_authors(html) -> Optional[List[Tuple[str, str]]]:
-    """Return authors names found in html."""
+def find_meta_authors(html) -> List[Tuple[str, str]]:
+    """Return authors names found in the author meta tags of html."""
     names = []
     match_id = None
     for match in META_AUTHOR_FINDITER(html):
@@ -193,6 +194,13 @@ def find_authors(html) -> Optional[List[Tuple[str, str]]]:
         if name:
             names.extend(name)
             match_id = match['id']
+    return names
+
+
+@timed('find_authors')
+def find_authors(html) -> Optional[List[Tuple[str, str]]]:
+    """Return authors names found in html."""
+    names = find_meta_authors(html)
     if names:
         return names
     match_id = None
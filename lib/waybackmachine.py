@@ -1,7 +1,6 @@
 """Define related tools for web.archive.org (aka Wayback Machine)."""
 
 import logging
-from threading import Thread
 from datetime import date
 from urllib.parse import urlparse
 
@@ -9,9 +8,12 @@ from regex import compile as regex_compile
 from requests import ConnectionError as RequestsConnectionError
 
 from lib.commons import dict_to_sfn_cit_ref
+from lib.deadline import remaining
+from lib.executor import submit, result_or_none
 from lib.urls import (
-    urls_scr, url2dict, get_home_title, get_html, find_authors,
-    find_journal, find_site_name, find_title, ContentTypeError,
+    urls_scr, url2dict, home_title, record_home_title_usage, get_html,
+    head_has_metadata, find_authors,
+    find_journal, find_site_name, find_title, meta_index, ContentTypeError,
     ContentLengthError, StatusCodeError, TITLE_TAG
 )
 
@@ -32,11 +34,7 @@ def waybackmachine_scr(
         return urls_scr(archive_url, date_format)
     archive_year, archive_month, archive_day, original_url = \
         m.groups()
-    original_dict = {}
-    thread = Thread(
-        target=original_url2dict, args=(original_url, original_dict)
-    )
-    thread.start()
+    original_task = submit('waybackmachine', original_url2dict, original_url)
     try:
         archive_dict = url2dict(archive_url)
     except (ContentTypeError, ContentLengthError) as e:
@@ -49,7 +47,7 @@ def waybackmachine_scr(
     archive_dict['archive-date'] = date(
         int(archive_year), int(archive_month), int(archive_day)
     )
-    thread.join()
+    original_dict = result_or_none(original_task, remaining())
     if original_dict:
         # The original_process has been successful
         if (
@@ -72,11 +70,11 @@ def waybackmachine_scr(
     return dict_to_sfn_cit_ref(archive_dict)
 
 
-def original_url2dict(ogurl: str, original_dict) -> None:
-    """Fill the dictionary with the information found in ogurl."""
+def original_url2dict(ogurl: str) -> dict:
+    """Return the information found in ogurl or {} in case of errors."""
     # noinspection PyBroadException
     try:
-        original_dict.update(original_url_dict(ogurl))
+        return original_url_dict(ogurl)
     except (
         ContentTypeError,
         ContentLengthError,
@@ -88,18 +86,15 @@ def original_url2dict(ogurl: str, original_dict) -> None:
         logger.exception(
             'There was an unexpected error in waybackmechine thread'
         )
+    return {}
 
 
 def original_url_dict(url: str):
     """Retuan dictionary only containing required data for og:url."""
     d = {}
-    # Creating a thread to request homepage title in background
-    hometitle_list = []  # A mutable variable used to get the thread result
-    home_title_thread = Thread(
-        target=get_home_title, args=(url, hometitle_list)
-    )
-    home_title_thread.start()
-    html = get_html(url)
+    home_title_provider = home_title(url)
+    html = get_html(url, head_has_metadata)
+    meta = meta_index(html)
     m = TITLE_TAG(html)
     html_title = m['result'] if m else None
     if html_title:
@@ -107,18 +102,19 @@ def original_url_dict(url: str):
     authors = find_authors(html)
     if authors:
         d['authors'] = authors
-    journal = find_journal(html)
+    journal = find_journal(meta)
     if journal:
         d['journal'] = journal
         d['cite_type'] = 'journal'
     else:
         d['cite_type'] = 'web'
         d['website'] = find_site_name(
-            html, html_title, url, authors, hometitle_list, home_title_thread
+            meta, html_title, url, authors, home_title_provider
         )
     d['title'] = find_title(
-        html, html_title, url, authors, hometitle_list, home_title_thread
+        html, meta, html_title, url, authors, home_title_provider
     )
+    record_home_title_usage(home_title_provider)
     return d
 
 
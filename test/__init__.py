@@ -1,18 +1,27 @@
 from contextlib import contextmanager
 from hashlib import sha1
 from json import dump, loads, load
+from os.path import dirname
+from tempfile import TemporaryDirectory
 from typing import Optional
 from functools import partial
 
 from requests import Session, Response, ConnectionError as RConnectionError
 
+import config
+
 # Do not import library parts here. commons.py should not be loaded
 # until LANG is set by test_fa and test_en.
 
+# keep the logs of test runs out of the source directory; created before
+# app registers the atexit stop of its log writer, so removed after it
+LOG_DIR = TemporaryDirectory(prefix='citer-test-logs-')
+config.LOG_DIR = LOG_DIR.name
+
 
 FORCE_CACHE_OVERWRITE = False  # Use for updating cache entries
 PREVENT_WRITING = True
-TESTDATA = __file__ + '/../testdata'
+TESTDATA = dirname(__file__) + '/testdata'
 
 
 json_dump = partial(
@@ -130,5 +139,10 @@ def real_request():
     Session.request = fake_request
 
 
+def install_replay():
+    """Serve the requests of Session from TESTDATA instead of the network."""
+    Session.request = fake_request
+
+
 original_request = Session.request
-Session.request = fake_request
+install_replay()
@@ -0,0 +1,54 @@
+from time import time
+from unittest.mock import patch
+
+# noinspection PyPackageRequirements
+from pytest import raises
+
+from lib.admission import Overloaded, admit, gate, header_queue_time, \
+    share_limits, stats
+
+
+def test_in_flight_limit():
+    with patch.dict('lib.admission.ADMISSION_LIMITS', {'test-kind': 1}):
+        with admit('test-kind'):
+            with raises(Overloaded):
+                with admit('test-kind'):
+                    pass
+            # other kinds are not affected
+            with admit('test-other-kind'):
+                pass
+        with admit('test-kind', .5):
+            pass
+    s = stats()['test-kind']
+    assert s['in_flight'] == 0
+    assert s['admitted'] == 2
+    assert s['rejected'] == 1
+    assert s['max_queue_time'] == .5
+
+
+def test_long_queued_requests_are_shed():
+    with patch('lib.admission.ADMISSION_MAX_QUEUE_TIME', 1):
+        with raises(Overloaded):
+            with admit('test-queued', 2):
+                pass
+
+
+def test_header_queue_time():
+    assert header_queue_time(None) == 0
+    assert header_queue_time('invalid') == 0
+    now = time()
+    assert 9 < header_queue_time(f't={now - 10:.3f}') < 11
+    assert 9 < header_queue_time(str(int((now - 10) * 1e3))) < 11
+    assert 9 < header_queue_time(str(int((now - 10) * 1e6))) < 11
+
+
+def test_limits_are_shared_between_processes():
+    with patch.dict('lib.admission.ADMISSION_LIMITS', {'test-shared': 10}):
+        kind_gate = gate('test-shared')
+        share_limits(4)
+        try:
+            assert kind_gate.limit == 2
+            assert gate('test-shared-default').limit == 4
+        finally:
+            share_limits(1)
+        assert kind_gate.limit == 10
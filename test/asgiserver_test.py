@@ -0,0 +1,97 @@
+from asyncio import Event, create_task, open_connection, run, sleep, wait_for
+
+from lib.asgiserver import Server
+
+
+def make_app(release: Event, log: list):
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                log.append(message['type'])
+                await send({'type': message['type'] + '.complete'})
+                if message['type'] == 'lifespan.shutdown':
+                    return
+        await receive()
+        if scope['path'] == '/slow':
+            await release.wait()
+        body = scope['query_string'] or b'ok'
+        await send({
+            'type': 'http.response.start', 'status': 200,
+            'headers': [(b'content-type', b'text/plain')]})
+        await send({'type': 'http.response.body', 'body': body})
+    return app
+
+
+async def get(port, *targets) -> list:
+    """Send the requests over one keep-alive connection."""
+    reader, writer = await open_connection('127.0.0.1', port)
+    bodies = []
+    for target in targets:
+        writer.write(f'GET {target} HTTP/1.1\r\nHost: x\r\n\r\n'.encode())
+        assert (await reader.readline()).startswith(b'HTTP/1.1 200')
+        while await reader.readline() != b'\r\n':
+            pass
+        body = b''
+        while True:  # chunked
+            size = int(await reader.readline(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            body += chunk[:-2]
+        bodies.append(body)
+    writer.close()
+    return bodies
+
+
+def test_concurrency_limit_and_graceful_shutdown():
+    async def main():
+        release, log = Event(), []
+        server = Server(make_app(release, log), '127.0.0.1', 0, 1, 5)
+        serving = create_task(server.serve())
+        await sleep(0)  # the events are created by serve()
+        await server.started.wait()
+        assert await get(server.port, '/?a', '/?b') == [b'a', b'b']
+        slow = create_task(get(server.port, '/slow'))
+        while server.active == 0:
+            await sleep(.001)
+        fast = create_task(get(server.port, '/'))
+        while server.waiting == 0:
+            await sleep(.001)
+        assert server.active == 1
+        server.stop()
+        await sleep(.01)
+        # in-flight and waiting requests are completed before exiting
+        assert not serving.done()
+        release.set()
+        assert await wait_for(slow, 5) == [b'ok']
+        assert await wait_for(fast, 5) == [b'ok']
+        await wait_for(serving, 5)
+        assert log == ['lifespan.startup', 'lifespan.shutdown']
+        assert server.served == 4
+
+    run(main())
+
+
+def test_content_length_is_checked():
+    async def status(content_length: str) -> bytes:
+        reader, writer = await open_connection('127.0.0.1', server.port)
+        writer.write(
+            f'POST / HTTP/1.1\r\nContent-Length: {content_length}\r\n\r\n'
+            .encode())
+        status_line = await reader.readline()
+        writer.close()
+        return status_line.split()[1]
+
+    async def main():
+        serving = create_task(server.serve())
+        await sleep(0)
+        await server.started.wait()
+        assert await status('-1') == b'400'
+        assert await status('x') == b'400'
+        assert await status('10000000000') == b'413'
+        server.stop()
+        await wait_for(serving, 5)
+
+    server = Server(make_app(Event(), []), '127.0.0.1', 0, max_body_size=9)
+    run(main())
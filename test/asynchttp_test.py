@@ -0,0 +1,167 @@
+from asyncio import gather, run
+from gzip import compress
+from http.server import BaseHTTPRequestHandler, HTTPServer, \
+    ThreadingHTTPServer
+from threading import Thread
+from unittest.mock import patch
+
+# noinspection PyPackageRequirements
+from pytest import fixture, raises
+from requests import ConnectionError as RequestsConnectionError
+
+from lib.asynchttp import request, stream
+from lib.connpool import stats
+from lib.deadline import deadline, DeadlineExceeded
+from lib.httpcache import HTTPCache
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    count = 0
+
+    def send_body(self, body: bytes):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/port':
+            self.send_body(str(self.client_address[1]).encode())
+        elif self.path == '/drop':  # close without Connection: close
+            self.send_body(b'ok')
+            self.close_connection = True
+        elif self.path == '/count':
+            Handler.count += 1
+            self.send_body(str(Handler.count).encode())
+        elif self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/gzip')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+        elif self.path == '/gzip':
+            body = compress('سلام'.encode())
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Encoding', 'gzip')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif self.path == '/chunked':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'2\r\n{"\r\n5\r\na": 1\r\n1\r\n}\r\n0\r\n\r\n')
+        elif self.path == '/chunked-trailer':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'2\r\n{}\r\n0\r\nX-Sum: 1\r\n\r\n')
+        elif self.path == '/chunked-eof':
+            self.send_response(200)
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.wfile.write(b'2\r\n{}\r\n')
+            self.close_connection = True
+        else:
+            self.send_response(500)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    def log_message(self, *_):
+        pass
+
+
+@fixture(scope='module')
+def base_url():
+    # threads: pooled connections of earlier tests stay open
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_port}'
+    server.shutdown()
+    server.server_close()
+
+
+def test_redirect_and_gzip(base_url):
+    r = run(request(base_url + '/redirect'))
+    assert r.status_code == 200
+    assert r.url == base_url + '/gzip'
+    assert r.text == 'سلام'
+
+
+def test_chunked_json(base_url):
+    r = run(request(base_url + '/chunked'))
+    assert r.json() == {'a': 1}
+
+
+def test_chunked_trailer_and_eof(base_url):
+    assert run(request(base_url + '/chunked-trailer')).json() == {}
+    assert run(request(base_url + '/chunked-eof')).content == b'{}'
+
+
+def test_connections_are_reused(base_url):
+    async def ports():
+        return [
+            (await request(base_url + '/port')).text
+            for i in range(3)]
+
+    before = stats().get('127.0.0.1', {}).get('hits', 0)
+    assert len(set(run(ports()))) == 1
+    assert stats()['127.0.0.1']['hits'] == before + 2
+
+
+def test_connection_closed_by_server(base_url):
+    async def drops():
+        return [(await request(base_url + '/drop')).text for _ in '12']
+
+    assert run(drops()) == ['ok', 'ok']
+
+
+def test_stream_stops_early(base_url):
+    async def first_chunk():
+        async with stream(base_url + '/chunked') as r:
+            async for chunk in r.iter_content(1):
+                return chunk
+
+    assert run(first_chunk()) == b'{"'
+
+
+def test_identical_requests_are_coalesced(base_url):
+    async def counts():
+        return await gather(*(request(base_url + '/count') for _ in '12'))
+
+    first, second = run(counts())
+    assert first is second
+
+
+def test_http_cache(base_url, tmp_path):
+    cache = HTTPCache(str(tmp_path / 'cache.sqlite'), 60, 100)
+    with patch('lib.asynchttp.HTTP_CACHE', cache), \
+            patch('lib.asynchttp.is_cacheable_host', return_value=True):
+        first = run(request(base_url + '/count')).content
+        assert run(request(base_url + '/count')).content == first
+    assert cache.hits == 1
+
+
+def test_max_length(base_url):
+    r = run(request(base_url + '/gzip', max_length=2))
+    assert r.content == 'سلام'.encode()[:2]
+
+
+def test_refused_connection():
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    port = server.server_port
+    server.server_close()
+    with raises(RequestsConnectionError):
+        run(request(f'http://127.0.0.1:{port}/'))
+
+
+def test_deadline(base_url):
+    async def expired():
+        with deadline(0):
+            await request(base_url + '/gzip')
+
+    with raises(DeadlineExceeded):
+        run(expired())
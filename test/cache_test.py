@@ -0,0 +1,25 @@
+from unittest.mock import patch
+
+from lib.cache import TTLCache, MISSING
+
+
+def test_lru_eviction():
+    c = TTLCache(maxsize=2, ttl=10)
+    c.set('a', 1)
+    c.set('b', 2)
+    assert c.get('a') == 1  # 'b' becomes the least recently used
+    c.set('c', 3)
+    assert c.get('b') is MISSING
+    assert c.get('a') == 1
+    assert c.get('c') == 3
+
+
+def test_expiry():
+    c = TTLCache(maxsize=2, ttl=10)
+    with patch('lib.cache.monotonic', return_value=0):
+        c.set('a', 1)
+        c.set('b', None, ttl=1)
+    with patch('lib.cache.monotonic', return_value=5):
+        assert c.get('a') == 1
+        assert c.get('b', 'default') == 'default'
+    assert len(c) == 1
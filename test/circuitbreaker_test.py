@@ -0,0 +1,62 @@
+from unittest.mock import patch
+
+# noinspection PyPackageRequirements
+from pytest import raises
+from requests import Timeout
+
+from lib.circuitbreaker import (
+    CircuitBreaker, CircuitOpenError, FAILURE_THRESHOLD, COOL_DOWN, CLOSED,
+    OPEN, HALF_OPEN)
+from lib.commons import TIMEOUT
+from lib.deadline import deadline
+from lib.ketabir import isbn2url
+
+
+def test_opens_after_consecutive_failures():
+    b = CircuitBreaker('example.org')
+    with patch('lib.circuitbreaker.monotonic', return_value=100):
+        for _ in range(FAILURE_THRESHOLD - 1):
+            b.check()
+            b.failed()
+        b.succeeded()  # resets the count
+        for _ in range(FAILURE_THRESHOLD):
+            b.check()
+            b.failed()
+        assert b.state == OPEN
+        with raises(CircuitOpenError):
+            b.check()
+    assert b.short_circuited == 1
+
+
+def test_half_open_probe():
+    b = CircuitBreaker('example.org')
+    with patch('lib.circuitbreaker.monotonic', return_value=100):
+        for _ in range(FAILURE_THRESHOLD):
+            b.failed()
+    with patch('lib.circuitbreaker.monotonic', return_value=100 + COOL_DOWN):
+        b.check()  # the probe
+        assert b.state == HALF_OPEN
+        with raises(CircuitOpenError):
+            b.check()  # only one probe at a time
+        b.failed()
+        assert b.state == OPEN
+    with patch(
+        'lib.circuitbreaker.monotonic', return_value=100 + 2 * COOL_DOWN
+    ):
+        b.check()
+        b.succeeded()
+        assert b.state == CLOSED
+        b.check()
+
+
+def test_ketabir_ignores_timeouts_shortened_by_the_deadline():
+    b = CircuitBreaker('www.ketab.ir')
+    with patch.dict('lib.circuitbreaker._breakers', {'www.ketab.ir': b}), \
+            patch('lib.ketabir.StatefulBrowser') as browser:
+        browser.return_value.open.side_effect = Timeout
+        with deadline(TIMEOUT / 2), raises(Timeout):
+            isbn2url('9789643376676')
+        assert b.failures == 0
+        with raises(Timeout):
+            isbn2url('9789643376676')
+        assert b.failures == 1
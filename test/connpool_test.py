@@ -0,0 +1,46 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from threading import Thread
+from unittest.mock import patch
+
+from requests import Request
+
+from lib.connpool import PoolingAdapter, stats
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', '2')
+        self.end_headers()
+        self.wfile.write(b'ok')
+
+    def log_message(self, *_):
+        pass
+
+
+def test_pool_reuse_and_reaping():
+    server = HTTPServer(('127.0.0.1', 0), Handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    adapter = PoolingAdapter()
+    # Session.request is replaced by the test fixtures, use the adapter
+    request = Request(
+        'GET', f'http://127.0.0.1:{server.server_port}/').prepare()
+    # the counters are per host and shared with other tests
+    before = stats().get('127.0.0.1', dict.fromkeys(
+        ('misses', 'hits', 'reaped'), 0))
+    try:
+        assert adapter.send(request).content == b'ok'
+        assert adapter.send(request).content == b'ok'
+        with patch('lib.connpool.CONNECTION_IDLE_TIMEOUT', -1):
+            assert adapter.send(request).content == b'ok'
+    finally:
+        adapter.close()
+        server.shutdown()
+        server.server_close()
+    s = stats()['127.0.0.1']
+    assert (
+        s['misses'] - before['misses'], s['hits'] - before['hits'],
+        s['reaped'] - before['reaped']) == (1, 1, 1)
@@ -0,0 +1,20 @@
+from unittest.mock import patch
+
+# noinspection PyPackageRequirements
+from pytest import raises
+
+from lib.deadline import deadline, call_timeout, remaining, DeadlineExceeded
+from lib.executor import submit
+
+
+def test_call_timeout():
+    assert remaining() is None
+    assert call_timeout(10) == 10
+    with patch('lib.deadline.monotonic', return_value=100):
+        with deadline(3):
+            assert call_timeout(10) == 3
+            # tasks inherit the deadline of the submitter
+            assert submit('test_deadline', remaining).result() == 3
+    with deadline(0), raises(DeadlineExceeded):
+        call_timeout(10)
+    assert remaining() is None
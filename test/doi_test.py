@@ -1,4 +1,9 @@
-from lib.doi import doi_scr
+from asyncio import run
+from unittest.mock import Mock, patch
+
+from lib.doi import (
+    doi_scr, get_crossref_dict, get_crossref_dict_async,
+    prefetch_crossref_dicts)
 
 
 def test_doi1():
@@ -122,3 +127,44 @@ def test_bad_author_name():
         '| publisher=Springer Nature | volume=2017 | issue=10 '
         '| year=2017 | issn=1029-8479 | doi=10.1007/jhep10(2017)157}}'
     ) == doi_scr('10.1007/JHEP10(2017)157')[1]
+
+
+def test_crossref_bulk_prefetch():
+    items = [
+        {'DOI': '10.1000/ABC', 'type': 'journal-article', 'title': ['A'],
+         'issued': {'date-parts': [[2001, 2]]},
+         'author': [{'given': 'G', 'family': 'F'}]},
+        {'DOI': '10.1000/def', 'type': 'book', 'title': ['D'],
+         'issued': {'date-parts': [[2002]]}},
+    ]
+    response = Mock()
+    response.json.return_value = {
+        'status': 'ok', 'message': {'items': items}}
+    with patch('lib.doi.request', return_value=response) as request:
+        prefetch_crossref_dicts(['10.1000/abc', '10.1000/def', '10.1000/ABC'])
+        a = get_crossref_dict('10.1000/Abc')
+        d = get_crossref_dict('10.1000/def')
+    request.assert_called_once_with(
+        'http://api.crossref.org/v1/works?rows=2'
+        '&filter=doi:10.1000/abc,doi:10.1000/def')
+    assert a['title'] == 'A'
+    assert (a['year'], a['month']) == ('2001', '2')
+    assert a['authors'] == [('G', 'F')]
+    assert d['cite_type'] == 'book'
+    assert d['year'] == '2002'
+
+
+def test_crossref_bulk_prefetch_async():
+    response = Mock()
+    response.json.return_value = {'status': 'ok', 'message': {'items': [
+        {'DOI': '10.1000/GHI', 'type': 'book', 'title': ['G'],
+         'issued': {'date-parts': [[2003]]}}]}}
+
+    async def async_request(_):
+        raise AssertionError('the prefetched result was not used')
+
+    with patch('lib.doi.request', return_value=response), \
+            patch('lib.doi.async_request', async_request):
+        prefetch_crossref_dicts(['10.1000/ghi', '10.1000/jkl'])
+        d = run(get_crossref_dict_async('10.1000/ghi'))
+    assert d['title'] == 'G'
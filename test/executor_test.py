@@ -0,0 +1,64 @@
+from concurrent.futures import Future
+from threading import Event, get_ident
+from unittest.mock import patch
+
+from lib import executor
+from lib.deadline import remaining
+from lib.executor import submit, result_or_none, stats
+
+
+def test_group_limit_and_inline_run():
+    release = Event()
+    with patch.dict(executor.GROUP_LIMITS, {'test_limited': 1}):
+        blocking = submit('test_limited', release.wait)
+        waiting = submit('test_limited', get_ident)
+        # waiting cannot start in the pool before blocking releases the
+        # group semaphore
+        assert not waiting.done()
+        release.set()
+        assert blocking.result() is True
+        assert isinstance(waiting.result(), int)
+    s = stats()['test_limited']
+    assert s['queued'] == s['running'] == 0
+    assert s['completed'] == 2
+
+
+def test_result_or_none():
+    def fail():
+        raise ValueError
+    assert result_or_none(submit('test_fail', fail)) is None
+    assert submit('test_inline', get_ident).result() is not None
+
+
+def test_inline_run_gets_the_timeout_as_deadline():
+    # futures that no pool worker starts, so result() runs the task inline
+    with patch.object(executor.EXECUTOR, 'submit', lambda _: Future()):
+        assert 0 < submit('test_deadline', remaining).result(5) <= 5
+        assert submit('test_deadline', remaining).result() is None
+
+
+def test_cancelled_tasks_are_counted_once():
+    with patch.object(executor.EXECUTOR, 'submit', lambda _: Future()):
+        task = submit('test_cancel', get_ident)
+    # e.g. asyncio.wrap_future cancels the future of a cancelled await
+    task.future.cancel()
+    assert task.cancel() and task.cancel()
+    s = stats()['test_cancel']
+    assert s['cancelled'] == 1
+    assert s['queued'] == 0
+
+
+def test_full_group_does_not_occupy_the_pool():
+    release = Event()
+    with patch.dict(executor.GROUP_LIMITS, {'test_full': 1}):
+        tasks = [
+            submit('test_full', release.wait)
+            for _ in range(2 * executor.MAX_WORKERS)]
+        # the future is set by a pool worker, result() would run it inline
+        assert submit('test_other', get_ident).future.result(5)
+        assert stats()['test_full']['running'] <= 1
+        release.set()
+        assert all(task.future.result(5) for task in tasks)
+    s = stats()['test_full']
+    assert s['queued'] == s['running'] == 0
+    assert s['completed'] == 2 * executor.MAX_WORKERS
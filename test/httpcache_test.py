@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+from requests import Response
+
+from lib.httpcache import HTTPCache, freshness_lifetime, is_cacheable_host
+
+
+URL = 'https://api.crossref.org/works/10.1/x'
+
+
+def response(status_code=200, content=b'', **headers) -> Response:
+    r = Response()
+    r.url = URL
+    r.status_code = status_code
+    r.headers.update(headers)
+    r._content = content
+    return r
+
+
+class FakeSend:
+
+    def __init__(self, *responses):
+        self.responses = [*responses]
+        self.calls = []
+
+    def __call__(self, method, url, headers, **kwargs):
+        self.calls.append(headers)
+        return self.responses.pop(0)
+
+
+def test_cacheable_host():
+    assert is_cacheable_host(URL)
+    assert is_cacheable_host('https://books.google.co.uk/books?id=1')
+    assert not is_cacheable_host('https://example.com/')
+
+
+def test_freshness_lifetime():
+    assert freshness_lifetime({'cache-control': 'no-store'}, 9) is None
+    assert freshness_lifetime({'cache-control': 'no-cache'}, 9) == 0
+    assert freshness_lifetime({'cache-control': 'max-age=60'}, 9) == 60
+    assert freshness_lifetime({}, 9) == 9
+
+
+def test_fresh_hit(tmp_path):
+    cache = HTTPCache(str(tmp_path / 'c.sqlite'), 60, 10)
+    send = FakeSend(response(content=b'data'))
+    assert cache.request(send, 'get', URL, {}).content == b'data'
+    cached = cache.request(send, 'get', URL, {})
+    assert cached.content == b'data'
+    assert cached.status_code == 200
+    assert len(send.calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_revalidation(tmp_path):
+    cache = HTTPCache(str(tmp_path / 'c.sqlite'), 60, 10)
+    send = FakeSend(
+        response(
+            content=b'data', etag='"v1"', **{'cache-control': 'max-age=1'}),
+        response(304, **{'cache-control': 'max-age=100'}),
+    )
+    with patch('lib.httpcache.time', return_value=0):
+        cache.request(send, 'get', URL, {})
+    with patch('lib.httpcache.time', return_value=10):
+        revalidated = cache.request(send, 'get', URL, {})
+    assert send.calls[1]['If-None-Match'] == '"v1"'
+    assert revalidated.status_code == 200
+    assert revalidated.content == b'data'
+    assert cache.revalidations == 1
+    with patch('lib.httpcache.time', return_value=50):
+        assert cache.request(send, 'get', URL, {}).content == b'data'
+    assert len(send.calls) == 2
+
+
+def test_no_store(tmp_path):
+    cache = HTTPCache(str(tmp_path / 'c.sqlite'), 60, 10)
+    send = FakeSend(
+        response(content=b'1', **{'cache-control': 'no-store'}),
+        response(content=b'2'),
+    )
+    assert cache.request(send, 'get', URL, {}).content == b'1'
+    assert cache.request(send, 'get', URL, {}).content == b'2'
@@ -0,0 +1,90 @@
+from logging import Formatter, getLogger, INFO
+from queue import Queue
+from unittest.mock import patch
+
+from lib.logqueue import BatchFileHandler, QueueHandler, TracebackSampler, \
+    Writer, split_files, stop
+
+
+def make_logger(tmp_path, name, queue_size=100):
+    handler = BatchFileHandler(tmp_path / 'test.log', delay=True)
+    handler.setFormatter(Formatter('%(message)s'))
+    writer = Writer(handler, queue_size)
+    logger = getLogger(name)
+    logger.propagate = False
+    logger.setLevel(INFO)
+    logger.addHandler(QueueHandler(writer))
+    return logger, writer
+
+
+def fail():
+    raise ValueError('upstream is down')
+
+
+def test_records_are_written_in_the_background(tmp_path):
+    logger, writer = make_logger(tmp_path, 'test_logqueue_write')
+    for i in range(3):
+        logger.info('record %d', i)
+    writer.stop()
+    assert (tmp_path / 'test.log').read_text() == \
+        'record 0\nrecord 1\nrecord 2\n'
+    assert writer.stats()['written'] == 3
+
+
+def test_repeated_tracebacks_are_sampled(tmp_path):
+    logger, writer = make_logger(tmp_path, 'test_logqueue_sample')
+    for i in range(3):
+        try:
+            fail()
+        except ValueError:
+            logger.exception('failure %d', i)
+    writer.stop()
+    log = (tmp_path / 'test.log').read_text()
+    assert log.count('Traceback') == 1
+    assert 'failure 2\n(ValueError, traceback not logged)' in log
+    assert writer.stats()['tracebacks_sampled_out'] == 2
+
+
+def test_full_queue_drops_records(tmp_path):
+    # no writer thread, and not reported by lib.logqueue.stats
+    with patch.object(Writer, 'start'), patch('lib.logqueue._writers', []):
+        logger, writer = make_logger(tmp_path, 'test_logqueue_drop')
+    writer.queue = Queue(1)
+    logger.info('kept')
+    logger.info('dropped')
+    assert writer.dropped == 1
+    assert writer.queue.get_nowait().getMessage() == 'kept'
+
+
+def test_queued_records_are_prepared_copies(tmp_path):
+    with patch.object(Writer, 'start'), patch('lib.logqueue._writers', []):
+        logger, writer = make_logger(tmp_path, 'test_logqueue_prepare')
+    writer.queue = Queue()
+    writer.sampler = TracebackSampler(60)
+    args = ['a']
+    for i in range(2):
+        try:
+            fail()
+        except ValueError:
+            logger.exception('failure %d %s', i, args)
+    args.append('b')
+    first, second = writer.queue.get_nowait(), writer.queue.get_nowait()
+    assert first.args is first.exc_info is first.exc_text is None
+    assert first.getMessage().startswith(
+        "failure 0 ['a']\nTraceback (most recent call last):")
+    assert first.getMessage().endswith('ValueError: upstream is down')
+    assert second.getMessage() == \
+        "failure 1 ['a']\n(ValueError, traceback not logged)"
+
+
+def test_split_files_and_stop(tmp_path):
+    with patch('lib.logqueue._writers', []):
+        logger, writer = make_logger(tmp_path, 'test_logqueue_split')
+        logger.info('parent')
+        writer.stop()
+        writer.start()
+        split_files('1')
+        logger.info('worker')
+        stop()
+    assert (tmp_path / 'test.log').read_text() == 'parent\n'
+    assert (tmp_path / 'test-1.log').read_text() == 'worker\n'
@@ -0,0 +1,46 @@
+# noinspection PyPackageRequirements
+from pytest import raises
+
+from lib.metrics import Counter, ERRORS, Histogram, observe_resolve, \
+    render, upstream
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram('test_seconds', 'Test.', 'kind', buckets=(.1, 1))
+    for value in (.05, .5, .5, 5):
+        h.observe(value, 'doi')
+    [(name, type_, _, samples)] = h.families()
+    assert (name, type_) == ('test_seconds', 'histogram')
+    assert samples == [
+        ('_bucket', {'kind': 'doi', 'le': '0.1'}, 1),
+        ('_bucket', {'kind': 'doi', 'le': '1'}, 3),
+        ('_bucket', {'kind': 'doi', 'le': '+Inf'}, 4),
+        ('_sum', {'kind': 'doi'}, 6.05),
+        ('_count', {'kind': 'doi'}, 4),
+    ]
+
+
+def test_counter():
+    c = Counter('test_total', 'Test.', 'a', 'b')
+    c.inc('x', 'y')
+    c.inc('x', 'y', amount=2)
+    assert c.families()[0][3] == [('', {'a': 'x', 'b': 'y'}, 3)]
+
+
+def test_upstream():
+    assert upstream('https://api.crossref.org/works/10.1') == 'crossref'
+    assert upstream('https://books.google.co.uk/books?id=1') == \
+        'books.google'
+    assert upstream('https://www.jstor.org/stable/1') == 'jstor'
+    assert upstream('https://example.com/') == 'other'
+
+
+def test_observe_resolve_counts_errors_and_render():
+    with raises(KeyError):
+        with observe_resolve('test-kind', 'test_scr'):
+            raise KeyError
+    assert ('', {'exception': 'KeyError'}, 1) in ERRORS.families()[0][3]
+    text = render().decode()
+    assert '# TYPE citer_resolve_seconds histogram\n' in text
+    assert 'citer_resolve_seconds_count' \
+           '{kind="test-kind",resolver="test_scr"} 1\n' in text
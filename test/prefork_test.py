@@ -0,0 +1,44 @@
+from signal import SIGTERM
+from subprocess import PIPE, Popen
+from sys import executable
+from urllib.request import urlopen
+
+from lib.prefork import bind
+
+SCRIPT = '''
+from os import getpid
+from socket import socket
+from sys import argv
+from lib.prefork import serve_socket
+
+
+async def app(scope, receive, send):
+    if scope['type'] != 'http':
+        return
+    await send({
+        'type': 'http.response.start', 'status': 200,
+        'headers': [(b'content-length', b'8')]})
+    await send({
+        'type': 'http.response.body', 'body': b'%08d' % getpid()})
+
+
+serve_socket(app, socket(fileno=int(argv[1])), 2)
+'''
+
+
+def test_workers_share_the_socket_and_stop_on_sigterm():
+    sock = bind('127.0.0.1', 0)
+    port = sock.getsockname()[1]
+    process = Popen(
+        [executable, '-c', SCRIPT, str(sock.fileno())],
+        pass_fds=[sock.fileno()], stderr=PIPE)
+    sock.close()
+    try:
+        pids = {
+            int(urlopen(f'http://127.0.0.1:{port}/', timeout=10).read())
+            for _ in range(20)}
+        # the requests are served by the forked workers
+        assert process.pid not in pids
+    finally:
+        process.send_signal(SIGTERM)
+        assert process.wait(10) == 0, process.stderr.read()
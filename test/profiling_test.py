@@ -0,0 +1,42 @@
+from pstats import Stats
+from unittest.mock import patch
+
+from lib.executor import submit
+from lib.profiling import authorized, profile
+
+
+def profiled_in_worker():
+    return sum(range(10))
+
+
+def test_profile_includes_executor_tasks(tmp_path):
+    with patch('lib.profiling.PROFILE_DIR', str(tmp_path)), \
+            patch('lib.profiling.PROFILE_MAX_FILES', 2):
+        ids = []
+        for _ in range(3):
+            with profile() as profile_id:
+                assert submit('test', profiled_in_worker).result(5) == 45
+            ids.append(profile_id)
+    # only the newest PROFILE_MAX_FILES are kept
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted(
+        i + '.pstats' for i in ids[1:])
+    stats = Stats(str(tmp_path / (ids[2] + '.pstats')))
+    assert any(
+        name == 'profiled_in_worker' for _, _, name in stats.stats)
+
+
+def test_one_profile_at_a_time(tmp_path):
+    with patch('lib.profiling.PROFILE_DIR', str(tmp_path)):
+        with profile() as outer:
+            with profile() as inner:
+                pass
+    assert outer is not None
+    assert inner is None
+
+
+def test_authorized():
+    with patch('lib.profiling.PROFILE_TOKEN', ''):
+        assert not authorized('')
+    with patch('lib.profiling.PROFILE_TOKEN', 'secret'):
+        assert authorized('secret')
+        assert not authorized('wrong')
@@ -1,7 +1,9 @@
+from asyncio import create_task, gather, run, sleep, wait_for
+from threading import Thread
 from unittest.mock import patch, Mock
 
 from lib import pubmed
-from lib.pubmed import pmid_scr, pmcid_scr
+from lib.pubmed import ESummaryBatcher, pmid_scr, pmcid_scr
 
 
 def test_doi_update():
@@ -49,3 +51,74 @@ def test_has_doi_but_no_crossref():
         '| doi=10.1093/bioinformatics/btn450 | pages=2339–2343}}'
     ) in pmcid_scr('2562006', '%d %B %Y')[1]
 
+
+def test_esummary_batching():
+    response = Mock()
+    response.json.return_value = {'result': {
+        'uids': ['1', '2'], '1': {'title': 'one'}, '2': {'title': 'two'}}}
+    batcher = ESummaryBatcher('https://example.org/esummary?id=')
+    with patch('lib.pubmed.request', return_value=response) as request, \
+            patch('lib.pubmed.ESUMMARY_WINDOW', .2):
+        results = {}
+        threads = [
+            Thread(target=lambda i=i: results.update({
+                i: batcher.summary(i)['title']}))
+            for i in ('1', '2')]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    request.assert_called_once()
+    url = request.call_args[0][0]
+    assert sorted(url.rpartition('=')[2].split(',')) == ['1', '2']
+    assert results == {'1': 'one', '2': 'two'}
+
+
+def test_esummary_batching_async():
+    response = Mock()
+    response.json.return_value = {'result': {
+        'uids': ['1', '2'], '1': {'title': 'one'}, '2': {'title': 'two'}}}
+    urls = []
+
+    async def async_request(url):
+        urls.append(url)
+        return response
+
+    async def summaries():
+        return await gather(*(batcher.summary_async(i) for i in '12'))
+
+    batcher = ESummaryBatcher('https://example.org/esummary?id=')
+    with patch('lib.pubmed.async_request', async_request):
+        one, two = run(summaries())
+    assert len(urls) == 1
+    assert sorted(urls[0].rpartition('=')[2].split(',')) == ['1', '2']
+    assert (one['title'], two['title']) == ('one', 'two')
+
+
+def test_esummary_cancelled_leader_async():
+    response = Mock()
+    response.json.return_value = {'result': {
+        'uids': ['1', '2'], '1': {'title': 'one'}, '2': {'title': 'two'}}}
+    urls = []
+
+    async def async_request(url):
+        urls.append(url)
+        return response
+
+    async def summaries():
+        leader = create_task(batcher.summary_async('1'))
+        await sleep(0)  # the leader is in its ESUMMARY_WINDOW sleep
+        follower = create_task(batcher.summary_async('2'))
+        await sleep(0)
+        leader.cancel()
+        two = await follower
+        # the next lookup leads a new batch instead of waiting forever
+        one = await wait_for(batcher.summary_async('1'), 1)
+        return one, two
+
+    batcher = ESummaryBatcher('https://example.org/esummary?id=')
+    with patch('lib.pubmed.async_request', async_request):
+        one, two = run(summaries())
+    assert one == {'title': 'one'}
+    assert two == {'title': 'two'}
+    assert len(urls) == 2
@@ -0,0 +1,49 @@
+from unittest.mock import patch
+
+# noinspection PyPackageRequirements
+from pytest import raises
+
+from lib.deadline import deadline, DeadlineExceeded
+from lib import ratelimit
+from lib.ratelimit import TokenBucket, limit_key, reserve, share_limits, \
+    throttle
+
+
+def test_token_bucket():
+    with patch('lib.ratelimit.monotonic', return_value=0):
+        bucket = TokenBucket(rate=2, capacity=2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == .5
+        assert bucket.reserve() == 1
+        # would need to wait 1.5 seconds, nothing is reserved
+        assert bucket.reserve(max_wait=1) is None
+    with patch('lib.ratelimit.monotonic', return_value=10):
+        assert bucket.reserve() == 0  # refilled
+
+
+def test_limit_key():
+    assert limit_key('eutils.ncbi.nlm.nih.gov') == 'eutils.ncbi.nlm.nih.gov'
+    assert limit_key('www.worldcat.org') == 'worldcat.org'
+    assert limit_key('notworldcat.org') is None
+    assert limit_key('books.google.co.uk') == 'books.google.'
+
+
+def test_throttle_respects_deadline():
+    with patch.dict('lib.ratelimit.RATE_LIMITS', {'example.org': (.01, 1)}):
+        throttle('https://example.org/a')
+        with deadline(1), raises(DeadlineExceeded):
+            throttle('https://example.org/b')
+
+
+def test_limits_are_shared_between_processes():
+    with patch.dict('lib.ratelimit.RATE_LIMITS', {'shared.org': (3, 4)}):
+        share_limits(3)
+        try:
+            reserve('https://shared.org/')
+            bucket = ratelimit._buckets['shared.org']
+            assert bucket.rate == 1
+            assert bucket.capacity == 4 / 3
+        finally:
+            share_limits(1)
+        assert 'shared.org' not in ratelimit._buckets
@@ -0,0 +1,30 @@
+from lib.resultcache import normalize_input, strip_tracking_params
+
+
+def test_strip_tracking_params():
+    assert strip_tracking_params(
+        'https://example.com/a?id=1&utm_source=x&fbclid=y'
+    ) == 'https://example.com/a?id=1'
+    assert strip_tracking_params(
+        'https://example.com/a?utm_medium=x') == 'https://example.com/a'
+    url = 'https://example.com/a?b=1&c=%20'
+    assert strip_tracking_params(url) is url
+
+
+def test_normalize_doi():
+    expected = ('doi', '10.1000/abc.def')
+    assert normalize_input('', '10.1000/ABC.def') == expected
+    assert normalize_input('', 'https://doi.org/10.1000/abc.DEF') == expected
+    assert normalize_input('', 'dx.doi.org/10.1000%2Fabc.def') == expected
+
+
+def test_normalize_isbn():
+    assert normalize_input('', '978-0-306-40615-7') == \
+        normalize_input('', '۹۷۸۰۳۰۶۴۰۶۱۵۷') == ('isbn', '9780306406157')
+
+
+def test_normalize_url():
+    assert normalize_input('', 'example.com/a?utm_source=x') == \
+        ('url', 'example.com/a')
+    # the letter case of paths is significant
+    assert normalize_input('', 'example.com/A') == ('url', 'example.com/A')
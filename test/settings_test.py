@@ -0,0 +1,29 @@
+from importlib import reload
+from os.path import dirname
+
+import config
+from lib import settings
+
+
+def test_missing_settings_get_the_defaults_of_the_example(monkeypatch):
+    example = {}
+    with open(dirname(dirname(__file__)) + '/config.py.example') as f:
+        exec(f.read(), example)
+    names = [name for name in vars(settings) if name.isupper()]
+    for name in names:
+        monkeypatch.delattr(config, name, raising=False)
+    try:
+        defaults = vars(reload(settings))
+        for name in names:
+            assert defaults[name] == example[name], name
+        # every setting of the example that is not in the original
+        # config.py has a default
+        original = {
+            'LANG', 'STATIC_PATH', 'USER_AGENT', 'SPOOFED_USER_AGENT',
+            'NCBI_EMAIL', 'NCBI_TOOL', 'NCBI_API_KEY'}
+        assert {
+            name for name in example if name.isupper()
+        } - original == {*names}
+    finally:
+        monkeypatch.undo()
+        reload(settings)
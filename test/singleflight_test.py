@@ -0,0 +1,100 @@
+from asyncio import gather, run, sleep
+from threading import Event, Thread
+
+# noinspection PyPackageRequirements
+from pytest import raises
+
+from lib.deadline import deadline, DeadlineExceeded
+from lib.singleflight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_calls_are_shared():
+    flights = SingleFlight()
+    started, release = Event(), Event()
+    calls = []
+
+    def slow(x):
+        calls.append(x)
+        started.set()
+        release.wait(5)
+        return x * 2
+
+    results = []
+    leader = Thread(target=lambda: results.append(flights.do('k', slow, 1)))
+    leader.start()
+    started.wait(5)
+    follower = Thread(target=lambda: results.append(flights.do('k', slow, 1)))
+    follower.start()
+    while flights.shared == 0:
+        pass
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == [2, 2]
+    assert calls == [1]
+    # the key is released after the call returns
+    assert flights.do('k', slow, 3) == 6
+
+
+def test_exception_is_shared():
+    flights = SingleFlight()
+    started, release = Event(), Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise ValueError
+
+    errors = []
+
+    def call():
+        try:
+            flights.do('k', fail)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [Thread(target=call), Thread(target=call)]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+    while flights.shared == 0:
+        pass
+    release.set()
+    for t in threads:
+        t.join()
+    assert len(errors) == 2
+
+
+def test_waiter_respects_deadline():
+    flights = SingleFlight()
+    started, release = Event(), Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+
+    leader = Thread(target=flights.do, args=('k', slow))
+    leader.start()
+    started.wait(5)
+    with deadline(.05), raises(DeadlineExceeded):
+        flights.do('k', slow)
+    release.set()
+    leader.join()
+
+
+def test_async_concurrent_calls_are_shared():
+    flights = AsyncSingleFlight()
+    calls = []
+
+    async def slow(x):
+        calls.append(x)
+        await sleep(.01)
+        return x * 2
+
+    async def main():
+        return await gather(
+            flights.do('k', slow, 1), flights.do('k', slow, 1))
+
+    assert run(main()) == [2, 2]
+    assert calls == [1]
+    assert flights.shared == 1
@@ -0,0 +1,27 @@
+from lib.executor import submit
+from lib.spans import collect, span, timed
+
+
+@timed('double')
+def double(x):
+    return x * 2
+
+
+def test_spans_are_summed_per_name():
+    with collect() as timings:
+        with span('parse'):
+            pass
+        assert double(1) == 2
+        # spans of lib.executor tasks belong to the submitting request
+        assert submit('test', double, 2).result(5) == 4
+    assert [*timings.durations] == ['parse', 'double', 'total']
+    assert timings.durations['double'][1] == 2
+    header = timings.header()
+    assert header.startswith('parse;dur=')
+    assert ', double;dur=' in header
+    assert ';desc="2 calls", total;dur=' in header
+
+
+def test_spans_outside_of_collect_are_ignored():
+    with span('ignored'):
+        assert double(3) == 6
@@ -1,13 +1,20 @@
+from asyncio import run
+from io import BytesIO
+from json import loads
+from threading import Event
 from urllib.parse import urlparse
 from unittest.mock import patch
 
+from lib.admission import Gate
+
 # noinspection PyPackageRequirements
 from pytest import raises
 
 
 from app import (
     url_doi_isbn_scr, TLDLESS_NETLOC_RESOLVER, googlebooks_scr,
-    noormags_scr, noorlib_scr, google_encrypted_scr
+    noormags_scr, noorlib_scr, google_encrypted_scr, app,
+    input_type_to_resolver, parse_batch_inputs, asgi_app, RESPONSE_HEADERS,
 )
 
 
@@ -70,3 +77,198 @@ def test_noorlib():
     an('www.noorlib.ir/View/fa/Book/BookView/Image/6120')
     an('www.noorlib.net/View/fa/Book/BookView/Image/6120')
     an('noorlib.ir/View/fa/Book/BookView/Image/6120')
+
+
+def test_parse_batch_inputs():
+    assert parse_batch_inputs(b'["a", " b ", ""]') == ['a', 'b']
+    assert parse_batch_inputs(b'a\r\n\nb\n') == ['a', 'b']
+    with raises(ValueError):
+        parse_batch_inputs(b'[1]')
+    with raises(ValueError):
+        parse_batch_inputs(b'\n')
+
+
+def batch_resolver(user_input, date_format):
+    if user_input == 'bad':
+        raise RuntimeError
+    return 'sfn ' + user_input, 'cite ' + date_format, 'ref'
+
+
+def batch_app(query_string):
+    body = b'["1", "bad", "3"]'
+    statuses = []
+    with patch.dict(input_type_to_resolver, {'pmid': batch_resolver}):
+        response = app({
+            'PATH_INFO': '/batch',
+            'REQUEST_METHOD': 'POST',
+            'QUERY_STRING': query_string,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': BytesIO(body),
+        }, lambda status, _: statuses.append(status))
+        response = [*response]
+    assert statuses == ['200 OK']
+    return response
+
+
+def test_batch():
+    response = batch_app('input_type=pmid&dateformat=%25Y')
+    results = loads(response[0])
+    assert [r['input'] for r in results] == ['1', 'bad', '3']
+    assert [r['status'] for r in results] == [200, 500, 200]
+    assert results[0]['shortened_footnote'] == 'sfn 1'
+    assert results[2]['citation_template'] == 'cite %Y'
+
+
+def test_batch_content_length_is_checked():
+    responses = []
+    for content_length in (None, '', 'x', '-1'):
+        environ = {
+            'PATH_INFO': '/batch', 'REQUEST_METHOD': 'POST',
+            'QUERY_STRING': '', 'wsgi.input': BytesIO(b'["1"]')}
+        if content_length is not None:
+            environ['CONTENT_LENGTH'] = content_length
+        app(environ, lambda status, _: responses.append(status))
+    assert responses == [
+        '411 Length Required', '411 Length Required', '400 Bad Request',
+        '400 Bad Request']
+
+
+def test_batch_ndjson():
+    lines = batch_app('input_type=pmid&output_format=ndjson')
+    assert all(line.endswith(b'\n') for line in lines)
+    results = sorted(map(loads, lines), key=lambda r: r['index'])
+    assert [r['index'] for r in results] == [0, 1, 2]
+    assert [r['status'] for r in results] == [200, 500, 200]
+    assert results[2]['shortened_footnote'] == 'sfn 3'
+
+
+def test_asgi_app_static_and_default_page():
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def get(path):
+        await asgi_app(
+            {'type': 'http', 'method': 'GET', 'path': path,
+             'query_string': b''}, None, send)
+
+    run(get('/static/en.css'))
+    run(get('/'))
+    assert [m['type'] for m in sent] == [
+        'http.response.start', 'http.response.body'] * 2
+    assert sent[0]['status'] == sent[2]['status'] == 200
+    headers = dict(sent[2]['headers'])
+    assert int(headers[b'content-length']) == len(sent[3]['body'])
+
+
+def test_default_page_headers_are_per_request():
+    responses = []
+    body = app({'PATH_INFO': '/', 'QUERY_STRING': ''},
+               lambda *a: responses.append(a))
+    [(status, headers)] = responses
+    assert status == '200 OK'
+    assert dict(headers)['Content-Length'] == str(len(body[0]))
+    assert 'Content-Length' not in RESPONSE_HEADERS
+
+
+def test_asgi_batch_ndjson_is_streamed():
+    release = Event()
+    log = []
+
+    def resolver(user_input, date_format):
+        if user_input == 'ndjson-slow':
+            release.wait(5)
+            log.append('slow resolved')
+        return batch_resolver(user_input, date_format)
+
+    async def receive():
+        return {
+            'type': 'http.request', 'body': b'["ndjson-fast", "ndjson-slow"]'}
+
+    async def send(message):
+        if message.get('body'):
+            log.append(loads(message['body'])['input'])
+            release.set()
+
+    with patch.dict(input_type_to_resolver, {'pmid': resolver}):
+        run(asgi_app({
+            'type': 'http', 'method': 'POST', 'path': '/batch',
+            'query_string': b'input_type=pmid&output_format=ndjson',
+        }, receive, send))
+    assert log == ['ndjson-fast', 'slow resolved', 'ndjson-slow']
+
+
+def test_overloaded_kind_is_shed():
+    responses = []
+    with patch.dict(input_type_to_resolver, {
+        'pmid': batch_resolver, 'pmcid': batch_resolver,
+    }), patch.dict('lib.admission._gates', {'pmid': Gate(0)}):
+        body = app({
+            'PATH_INFO': '/',
+            'QUERY_STRING': 'input_type=pmid&user_input=503&'
+                            'output_format=json',
+        }, lambda *args: responses.append(args))
+        assert app({
+            'PATH_INFO': '/',
+            'QUERY_STRING': 'input_type=pmcid&user_input=200&'
+                            'output_format=json',
+        }, lambda *args: responses.append(args))
+    (status, headers), (ok_status, _) = responses
+    assert status == '503 Service Unavailable'
+    assert ok_status == '200 OK'
+    assert ('Retry-After', '5') in headers
+    assert 'shortened_footnote' in loads(body[0])
+
+
+def test_metrics():
+    responses = []
+    body = app({'PATH_INFO': '/metrics'}, lambda *a: responses.append(a))
+    [(status, headers)] = responses
+    assert status == '200 OK'
+    assert dict(headers)['Content-Type'].startswith('text/plain')
+    assert b'# TYPE citer_errors_total counter\n' in body[0]
+
+
+def test_server_timing():
+    responses = []
+    with patch.dict(input_type_to_resolver, {'pmid': batch_resolver}):
+        app({
+            'PATH_INFO': '/',
+            'QUERY_STRING': 'input_type=pmid&user_input=server-timing',
+        }, lambda *a: responses.append(a))
+    [(status, headers)] = responses
+    server_timing = dict(headers)['Server-Timing']
+    assert 'render;dur=' in server_timing
+    assert 'total;dur=' in server_timing
+
+
+def test_profile_token(tmp_path):
+    responses = []
+    with patch.dict(input_type_to_resolver, {'pmid': batch_resolver}), \
+            patch('lib.profiling.PROFILE_TOKEN', 'secret'), \
+            patch('lib.profiling.PROFILE_DIR', str(tmp_path)):
+        for token in ('wrong', 'secret'):
+            app({
+                'PATH_INFO': '/',
+                'QUERY_STRING': 'input_type=pmid&user_input=1&profile='
+                                + token,
+            }, lambda *a: responses.append(dict(a[1])))
+    assert 'X-Profile-Id' not in responses[0]
+    profile_id = responses[1]['X-Profile-Id']
+    assert (tmp_path / (profile_id + '.pstats')).exists()
+
+
+def test_profiled_requests_are_admitted(tmp_path):
+    responses = []
+    with patch.dict(input_type_to_resolver, {'pmid': batch_resolver}), \
+            patch('lib.profiling.PROFILE_TOKEN', 'secret'), \
+            patch('lib.profiling.PROFILE_DIR', str(tmp_path)), \
+            patch.dict('lib.admission._gates', {'pmid': Gate(0)}):
+        app({
+            'PATH_INFO': '/',
+            'QUERY_STRING': 'input_type=pmid&user_input=1&profile=secret',
+        }, lambda *a: responses.append(a))
+    [(status, headers)] = responses
+    assert status == '503 Service Unavailable'
+    assert 'X-Profile-Id' not in dict(headers)
@@ -1,7 +1,15 @@
+from asyncio import run
+from threading import Thread
+from unittest.mock import patch
+
 # noinspection PyPackageRequirements
 from pytest import mark
 
-from lib.urls import urls_scr
+from lib.urls import (
+    urls_scr, meta_index, find_pages, find_title, get_html, head_has_metadata,
+    find_site_name, home_title, url2dict, url2dict_async, get_html_async,
+    HomeTitle, record_home_title_usage)
+from lib.cache import TTLCache
 
 
 def test_bostonglobe1():
@@ -946,3 +954,154 @@ def test_indaily():
         "| access-date=") in urls_scr(
         'https://indaily.com.au/news/2020/03/19/epidemics-expert-contradicts-marshalls-schools-advice/'
     )[1]
+
+
+def test_meta_index():
+    html = (
+        '<meta name="citation_firstpage" content="1">'
+        '<meta content=\'2"\' name="Citation_LastPage">'
+        '<meta data-x="y" property="og:title" content="T - Site">'
+        '<meta property="og:title" content="Second">'
+        '<meta name="citation_issue" content="">')
+    meta = meta_index(html)
+    assert 'citation_issue' not in meta
+    assert find_pages(meta) == '1–2"'
+    assert find_title(html, meta, None, 'http://site.com/t', None, None) == 'T'
+
+
+class ChunkedResponse:
+
+    status_code = 200
+    headers = {'content-type': 'text/html'}
+    encoding = 'utf-8'
+
+    def __init__(self, *chunks):
+        self.chunks = chunks
+        self.read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return
+
+    def iter_content(self, _):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+class AsyncChunkedResponse(ChunkedResponse):
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        return
+
+    async def iter_content(self, _):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+def test_get_html_head_only():
+    head = (
+        b'<html><head><meta property="og:title" content="T">'
+        b'<meta name="author" content="John Smith">'
+        b'<meta name="date" content="2020-01-02"></he')
+    r = ChunkedResponse(head, b'ad><body>', b'</body></html>')
+    with patch('lib.urls.request', return_value=r):
+        html = get_html('http://example.com/a', head_has_metadata)
+    assert r.read == 2
+    assert html.endswith('</head>')
+    r = ChunkedResponse(b'<html><head></head><body>', b'</body></html>')
+    with patch('lib.urls.request', return_value=r):
+        get_html('http://example.com/a', head_has_metadata)
+    assert r.read == 2
+    # the body may have a heading that find_title prefers to <title>
+    assert not head_has_metadata(
+        '<head><title>T</title><meta name="author" content="John Smith">'
+        '<meta name="date" content="2020-01-02"></head>')
+
+
+def test_get_html_async_head_only():
+    r = AsyncChunkedResponse(
+        b'<html><head><meta property="og:title" content="T">'
+        b'<meta name="author" content="John Smith">'
+        b'<meta name="date" content="2020-01-02"></head>',
+        b'<body>', b'</body></html>')
+    with patch('lib.urls.async_stream', return_value=r):
+        html = run(get_html_async('http://example.com/a', head_has_metadata))
+    assert r.read == 1
+    assert html.endswith('</head>')
+
+
+def test_get_html_head_only_multibyte_chunk_boundary():
+    head = (
+        '<html><head><meta charset="utf-8"><meta name="title" content="ت">'
+        '<meta name="author" content="John Smith">'
+        '<meta name="date" content="2020-01-02"></head><body>سلام'
+    ).encode()
+    # split the last character of the chunk
+    r = ChunkedResponse(head[:-1], head[-1:] + b'</body></html>')
+    with patch('lib.urls.request', return_value=r):
+        html = get_html('http://example.com/a', head_has_metadata)
+    assert r.read == 1
+    assert html.endswith('</head>')
+    r = AsyncChunkedResponse(head[:-1], head[-1:] + b'</body></html>')
+    with patch('lib.urls.async_stream', return_value=r):
+        html = run(get_html_async('http://example.com/a', head_has_metadata))
+    assert r.read == 1
+    assert html.endswith('</head>')
+
+
+def test_lazy_home_title():
+    url = 'http://example.com/a'
+    with patch('lib.urls.get_home_title', return_value='Home') as m:
+        provider = home_title(url)
+        assert find_site_name(
+            meta_index('<meta property="og:site_name" content="Ex">'),
+            'T', url, None, provider) == 'Ex'
+        assert find_site_name(
+            {}, 'T - Example', url, None, provider) == 'Example'
+        m.assert_not_called()
+        assert find_site_name({}, 'T', url, None, provider) == 'Home'
+        m.assert_called_once_with(url)
+
+
+def test_url2dict_async_fetches_the_needed_home_title():
+    url = 'http://example.net/a'
+    html = '<html><head><title>Title</title></head></html>'
+
+    async def get_html_async(*_):
+        return html
+
+    async def get_home_title_async(_):
+        return 'Example Home'
+
+    with patch('lib.urls.get_html', return_value=html), \
+            patch('lib.urls.get_home_title', return_value='Example Home'):
+        d = url2dict(url)
+    with patch('lib.urls.get_html_async', get_html_async), \
+            patch('lib.urls.get_home_title_async', get_home_title_async):
+        async_d = run(url2dict_async(url))
+    assert d['website'] == 'Example Home'
+    assert async_d == d
+
+
+def test_concurrent_home_title_usage_is_counted():
+    stats = TTLCache(maxsize=10, ttl=60)
+    provider = HomeTitle('http://example.com/a', fetch=False)
+
+    def record():
+        for _ in range(500):
+            record_home_title_usage(provider)
+
+    with patch('lib.urls.HOME_TITLE_STATS', stats):
+        threads = [Thread(target=record) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert stats.get('example.com') == (0, 4000)